@@ -71,6 +71,126 @@ DATABASES = {
     }
 }
 
+# Perfil de la base de datos (ver core/sqlite.py):
+# 'desarrollo' usa SQLite por defecto; 'produccion' activa WAL y los PRAGMAS de
+# SQLITE_PRAGMAS_PRODUCCION, conexiones persistentes y una conexión de solo
+# lectura ('lectura') para las peticiones GET de dashboards y APIs.
+DB_PERFIL = os.environ.get('DB_PERFIL', 'desarrollo')
+
+SQLITE_PRAGMAS_PRODUCCION = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # Negativo: tamaño en KiB en lugar de páginas
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_KB', 64 * 1024)),
+    'temp_store': 'memory',
+}
+SQLITE_PRAGMAS = {}
+
+if DB_PERFIL == 'produccion':
+    SQLITE_PRAGMAS = SQLITE_PRAGMAS_PRODUCCION
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        # Segundos que una escritura espera a que se libere el bloqueo
+        'OPTIONS': {'timeout': 20},
+    })
+    DATABASES['lectura'] = {
+        **DATABASES['default'],
+        'NAME': f"file:{DATABASES['default']['NAME']}?mode=ro",
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['core.sqlite.RouterLectura']
+    MIDDLEWARE.append('core.sqlite.lectura_middleware')
+
+
+# Caché de respuestas de la API (ver core/cache_api.py)
+# API_CACHE_BACKEND: 'locmem' (memoria de cada proceso) o 'archivo' (compartida entre procesos)
+# Las entradas se invalidan al incrementar la versión de datos en cada carga.
+# API_CACHE_VERSION_TTL: segundos que cada proceso reutiliza la versión leída (con locmem, lo que tarda
+# en ver una carga hecha en otro proceso; 0 la lee de la BD en cada petición)
+
+API_CACHE_ALIAS = 'api'
+API_CACHE_BACKEND = os.environ.get('API_CACHE_BACKEND', 'locmem')
+API_CACHE_VERSION_TTL = int(os.environ.get('API_CACHE_VERSION_TTL', 30))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    API_CACHE_ALIAS: {
+        'BACKEND': (
+            'django.core.cache.backends.filebased.FileBasedCache'
+            if API_CACHE_BACKEND == 'archivo'
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': (
+            os.environ.get('API_CACHE_LOCATION', str(BASE_DIR / 'cache_api'))
+            if API_CACHE_BACKEND == 'archivo'
+            else 'zoonosight-api'
+        ),
+        'TIMEOUT': int(os.environ.get('API_CACHE_TIMEOUT', 60 * 60 * 24)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('API_CACHE_MAX_ENTRIES', 1000)),
+            'CULL_FREQUENCY': int(os.environ.get('API_CACHE_CULL_FREQUENCY', 3)),
+        },
+    },
+}
+
+
+# Máximo de subconsultas aceptadas por /api/lote/
+
+API_LOTE_MAX_CONSULTAS = int(os.environ.get('API_LOTE_MAX_CONSULTAS', 20))
+
+
+# Vistas async de la API para desplegar con ASGI (ver core/vistas_async.py)
+
+API_ASYNC = os.environ.get('API_ASYNC', '0') == '1'
+# Hilos para ejecutar a la vez las consultas de las vistas async
+API_ASYNC_MAX_HILOS = int(os.environ.get('API_ASYNC_MAX_HILOS', 8))
+
+
+# Trabajos en segundo plano (reportes y exportaciones, ver core/trabajos.py)
+
+TRABAJOS_MAX_WORKERS = int(os.environ.get('TRABAJOS_MAX_WORKERS', 2))
+# Segundos tras los que un trabajo pendiente o en proceso se da por fallido
+TRABAJOS_TIMEOUT = int(os.environ.get('TRABAJOS_TIMEOUT', 60 * 60))
+# Procesos para dibujar en paralelo los gráficos de los reportes PDF (1 = en el mismo hilo)
+PDF_PROCESOS_GRAFICOS = int(os.environ.get('PDF_PROCESOS_GRAFICOS', min(4, os.cpu_count() or 1)))
+
+
+# Lotes semanales de notificaciones subidos por las DIRESA (ver core/cargas.py)
+
+CARGA_SEMANAL_MAX_FILAS = int(os.environ.get('CARGA_SEMANAL_MAX_FILAS', 50000))
+
+
+# Snapshot columnar de casos (ver core/columnar.py), regenerado en cada carga
+
+SNAPSHOT_COLUMNAR_DIR = os.environ.get('SNAPSHOT_COLUMNAR_DIR', str(BASE_DIR / 'snapshot_columnar'))
+
+
+# Mapa base del dashboard de mapas. Leaflet se sirve desde static/vendor/leaflet; las teselas
+# pueden apuntar a un servidor propio y, si se deja vacío, el mapa solo dibuja los límites locales
+
+MAPA_TILES_URL = os.environ.get('MAPA_TILES_URL', 'https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png')
+MAPA_TILES_ATRIBUCION = os.environ.get('MAPA_TILES_ATRIBUCION', '© OpenStreetMap contributors')
+
+
+# Métricas por petición, cabecera Server-Timing y endpoint /metrics (ver core/metricas.py)
+
+METRICAS = os.environ.get('METRICAS', '1') == '1'
+# Umbrales para registrar en el log peticiones y consultas SQL lentas
+METRICAS_PETICION_LENTA_MS = int(os.environ.get('METRICAS_PETICION_LENTA_MS', 1000))
+METRICAS_CONSULTA_LENTA_MS = int(os.environ.get('METRICAS_CONSULTA_LENTA_MS', 200))
+# Si se define, /metrics exige 'Authorization: Bearer <token>'
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+# Sin token, /metrics no se publica (por defecto en el perfil de producción)
+METRICAS_EXIGE_TOKEN = os.environ.get('METRICAS_EXIGE_TOKEN', '1' if DB_PERFIL == 'produccion' else '0') == '1'
+
+if METRICAS:
+    # Primero, para que la medición incluya a los demás middlewares
+    MIDDLEWARE.insert(0, 'core.metricas.metricas_middleware')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from core import views
+from core import metricas, views, vistas_async
+
+# Con API_ASYNC las APIs de consulta usan sus versiones async (despliegue ASGI)
+api = vistas_async if settings.API_ASYNC else views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -9,8 +13,21 @@ urlpatterns = [
     path('dashboard/mapas/', views.dashboard_mapas, name='dashboard_mapas'),
     path('dashboard/patrones/', views.dashboard_patrones, name='dashboard_patrones'),
     path('dashboard/reportes/', views.dashboard_reportes, name='dashboard_reportes'),
-    path('api/tendencias/', views.api_tendencias, name='api_tendencias'),
-    path('api/mapa-calor/', views.api_mapa_calor, name='api_mapa_calor'),
-    path('api/patrones-estacionales/', views.api_patrones_estacionales, name='api_patrones_estacionales'),
-    path('api/generar-reporte/', views.api_generar_reporte, name='api_generar_reporte'),
+    path('api/tendencias/', api.api_tendencias, name='api_tendencias'),
+    path('api/mapa-calor/', api.api_mapa_calor, name='api_mapa_calor'),
+    path('api/mapa-detalle/', api.api_mapa_detalle, name='api_mapa_detalle'),
+    path('api/geometrias/', api.api_geometrias, name='api_geometrias'),
+    path('api/canal-endemico/', api.api_canal_endemico, name='api_canal_endemico'),
+    path('api/alertas/', api.api_alertas, name='api_alertas'),
+    path('api/demografia/', api.api_demografia, name='api_demografia'),
+    path('api/consulta/', api.api_consulta, name='api_consulta'),
+    path('api/lote/', api.api_lote, name='api_lote'),
+    path('api/patrones-estacionales/', api.api_patrones_estacionales, name='api_patrones_estacionales'),
+    path('api/generar-reporte/', api.api_generar_reporte, name='api_generar_reporte'),
+    path('api/exportar/<str:conjunto>/', views.api_exportar, name='api_exportar'),
+    path('api/trabajos/', views.api_trabajos, name='api_trabajos'),
+    path('api/trabajos/<int:trabajo_id>/', views.api_estado_trabajo, name='api_estado_trabajo'),
+    path('api/trabajos/<int:trabajo_id>/descargar/', views.api_descargar_trabajo, name='api_descargar_trabajo'),
+    path('api/cargas/semanal/', views.api_cargar_semana, name='api_cargar_semana'),
+    path('metrics', metricas.vista_metricas, name='metricas'),
 ]
\ No newline at end of file
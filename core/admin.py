@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Departamento, Provincia, Distrito, TipoZoonosis, Paciente, Caso
+from .models import Departamento, Provincia, Distrito, TipoZoonosis, Paciente, Caso, CargaSemanal
 
 @admin.register(Departamento)
 class DepartamentoAdmin(admin.ModelAdmin):
@@ -30,7 +30,13 @@ class PacienteAdmin(admin.ModelAdmin):
 
 @admin.register(Caso)
 class CasoAdmin(admin.ModelAdmin):
-    list_display = ['id', 'zoonosis', 'distrito', 'anio', 'semana_epidemiologica', 'tipo_diagnostico']
-    list_filter = ['anio', 'zoonosis', 'tipo_diagnostico']
+    list_display = ['id', 'zoonosis', 'distrito', 'anio', 'semana_epidemiologica', 'tipo_diagnostico', 'sexo', 'grupo_etario']
+    list_filter = ['anio', 'zoonosis', 'departamento', 'tipo_diagnostico', 'sexo', 'grupo_etario']
     search_fields = ['distrito__nombre']
-    date_hierarchy = 'fecha_notificacion'
\ No newline at end of file
+    date_hierarchy = 'fecha_notificacion'
+
+@admin.register(CargaSemanal)
+class CargaSemanalAdmin(admin.ModelAdmin):
+    list_display = ['nombre_archivo', 'usuario', 'casos', 'fecha_carga']
+    search_fields = ['nombre_archivo', 'huella']
+    readonly_fields = ['huella', 'nombre_archivo', 'usuario', 'casos', 'semanas', 'fecha_carga']
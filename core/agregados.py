@@ -0,0 +1,274 @@
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from .models import (
+    Caso, CuboCasos, TipoZoonosis, Departamento, MetadatosDashboard, Poblacion, IncidenciaAnual, CanalEndemico,
+)
+from .cache_api import cache, incrementar_version, obtener_version
+from .columnar import generar_snapshot
+from .canal_endemico import calcular_canales
+from .deteccion import detectar_brotes
+
+
+def filtro_particiones(particiones):
+    """Filtro de las filas de las particiones [(zoonosis_id, anio), ...] en tablas con esos campos"""
+    anios_por_zoonosis = {}
+    for zoonosis_id, anio in particiones:
+        anios_por_zoonosis.setdefault(zoonosis_id, set()).add(anio)
+    filtro = Q(pk__in=[])
+    for zoonosis_id, anios in anios_por_zoonosis.items():
+        filtro |= Q(zoonosis_id=zoonosis_id, anio__in=sorted(anios))
+    return filtro
+
+
+def reconstruir_cubo(batch_size=5000, particiones=None):
+    """Reconstruye la tabla cubo_casos a partir de la tabla de casos
+
+    Con particiones [(zoonosis_id, anio), ...] solo se recalculan las celdas
+    de esas zoonosis y años.
+    """
+    casos = Caso.objects.all()
+    cubo = CuboCasos.objects.all()
+    if particiones is not None:
+        casos = casos.filter(filtro_particiones(particiones))
+        cubo = cubo.filter(filtro_particiones(particiones))
+    celdas = casos.values(
+        'zoonosis_id',
+        'distrito_id',
+        'provincia_id',
+        'departamento_id',
+        'anio',
+        'semana_epidemiologica',
+        'tipo_diagnostico',
+    ).annotate(total=Count('id')).order_by()
+    
+    creadas = 0
+    with transaction.atomic():
+        cubo.delete()
+        
+        lote = []
+        for celda in celdas.iterator(chunk_size=batch_size):
+            lote.append(CuboCasos(
+                zoonosis_id=celda['zoonosis_id'],
+                departamento_id=celda['departamento_id'],
+                provincia_id=celda['provincia_id'],
+                distrito_id=celda['distrito_id'],
+                anio=celda['anio'],
+                semana_epidemiologica=celda['semana_epidemiologica'],
+                tipo_diagnostico=celda['tipo_diagnostico'],
+                total=celda['total'],
+            ))
+            if len(lote) >= batch_size:
+                CuboCasos.objects.bulk_create(lote)
+                creadas += len(lote)
+                lote = []
+        if lote:
+            CuboCasos.objects.bulk_create(lote)
+            creadas += len(lote)
+    
+    return creadas
+
+
+# Campos del cubo usados para agrupar en cada nivel: (código, nombre, código del padre)
+NIVELES_INCIDENCIA = {
+    'nacional': None,
+    'departamento': ('departamento__codigo_ubigeo', 'departamento__nombre', None),
+    'provincia': ('provincia__codigo_ubigeo', 'provincia__nombre', 'departamento__codigo_ubigeo'),
+    'distrito': ('distrito__codigo_ubigeo', 'distrito__nombre', 'provincia__codigo_ubigeo'),
+}
+
+CODIGO_NACIONAL = '000000'
+
+
+def tasa_100k(casos, poblacion):
+    """Casos por 100 000 habitantes (None si no se conoce la población)"""
+    if not poblacion:
+        return None
+    return round(casos * 100000 / poblacion, 2)
+
+
+def reconstruir_incidencia(batch_size=5000, particiones=None):
+    """Reconstruye la tabla incidencia_anual (casos y tasas) a partir del cubo y la población
+
+    Con particiones [(zoonosis_id, anio), ...] solo se recalculan esas zoonosis y años.
+    """
+    cubo = CuboCasos.objects.all()
+    incidencia = IncidenciaAnual.objects.all()
+    if particiones is not None:
+        cubo = cubo.filter(filtro_particiones(particiones))
+        incidencia = incidencia.filter(filtro_particiones(particiones))
+    poblaciones = {
+        (nivel, codigo, anio): poblacion
+        for nivel, codigo, anio, poblacion in Poblacion.objects.values_list('nivel', 'codigo_ubigeo', 'anio', 'poblacion')
+    }
+    poblacion_nacional = {}
+    for (nivel, _, anio), poblacion in poblaciones.items():
+        if nivel == 'departamento':
+            poblacion_nacional[anio] = poblacion_nacional.get(anio, 0) + poblacion
+    for anio, poblacion in poblacion_nacional.items():
+        poblaciones[('nacional', CODIGO_NACIONAL, anio)] = poblacion
+    
+    creadas = 0
+    with transaction.atomic():
+        incidencia.delete()
+        
+        for nivel, campos in NIVELES_INCIDENCIA.items():
+            if campos is None:
+                filas = cubo.values('zoonosis_id', 'anio')
+            else:
+                campo_codigo, campo_nombre, campo_padre = campos
+                filas = cubo.values(
+                    'zoonosis_id', 'anio', campo_codigo, campo_nombre, *([campo_padre] if campo_padre else [])
+                )
+            filas = filas.annotate(casos=Sum('total')).order_by()
+            
+            lote = []
+            for fila in filas.iterator(chunk_size=batch_size):
+                if campos is None:
+                    codigo, nombre, padre = CODIGO_NACIONAL, 'NACIONAL', ''
+                else:
+                    codigo = fila[campo_codigo]
+                    nombre = fila[campo_nombre]
+                    padre = fila[campo_padre] if campo_padre else ''
+                poblacion = poblaciones.get((nivel, codigo, fila['anio']))
+                lote.append(IncidenciaAnual(
+                    zoonosis_id=fila['zoonosis_id'],
+                    nivel=nivel,
+                    codigo_ubigeo=codigo,
+                    nombre=nombre,
+                    codigo_padre=padre,
+                    anio=fila['anio'],
+                    casos=fila['casos'],
+                    poblacion=poblacion,
+                    tasa_100k=tasa_100k(fila['casos'], poblacion),
+                ))
+                if len(lote) >= batch_size:
+                    IncidenciaAnual.objects.bulk_create(lote)
+                    creadas += len(lote)
+                    lote = []
+            if lote:
+                IncidenciaAnual.objects.bulk_create(lote)
+                creadas += len(lote)
+    
+    return creadas
+
+
+def refrescar_metadatos():
+    """Guarda la instantánea de años, zoonosis y departamentos usada por los dashboards"""
+    casos_por_zoonosis = dict(
+        CuboCasos.objects.values('zoonosis_id').annotate(total=Sum('total')).values_list('zoonosis_id', 'total')
+    )
+    datos = {
+        'anos': list(CuboCasos.objects.values_list('anio', flat=True).distinct().order_by('anio')),
+        'zoonosis': [
+            {'id': pk, 'nombre': nombre, 'total_casos': casos_por_zoonosis.get(pk, 0)}
+            for pk, nombre in TipoZoonosis.objects.order_by('nombre').values_list('id', 'nombre')
+        ],
+        'departamentos': [
+            {'id': pk, 'nombre': nombre, 'codigo_ubigeo': codigo}
+            for pk, nombre, codigo in Departamento.objects.order_by('nombre').values_list('id', 'nombre', 'codigo_ubigeo')
+        ],
+    }
+    MetadatosDashboard.objects.update_or_create(pk=1, defaults={'datos': datos})
+    return datos
+
+
+def obtener_metadatos():
+    """Instantánea de metadatos para las vistas de página (cacheada por versión de datos)"""
+    clave = f'zoonosight:metadatos:v{obtener_version()}'
+    datos = cache().get(clave)
+    if datos is None:
+        snapshot = MetadatosDashboard.objects.filter(pk=1).values_list('datos', flat=True).first()
+        datos = snapshot if snapshot is not None else refrescar_metadatos()
+        cache().set(clave, datos)
+    return datos
+
+
+def sumar_al_cubo(celdas):
+    """Suma casos nuevos a las celdas del cubo sin recalcularlo
+
+    celdas: {(zoonosis_id, distrito_id, provincia_id, departamento_id, anio,
+    semana_epidemiologica, tipo_diagnostico): casos}. Cada celda existente se
+    incrementa en la base (total = total + casos), sin leerla antes, y las
+    que faltan se crean. Devuelve el número de celdas actualizadas o creadas.
+    """
+    nuevas = []
+    with transaction.atomic():
+        for clave, casos in celdas.items():
+            zoonosis_id, distrito_id, provincia_id, departamento_id, anio, semana, tipo_diagnostico = clave
+            actualizadas = CuboCasos.objects.filter(
+                zoonosis_id=zoonosis_id,
+                distrito_id=distrito_id,
+                anio=anio,
+                semana_epidemiologica=semana,
+                tipo_diagnostico=tipo_diagnostico,
+            ).update(total=F('total') + casos)
+            if actualizadas:
+                continue
+            nuevas.append(CuboCasos(
+                zoonosis_id=zoonosis_id,
+                departamento_id=departamento_id,
+                provincia_id=provincia_id,
+                distrito_id=distrito_id,
+                anio=anio,
+                semana_epidemiologica=semana,
+                tipo_diagnostico=tipo_diagnostico,
+                total=casos,
+            ))
+        
+        CuboCasos.objects.bulk_create(nuevas, batch_size=5000)
+    
+    return len(celdas)
+
+
+def actualizar_derivados(particiones=None, semanas=None):
+    """Recalcula lo que depende del cubo y la incidencia e invalida la caché de la API
+
+    Con particiones [(zoonosis_id, anio), ...], o semanas [(zoonosis_id, anio,
+    semana), ...] en los lotes semanales, el snapshot columnar, el canal
+    endémico y la detección de brotes solo se actualizan en esas zoonosis,
+    años o semanas, y solo se invalidan las respuestas de esas zoonosis (y las
+    que no se limitan a ninguna). Sin particiones se recalcula toda la
+    historia y se invalida toda la caché.
+    """
+    if semanas is not None:
+        particiones = {(zoonosis_id, anio) for zoonosis_id, anio, _ in semanas}
+    anio_canal = CanalEndemico.objects.aggregate(anio=Max('anio'))['anio']
+    anteriores = MetadatosDashboard.objects.filter(pk=1).values_list('datos', flat=True).first() or {}
+    resultado = {}
+    metadatos = refrescar_metadatos()
+    resultado['anos_disponibles'] = len(metadatos['anos'])
+    resultado['filas_snapshot_columnar'] = generar_snapshot(particiones=particiones, semanas=semanas)
+    # Si la carga cambió los años con datos, cambian los años de base del canal de todas las zoonosis
+    completo = (
+        particiones is None or not metadatos['anos'] or metadatos['anos'][-1] != anio_canal
+        or metadatos['anos'] != anteriores.get('anos')
+    )
+    if completo:
+        resultado['filas_canal_endemico'] = calcular_canales()
+    elif semanas is not None:
+        resultado['filas_canal_endemico'] = calcular_canales(semanas=semanas)
+    else:
+        resultado['filas_canal_endemico'] = calcular_canales(zoonosis_ids={z for z, _ in particiones})
+    resultado['alertas_nuevas'] = detectar_brotes(
+        reiniciar=particiones is None,
+        particiones=particiones if semanas is None else None,
+        semanas=semanas,
+    )['alertas']
+    # Invalida las respuestas cacheadas de la API
+    resultado['version_datos'] = incrementar_version(None if completo else {z for z, _ in particiones})
+    return resultado
+
+
+def actualizar_agregados(particiones=None):
+    """Recalcula las tablas derivadas después de una carga de datos
+
+    Con particiones [(zoonosis_id, anio), ...] (las que cambiaron en una
+    recarga) el cubo, la incidencia y el canal endémico solo se recalculan
+    para esas zoonosis y años.
+    """
+    resultado = {
+        'celdas_cubo': reconstruir_cubo(particiones=particiones),
+    }
+    resultado['filas_incidencia'] = reconstruir_incidencia(particiones=particiones)
+    resultado.update(actualizar_derivados(particiones))
+    return resultado
@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Registra los PRAGMAS de las conexiones SQLite (perfil de producción)
+        from . import sqlite  # noqa: F401
+        # Instala la medición de consultas SQL en cada conexión
+        from . import metricas  # noqa: F401
+        # Reanuda con la primera petición los trabajos que quedaron sin terminar
+        from django.core.signals import request_started
+        from .trabajos import reanudar_al_iniciar
+        request_started.connect(reanudar_al_iniciar, dispatch_uid='reanudar_trabajos')
+        
+        # Mapear en memoria el snapshot columnar al iniciar (si existe)
+        from .columnar import obtener_snapshot
+        try:
+            obtener_snapshot()
+        except (OSError, ValueError):
+            pass
@@ -0,0 +1,212 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from .models import VersionDatos
+
+CLAVE_VERSION = 'zoonosight:estado_version'
+
+# Parámetros GET con los que una vista limita su respuesta a ciertas zoonosis
+PARAMETROS_ZOONOSIS = ('zoonosis_id', 'zoonosis_ids[]')
+
+
+def cache():
+    """Backend de caché usado para las respuestas de la API"""
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def obtener_estado_version():
+    """Versión actual de los datos, versiones base y por zoonosis, y fecha de la última carga
+
+    Se lee de la caché y, si no está (o expiró), de la base de datos. Con una
+    caché propia de cada proceso (locmem), una carga hecha en otro proceso se
+    ve aquí recién cuando expira la copia, hasta API_CACHE_VERSION_TTL segundos
+    después; mientras tanto se sirven las respuestas (y los 304) anteriores.
+    """
+    estado = cache().get(CLAVE_VERSION)
+    if estado is None:
+        fila = VersionDatos.objects.filter(pk=1).values(
+            'version', 'version_base', 'versiones_zoonosis', 'fecha_actualizacion'
+        ).first()
+        estado = _estado(fila)
+        cache().set(CLAVE_VERSION, estado, settings.API_CACHE_VERSION_TTL)
+    return estado
+
+
+def _estado(fila):
+    return {
+        'version': fila['version'] if fila else 0,
+        'base': fila['version_base'] if fila else 0,
+        'zoonosis': fila['versiones_zoonosis'] if fila else {},
+        'fecha': fila['fecha_actualizacion'] if fila else None,
+    }
+
+
+def obtener_version():
+    """Versión actual de los datos"""
+    return obtener_estado_version()['version']
+
+
+def incrementar_version(zoonosis_ids=None):
+    """Incrementa la versión de los datos e invalida las respuestas cacheadas
+
+    Con zoonosis_ids solo se invalidan las respuestas limitadas a esas zoonosis
+    y las que no se limitan a ninguna (ver version_peticion).
+    """
+    with transaction.atomic():
+        VersionDatos.objects.get_or_create(pk=1)
+        VersionDatos.objects.filter(pk=1).update(version=F('version') + 1, fecha_actualizacion=timezone.now())
+        fila = VersionDatos.objects.values(
+            'version', 'version_base', 'versiones_zoonosis', 'fecha_actualizacion'
+        ).get(pk=1)
+        if zoonosis_ids is None:
+            fila['version_base'] = fila['version']
+        else:
+            fila['versiones_zoonosis'].update({str(zoonosis_id): fila['version'] for zoonosis_id in zoonosis_ids})
+        VersionDatos.objects.filter(pk=1).update(
+            version_base=fila['version_base'], versiones_zoonosis=fila['versiones_zoonosis']
+        )
+    estado = _estado(fila)
+    cache().set(CLAVE_VERSION, estado, settings.API_CACHE_VERSION_TTL)
+    return estado['version']
+
+
+def zoonosis_peticion(querydict):
+    """Ids de las zoonosis a las que se limita una petición (None si no se limita a ninguna)"""
+    valores = [valor for parametro in PARAMETROS_ZOONOSIS for valor in querydict.getlist(parametro)]
+    if not valores or not all(valor.isdigit() for valor in valores):
+        return None
+    return {int(valor) for valor in valores}
+
+
+def version_peticion(querydict, estado=None):
+    """Versión de los datos de los que depende una petición
+
+    Una petición limitada a ciertas zoonosis solo cambia con la última carga
+    de esas zoonosis o la última invalidación completa; las demás, con
+    cualquier carga.
+    """
+    if estado is None:
+        estado = obtener_estado_version()
+    zoonosis_ids = zoonosis_peticion(querydict)
+    if zoonosis_ids is None:
+        return estado['version']
+    return max([estado['base']] + [estado['zoonosis'].get(str(zoonosis_id), 0) for zoonosis_id in zoonosis_ids])
+
+
+def parametros_normalizados(querydict):
+    """Parámetros GET ordenados por nombre
+
+    Los valores de un parámetro repetido (p. ej. zoonosis_ids[]) conservan su
+    orden: define el orden de los datasets, colores y columnas de la respuesta.
+    """
+    return urlencode(
+        sorted(querydict.lists(), key=lambda parametro: parametro[0]),
+        doseq=True
+    )
+
+
+def huella_parametros(querydict):
+    """Hash de los parámetros normalizados"""
+    return hashlib.sha1(parametros_normalizados(querydict).encode()).hexdigest()
+
+
+def clave_respuesta(nombre_vista, querydict, version=None):
+    """Clave de caché para una vista, sus parámetros y la versión de los datos de los que depende"""
+    if version is None:
+        version = version_peticion(querydict)
+    return f'zoonosight:api:{nombre_vista}:v{version}:{huella_parametros(querydict)}'
+
+
+def sin_cache(respuesta):
+    """La respuesta no debe guardarse (Cache-Control: no-store)"""
+    return 'no-store' in respuesta.get('Cache-Control', '')
+
+
+def cache_api(vista):
+    """Decorador que cachea las respuestas exitosas de una vista GET de la API"""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if request.method != 'GET':
+            return vista(request, *args, **kwargs)
+        
+        clave = clave_respuesta(vista.__name__, request.GET)
+        guardada = cache().get(clave)
+        if guardada is not None:
+            contenido, content_type = guardada
+            respuesta = HttpResponse(contenido, content_type=content_type)
+            respuesta['X-Cache'] = 'HIT'
+            return respuesta
+        
+        respuesta = vista(request, *args, **kwargs)
+        if respuesta.status_code == 200 and not respuesta.streaming and not sin_cache(respuesta):
+            cache().set(clave, (respuesta.content, respuesta['Content-Type']))
+            respuesta['X-Cache'] = 'MISS'
+        return respuesta
+    
+    return envoltura
+
+
+def cache_control_versionadas(**opciones):
+    """Como cache_control de Django, pero solo para las respuestas 200 pedidas con versión (parámetro v)
+
+    Sin versión en la URL el navegador no sabría cuándo cambian los datos, por
+    eso esas respuestas se revalidan en cada uso. Los errores no se guardan.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            respuesta = vista(request, *args, **kwargs)
+            if respuesta.status_code == 200:
+                if request.GET.get('v'):
+                    patch_cache_control(respuesta, **opciones)
+                else:
+                    patch_cache_control(respuesta, no_cache=True)
+            return respuesta
+        
+        return envoltura
+    
+    return decorador
+
+
+def respuesta_condicional(vista):
+    """Decorador que añade ETag y Last-Modified según la versión de datos y los parámetros
+
+    Las peticiones con If-None-Match (o If-Modified-Since) vigente reciben un
+    304 sin ejecutar la vista ni consultar la base de datos. Solo las
+    respuestas 200 (y los 304) llevan los validadores, para que un error nunca
+    se revalide. La versión es la de obtener_estado_version, con su mismo
+    margen de API_CACHE_VERSION_TTL segundos entre procesos.
+    """
+    nombre_vista = vista.__name__
+    
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            estado = obtener_estado_version()
+            version = version_peticion(request.GET, estado)
+            etag = quote_etag(f"{nombre_vista}-v{version}-{huella_parametros(request.GET)[:20]}")
+            ultima_modificacion = int(estado['fecha'].timestamp()) if estado['fecha'] else None
+            
+            respuesta = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+            if respuesta is None:
+                respuesta = vista(request, *args, **kwargs)
+            if respuesta.status_code in (200, 304):
+                respuesta.headers.setdefault('ETag', etag)
+                if ultima_modificacion:
+                    respuesta.headers.setdefault('Last-Modified', http_date(ultima_modificacion))
+        else:
+            respuesta = vista(request, *args, **kwargs)
+        
+        # El navegador puede guardar la respuesta, pero debe revalidarla
+        patch_cache_control(respuesta, no_cache=True)
+        return respuesta
+    
+    return envoltura
@@ -0,0 +1,198 @@
+import warnings
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from .models import CuboCasos, CanalEndemico
+from .epidemiologia import semanas_en_anio
+
+# Campo del cubo con el código de la unidad geográfica de cada nivel
+CAMPOS_NIVEL = {
+    'nacional': None,
+    'departamento': 'departamento__codigo_ubigeo',
+    'provincia': 'provincia__codigo_ubigeo',
+    'distrito': 'distrito__codigo_ubigeo',
+}
+
+CODIGO_NACIONAL = '000000'
+ANIOS_BASE_MINIMO = 5
+
+
+def series_semanales(nivel, primer_anio, ultimo_anio, zoonosis_ids=None, semanas=None):
+    """Casos por serie (zoonosis, ubigeo), año y semana como arreglo denso
+
+    Devuelve (series, arreglo) donde arreglo tiene forma
+    (n_series, n_anios, 53). Las semanas 53 de años con 52 semanas quedan
+    en NaN. Con zoonosis_ids solo se incluyen esas zoonosis, y con semanas
+    solo esas semanas (las demás quedan en cero).
+    """
+    campo = CAMPOS_NIVEL[nivel]
+    campos = ['zoonosis_id', 'anio', 'semana_epidemiologica'] + ([campo] if campo else [])
+    cubo = CuboCasos.objects.filter(anio__gte=primer_anio, anio__lte=ultimo_anio)
+    if zoonosis_ids is not None:
+        cubo = cubo.filter(zoonosis_id__in=zoonosis_ids)
+    if semanas is not None:
+        cubo = cubo.filter(semana_epidemiologica__in=semanas)
+    filas = cubo.values(*campos).annotate(casos=Sum('total')).order_by().values_list(*campos, 'casos')
+    
+    df = pd.DataFrame.from_records(list(filas), columns=campos + ['casos'])
+    if campo is None:
+        df['codigo'] = CODIGO_NACIONAL
+    else:
+        df = df.rename(columns={campo: 'codigo'})
+    
+    n_anios = ultimo_anio - primer_anio + 1
+    if df.empty:
+        return [], np.zeros((0, n_anios, 53))
+    
+    indice_serie = df.groupby(['zoonosis_id', 'codigo'], sort=True).ngroup().to_numpy()
+    series = list(df.groupby(['zoonosis_id', 'codigo'], sort=True).size().index)
+    
+    arreglo = np.zeros((len(series), n_anios, 53))
+    semanas = df['semana_epidemiologica'].clip(1, 53).to_numpy() - 1
+    np.add.at(arreglo, (indice_serie, df['anio'].to_numpy() - primer_anio, semanas), df['casos'].to_numpy())
+    
+    for posicion, anio in enumerate(range(primer_anio, ultimo_anio + 1)):
+        if semanas_en_anio(anio) < 53:
+            arreglo[:, posicion, 52] = np.nan
+    return series, arreglo
+
+
+def bandas(base):
+    """Cuartiles, media y media + 2 DE sobre el eje de años de base (n_series, n_anios, semanas)"""
+    with warnings.catch_warnings():
+        # Semanas sin ningún año de base (p. ej. la 53) quedan en NaN
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        percentil_25, mediana, percentil_75 = np.nanpercentile(base, [25, 50, 75], axis=1)
+        media = np.nanmean(base, axis=1)
+        desviacion = np.nanstd(base, axis=1, ddof=1)
+    return {
+        'percentil_25': percentil_25,
+        'mediana': mediana,
+        'percentil_75': percentil_75,
+        'media': media,
+        'limite_superior': media + 2 * desviacion,
+    }
+
+
+def calcular_canales(anio=None, anios_base=7, batch_size=5000, zoonosis_ids=None, semanas=None):
+    """Calcula y guarda el canal endémico de todas las series de todos los niveles para un año
+
+    Con zoonosis_ids solo se recalculan las series de esas zoonosis. Con
+    semanas [(zoonosis_id, anio, semana), ...] (las de un lote semanal) solo
+    se recalculan esas semanas de las series con casos en ellas; una zoonosis
+    con series nuevas se recalcula completa. Devuelve el número de filas
+    guardadas (0 si no hay suficientes años de base).
+    """
+    rango = CuboCasos.objects.aggregate(minimo=Min('anio'), maximo=Max('anio'))
+    if rango['maximo'] is None:
+        return 0
+    if anio is None:
+        anio = rango['maximo']
+    
+    # Solo se usan años de base con datos cargados
+    primer_anio = max(anio - anios_base, rango['minimo'])
+    anios_disponibles = anio - primer_anio
+    if anios_disponibles < ANIOS_BASE_MINIMO:
+        return 0
+    
+    semanas_anio = semanas_en_anio(anio)
+    guardadas = 0
+    with transaction.atomic():
+        if semanas is not None:
+            # Semanas del canal que cambian: las del año del canal y las de sus años de base
+            por_zoonosis = {}
+            for zoonosis_id, anio_semana, semana in semanas:
+                if primer_anio <= anio_semana <= anio and 1 <= semana <= semanas_anio:
+                    por_zoonosis.setdefault(zoonosis_id, set()).add(semana)
+            zoonosis_ids = set()
+            for zoonosis_id, numeros in por_zoonosis.items():
+                guardadas_zoonosis = _actualizar_semanas(
+                    zoonosis_id, sorted(numeros), anio, primer_anio, anios_disponibles, batch_size
+                )
+                if guardadas_zoonosis is None:
+                    zoonosis_ids.add(zoonosis_id)
+                else:
+                    guardadas += guardadas_zoonosis
+            if not zoonosis_ids:
+                return guardadas
+        
+        anteriores = CanalEndemico.objects.filter(anio=anio)
+        if zoonosis_ids is not None:
+            anteriores = anteriores.filter(zoonosis_id__in=zoonosis_ids)
+        anteriores.delete()
+        
+        for nivel in CAMPOS_NIVEL:
+            series, arreglo = series_semanales(nivel, primer_anio, anio, zoonosis_ids)
+            guardadas += _guardar_canales(
+                nivel, series, arreglo, anio, range(1, semanas_anio + 1), anios_disponibles, batch_size
+            )
+    
+    return guardadas
+
+
+def _actualizar_semanas(zoonosis_id, semanas, anio, primer_anio, anios_disponibles, batch_size):
+    """Vuelve a calcular algunas semanas del canal de una zoonosis
+
+    Devuelve las filas guardadas, o None si la zoonosis tiene series que aún
+    no están en el canal (hay que calcularla completa).
+    """
+    por_nivel = {}
+    for nivel in CAMPOS_NIVEL:
+        series, arreglo = series_semanales(nivel, primer_anio, anio, [zoonosis_id], semanas)
+        existentes = set(CanalEndemico.objects.filter(
+            zoonosis_id=zoonosis_id, nivel=nivel, anio=anio, semana_epidemiologica=1
+        ).values_list('codigo_ubigeo', flat=True))
+        codigos = [codigo for _, codigo in series]
+        if not existentes.issuperset(codigos):
+            return None
+        por_nivel[nivel] = (series, arreglo, codigos)
+    
+    guardadas = 0
+    for nivel, (series, arreglo, codigos) in por_nivel.items():
+        for inicio in range(0, len(codigos), 500):
+            CanalEndemico.objects.filter(
+                zoonosis_id=zoonosis_id, nivel=nivel, anio=anio, semana_epidemiologica__in=semanas,
+                codigo_ubigeo__in=codigos[inicio:inicio + 500],
+            ).delete()
+        guardadas += _guardar_canales(nivel, series, arreglo, anio, semanas, anios_disponibles, batch_size)
+    return guardadas
+
+
+def _guardar_canales(nivel, series, arreglo, anio, semanas, anios_disponibles, batch_size):
+    """Guarda las filas del canal de las series en las semanas indicadas"""
+    if not series:
+        return 0
+    columnas = [semana - 1 for semana in semanas]
+    calculadas = bandas(arreglo[:, :-1, columnas])
+    observados = arreglo[:, -1, columnas]
+    
+    guardadas = 0
+    lote = []
+    for fila, (zoonosis_id, codigo) in enumerate(series):
+        for posicion, semana in enumerate(semanas):
+            lote.append(CanalEndemico(
+                zoonosis_id=zoonosis_id,
+                nivel=nivel,
+                codigo_ubigeo=codigo,
+                anio=anio,
+                semana_epidemiologica=semana,
+                casos=int(observados[fila, posicion]),
+                anios_base=anios_disponibles,
+                **{
+                    nombre: _redondear(valores[fila, posicion])
+                    for nombre, valores in calculadas.items()
+                }
+            ))
+        if len(lote) >= batch_size:
+            CanalEndemico.objects.bulk_create(lote)
+            guardadas += len(lote)
+            lote = []
+    if lote:
+        CanalEndemico.objects.bulk_create(lote)
+        guardadas += len(lote)
+    return guardadas
+
+
+def _redondear(valor):
+    return None if np.isnan(valor) else round(float(valor), 2)
@@ -0,0 +1,243 @@
+"""Casos a partir de bloques limpios del CSV y carga incremental de lotes semanales
+
+Las DIRESA envían cada semana un CSV con las mismas columnas que el de MINSA.
+El lote se valida completo (si alguna fila tiene errores no se carga ninguna),
+sus casos se agregan en una sola transacción junto con las celdas del cubo que
+cambian, y luego se actualizan los agregados que dependen de ellas. Cada fila
+del lote es un caso nuevo; un mismo archivo (por su sha1) no se carga dos veces.
+"""
+import hashlib
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .agregados import actualizar_derivados, reconstruir_incidencia, sumar_al_cubo
+from .epidemiologia import semanas_en_anio
+from .ingesta import COLUMNAS_CRITICAS, COLUMNAS_CSV, contenido_caso, huella_contenido, limpiar_bloque
+from .models import Caso, CargaSemanal, Distrito, TipoZoonosis
+
+PRIMER_ANIO = 2000
+# Máximo de errores devueltos al rechazar un lote
+MAX_ERRORES = 50
+
+
+class LoteInvalido(Exception):
+    """El lote no se puede cargar; errores tiene el detalle (hasta MAX_ERRORES)"""
+
+    def __init__(self, errores):
+        self.errores = errores[:MAX_ERRORES]
+        if len(errores) > MAX_ERRORES:
+            self.errores.append(f'... y {len(errores) - MAX_ERRORES} errores más')
+        super().__init__(f'El lote tiene {len(errores)} errores' if len(errores) > 1 else errores[0])
+
+
+class LoteRepetido(Exception):
+    """El mismo archivo ya se cargó antes"""
+
+    def __init__(self, carga):
+        self.carga = carga
+        super().__init__(f'El archivo ya se cargó el {timezone.localtime(carga.fecha_carga):%d/%m/%Y %H:%M}')
+
+
+def agregar_ids_dimensiones(df):
+    """Agrega a un bloque limpio los ids de zoonosis, distrito, provincia y departamento (NaN si no existen)"""
+    # Resolver dimensiones en memoria (una consulta por tabla)
+    zoonosis_ids = dict(TipoZoonosis.objects.values_list('nombre', 'id'))
+    # (departamento, provincia, distrito) -> (distrito_id, provincia_id, departamento_id)
+    geografia_ids = {
+        (dept, prov, dist): (pk, prov_id, dept_id)
+        for pk, prov_id, dept_id, dist, prov, dept in Distrito.objects.values_list(
+            'id', 'provincia_id', 'provincia__departamento_id',
+            'nombre', 'provincia__nombre', 'provincia__departamento__nombre'
+        )
+    }
+    geografia = [
+        geografia_ids.get(clave, (None, None, None))
+        for clave in zip(df['departamento'], df['provincia'], df['distrito'])
+    ]
+    
+    return df.assign(
+        zoonosis_id=df['enfermedad'].astype(object).map(zoonosis_ids),
+        distrito_id=[ids[0] for ids in geografia],
+        provincia_id=[ids[1] for ids in geografia],
+        departamento_id=[ids[2] for ids in geografia],
+    )
+
+
+def caso_desde_fila(row):
+    """Caso sin guardar de una fila (itertuples) de un bloque limpio con sus ids de dimensiones"""
+    return Caso(
+        zoonosis_id=int(row.zoonosis_id),
+        distrito_id=int(row.distrito_id),
+        provincia_id=int(row.provincia_id),
+        departamento_id=int(row.departamento_id),
+        edad=int(row.edad),
+        tipo_edad=row.tipo_edad,
+        sexo=row.sexo,
+        grupo_etario=row.grupo_etario if row.grupo_etario >= 0 else None,
+        fecha_notificacion=row.fecha.date(),
+        semana_epidemiologica=int(row.semana),
+        anio=int(row.ano),
+        codigo_diagnostico=row.diagnostic,
+        tipo_diagnostico=row.tipo_dx if not pd.isna(row.tipo_dx) else 'P',
+        codigo_diresa=str(row.diresa) if not pd.isna(row.diresa) else None
+    )
+
+
+def asignar_huellas_libres(casos):
+    """Asigna a cada caso de un lote la primera huella de su contenido que no está en la base
+
+    Un caso con el mismo contenido que otros ya cargados es una notificación
+    nueva: toma la siguiente ocurrencia sin usar, la misma que le asigna
+    cargar_datos al recargar el archivo completo que los incluye.
+    """
+    # contenido -> (primera ocurrencia a probar, casos aún sin huella)
+    pendientes = {}
+    for caso in casos:
+        pendientes.setdefault(contenido_caso(caso), (0, []))[1].append(caso)
+    
+    while pendientes:
+        candidatas = {
+            contenido: [huella_contenido(contenido, inicio + k) for k in range(len(grupo))]
+            for contenido, (inicio, grupo) in pendientes.items()
+        }
+        todas = [huella for huellas in candidatas.values() for huella in huellas]
+        usadas = set()
+        for i in range(0, len(todas), 5000):
+            usadas.update(Caso.objects.filter(huella__in=todas[i:i + 5000]).values_list('huella', flat=True))
+        
+        siguientes = {}
+        for contenido, (inicio, grupo) in pendientes.items():
+            libres = [huella for huella in candidatas[contenido] if huella not in usadas]
+            for caso, huella in zip(grupo, libres):
+                caso.huella = huella
+            if len(libres) < len(grupo):
+                siguientes[contenido] = (inicio + len(grupo), grupo[len(libres):])
+        pendientes = siguientes
+    return casos
+
+
+def _errores_por_fila(errores):
+    """Mensajes 'Fila N: ...' ordenados a partir de [(posición en el lote, mensaje), ...]"""
+    # +2: encabezado y numeración desde 1
+    return [f'Fila {posicion + 2}: {mensaje}' for posicion, mensaje in sorted(errores)]
+
+
+def validar_lote(crudo):
+    """Errores por fila de un lote tal como se leyó del CSV (lista vacía si es válido)"""
+    errores = []
+
+    def revisar(invalidas, mensaje):
+        errores.extend((posicion, mensaje) for posicion in np.flatnonzero(invalidas.to_numpy()))
+    
+    for columna in COLUMNAS_CRITICAS + ['edad', 'tipo_edad', 'sexo']:
+        revisar(crudo[columna].isna(), f'falta {columna}')
+    
+    anio = pd.to_numeric(crudo['ano'].astype(object), errors='coerce')
+    semana = pd.to_numeric(crudo['semana'].astype(object), errors='coerce')
+    edad = pd.to_numeric(crudo['edad'].astype(object), errors='coerce')
+    anio_valido = (anio % 1 == 0) & anio.between(PRIMER_ANIO, timezone.localdate().year)
+    ultima_semana = anio.where(anio_valido, PRIMER_ANIO).astype(int).map(semanas_en_anio)
+    
+    revisar(crudo['ano'].notna() & ~anio_valido, 'año no válido')
+    revisar(
+        anio_valido & crudo['semana'].notna() & ~((semana % 1 == 0) & semana.between(1, ultima_semana)),
+        'semana epidemiológica no válida',
+    )
+    revisar(crudo['edad'].notna() & ~((edad % 1 == 0) & (edad >= 0)), 'edad no válida')
+    revisar(crudo['tipo_edad'].notna() & ~crudo['tipo_edad'].isin(['A', 'M', 'D']), 'tipo de edad no válido')
+    revisar(crudo['sexo'].notna() & ~crudo['sexo'].isin(['M', 'F']), 'sexo no válido')
+    revisar(crudo['tipo_dx'].notna() & ~crudo['tipo_dx'].isin(['C', 'P']), 'tipo de diagnóstico no válido')
+    
+    return _errores_por_fila(errores)
+
+
+def _leer_lote(archivo):
+    """Lee un lote desde un archivo binario; LoteInvalido si no tiene el formato del CSV de MINSA"""
+    try:
+        columnas = pd.read_csv(archivo, encoding='utf-8', nrows=0).columns
+        faltantes = [columna for columna in COLUMNAS_CSV if columna not in columnas]
+        if faltantes:
+            raise LoteInvalido([f'Faltan columnas: {", ".join(faltantes)}'])
+        archivo.seek(0)
+        crudo = pd.read_csv(
+            archivo, encoding='utf-8', usecols=list(COLUMNAS_CSV), dtype=COLUMNAS_CSV,
+            nrows=settings.CARGA_SEMANAL_MAX_FILAS + 1,
+        )
+    except (UnicodeDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError) as error:
+        raise LoteInvalido([f'No se pudo leer el CSV: {error}'])
+    
+    if crudo.empty:
+        raise LoteInvalido(['El archivo no tiene registros'])
+    if len(crudo) > settings.CARGA_SEMANAL_MAX_FILAS:
+        raise LoteInvalido([
+            f'El lote supera {settings.CARGA_SEMANAL_MAX_FILAS} filas; use cargar_datos para cargas completas'
+        ])
+    return crudo
+
+
+def cargar_lote(archivo, nombre_archivo, usuario=None):
+    """Valida y agrega un lote semanal; actualiza solo las celdas del cubo que cambian
+
+    archivo es un archivo binario abierto (p. ej. un UploadedFile). Lanza
+    LoteRepetido si el archivo ya se cargó y LoteInvalido si tiene errores.
+    """
+    sha1 = hashlib.sha1()
+    for parte in iter(lambda: archivo.read(1024 * 1024), b''):
+        sha1.update(parte)
+    huella = sha1.hexdigest()
+    
+    archivo.seek(0)
+    crudo = _leer_lote(archivo)
+    errores = validar_lote(crudo)
+    if not errores:
+        _, df = limpiar_bloque(crudo)
+        df = agregar_ids_dimensiones(df)
+        # Un lote semanal no crea zoonosis ni unidades geográficas nuevas
+        errores = _errores_por_fila(
+            [(posicion, f'zoonosis desconocida ({df["enfermedad"].iloc[posicion]})')
+             for posicion in np.flatnonzero(df['zoonosis_id'].isna().to_numpy())]
+            + [(posicion, 'distrito desconocido ({} / {} / {})'.format(
+                   *df[['departamento', 'provincia', 'distrito']].iloc[posicion]))
+               for posicion in np.flatnonzero(df['distrito_id'].isna().to_numpy())]
+        )
+    if errores:
+        raise LoteInvalido(errores)
+    
+    casos = [caso_desde_fila(row) for row in df.itertuples(index=False)]
+    celdas = {}
+    for caso in casos:
+        clave = (caso.zoonosis_id, caso.distrito_id, caso.provincia_id, caso.departamento_id, caso.anio,
+                 caso.semana_epidemiologica, caso.tipo_diagnostico)
+        celdas[clave] = celdas.get(clave, 0) + 1
+    particiones = {(caso.zoonosis_id, caso.anio) for caso in casos}
+    semanas = {(caso.zoonosis_id, caso.anio, caso.semana_epidemiologica) for caso in casos}
+    
+    with transaction.atomic():
+        # La huella única del archivo impide cargarlo dos veces, aunque lleguen dos pedidos a la vez
+        try:
+            with transaction.atomic():
+                carga = CargaSemanal.objects.create(
+                    huella=huella,
+                    nombre_archivo=nombre_archivo,
+                    usuario=usuario,
+                    casos=len(casos),
+                    semanas=[list(semana) for semana in sorted({(caso.anio, caso.semana_epidemiologica)
+                                                                 for caso in casos})],
+                )
+        except IntegrityError:
+            raise LoteRepetido(CargaSemanal.objects.get(huella=huella))
+        
+        # Dentro de la transacción: otra carga simultánea no puede tomar las mismas huellas
+        Caso.objects.bulk_create(asignar_huellas_libres(casos), batch_size=5000)
+        resultado = {
+            'carga_id': carga.pk,
+            'casos': len(casos),
+            'semanas': carga.semanas,
+            'celdas_cubo': sumar_al_cubo(celdas),
+            'filas_incidencia': reconstruir_incidencia(particiones=particiones),
+        }
+    
+    resultado.update(actualizar_derivados(semanas=semanas))
+    return resultado
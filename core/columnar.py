@@ -0,0 +1,270 @@
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from .models import Caso
+from .epidemiologia import GRUPOS_ETARIOS
+
+ARCHIVO_ACTUAL = 'ACTUAL'
+
+# Columna -> (campo de Caso, dtype)
+COLUMNAS = {
+    'zoonosis': ('zoonosis_id', np.int32),
+    'ubigeo': ('distrito__codigo_ubigeo', np.int32),
+    'departamento': ('departamento_id', np.int32),
+    'anio': ('anio', np.int16),
+    'semana': ('semana_epidemiologica', np.int8),
+    'sexo': ('sexo', np.int8),
+    'grupo_etario': ('grupo_etario', np.int8),
+    'tipo_diagnostico': ('tipo_diagnostico', np.int8),
+}
+
+# Columnas categóricas: el código es la posición en la lista (-1 = sin dato)
+CATEGORIAS = {
+    'sexo': ['M', 'F'],
+    'grupo_etario': GRUPOS_ETARIOS,
+    'tipo_diagnostico': ['P', 'C'],
+}
+
+
+def directorio_snapshot():
+    return Path(settings.SNAPSHOT_COLUMNAR_DIR)
+
+
+# Categóricas que Caso ya guarda como código
+CODIFICADAS_EN_CASO = {'grupo_etario'}
+
+
+def _codificar(columna, valores):
+    if columna in CODIFICADAS_EN_CASO:
+        return [-1 if valor is None else valor for valor in valores]
+    if columna in CATEGORIAS:
+        codigos = {valor: indice for indice, valor in enumerate(CATEGORIAS[columna])}
+        return [codigos.get(valor, -1) for valor in valores]
+    if columna == 'ubigeo':
+        return [int(valor) if valor and valor.isdigit() else -1 for valor in valores]
+    return valores
+
+
+def generar_snapshot(chunk_size=100000, particiones=None, semanas=None):
+    """Escribe en disco un arreglo .npy por columna con todos los casos
+
+    Los archivos se escriben en un directorio nuevo y luego se publica su
+    nombre en el archivo ACTUAL, de modo que los lectores nunca ven un
+    snapshot a medio escribir. Con particiones [(zoonosis_id, anio), ...] o
+    semanas [(zoonosis_id, anio, semana), ...] se copian del snapshot vigente
+    las demás filas y solo se leen de la base los casos de esas particiones
+    o semanas.
+    """
+    base = directorio_snapshot()
+    base.mkdir(parents=True, exist_ok=True)
+    vigente = _snapshot_vigente()
+    anterior = vigente.directorio.name if vigente is not None else None
+    if particiones is None and semanas is None:
+        vigente = None
+    nombre = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    destino = base / nombre
+    destino.mkdir()
+    
+    campos = [campo for campo, _ in COLUMNAS.values()]
+    partes = {columna: [] for columna in COLUMNAS}
+    filas = 0
+    
+    consulta = Caso.objects.order_by()
+    if vigente is not None:
+        conservar = ~np.isin(_claves_particion(vigente.columnas, semanas is not None),
+                             _claves_particion(_columnas_particion(particiones, semanas), semanas is not None))
+        for columna in COLUMNAS:
+            partes[columna].append(np.asarray(vigente.columnas[columna][conservar]))
+        filas += int(conservar.sum())
+        consulta = consulta.filter(_filtro_particiones(particiones, semanas))
+    
+    lote = []
+    for fila in consulta.values_list(*campos).iterator(chunk_size=chunk_size):
+        lote.append(fila)
+        if len(lote) >= chunk_size:
+            filas += _agregar_lote(partes, lote)
+            lote = []
+    if lote:
+        filas += _agregar_lote(partes, lote)
+    
+    for columna, (_, dtype) in COLUMNAS.items():
+        arreglo = np.concatenate(partes[columna]) if partes[columna] else np.empty(0, dtype=dtype)
+        np.save(destino / f'{columna}.npy', arreglo)
+    
+    with open(destino / 'meta.json', 'w', encoding='utf-8') as archivo:
+        json.dump({
+            'filas': filas,
+            'columnas': list(COLUMNAS),
+            'categorias': CATEGORIAS,
+            'generado': datetime.now().isoformat(timespec='seconds'),
+        }, archivo)
+    
+    # Publicar el nuevo snapshot y borrar los anteriores, salvo el que se reemplaza: un lector
+    # que acaba de leer su nombre en ACTUAL todavía puede abrirlo
+    temporal = base / f'{ARCHIVO_ACTUAL}.tmp'
+    temporal.write_text(nombre)
+    os.replace(temporal, base / ARCHIVO_ACTUAL)
+    for directorio in base.iterdir():
+        if directorio.is_dir() and directorio.name not in (nombre, anterior):
+            shutil.rmtree(directorio, ignore_errors=True)
+    
+    return filas
+
+
+def _snapshot_vigente():
+    """Snapshot publicado en ACTUAL, leído directamente de disco (None si no hay)"""
+    try:
+        nombre = (directorio_snapshot() / ARCHIVO_ACTUAL).read_text().strip()
+        return SnapshotColumnar(directorio_snapshot() / nombre)
+    except FileNotFoundError:
+        return None
+
+
+def _columnas_particion(particiones, semanas):
+    """Particiones o semanas como columnas zoonosis, anio (y semana)"""
+    if semanas is not None:
+        zoonosis, anios, numeros = zip(*semanas) if semanas else ((), (), ())
+        return {'zoonosis': np.array(zoonosis), 'anio': np.array(anios), 'semana': np.array(numeros)}
+    zoonosis, anios = zip(*particiones) if particiones else ((), ())
+    return {'zoonosis': np.array(zoonosis), 'anio': np.array(anios)}
+
+
+def _claves_particion(columnas, por_semana):
+    """Un entero por fila que identifica su zoonosis y año (y semana)"""
+    clave = columnas['zoonosis'].astype(np.int64) * 10000 + columnas['anio']
+    if por_semana:
+        clave = clave * 100 + columnas['semana']
+    return clave
+
+
+def _filtro_particiones(particiones, semanas):
+    """Q con los casos de las particiones o semanas"""
+    filtro = Q(pk__in=[])
+    if semanas is not None:
+        por_particion = {}
+        for zoonosis_id, anio, semana in semanas:
+            por_particion.setdefault((zoonosis_id, anio), set()).add(semana)
+        for (zoonosis_id, anio), numeros in por_particion.items():
+            filtro |= Q(zoonosis_id=zoonosis_id, anio=anio, semana_epidemiologica__in=sorted(numeros))
+    else:
+        for zoonosis_id, anio in particiones:
+            filtro |= Q(zoonosis_id=zoonosis_id, anio=anio)
+    return filtro
+
+
+def _agregar_lote(partes, lote):
+    columnas = list(zip(*lote))
+    for indice, (columna, (_, dtype)) in enumerate(COLUMNAS.items()):
+        partes[columna].append(np.asarray(_codificar(columna, columnas[indice]), dtype=dtype))
+    return len(lote)
+
+
+class SnapshotColumnar:
+    """Columnas de casos mapeadas en memoria, con conteos agrupados vectorizados"""
+    
+    def __init__(self, directorio):
+        self.directorio = Path(directorio)
+        with open(self.directorio / 'meta.json', encoding='utf-8') as archivo:
+            self.meta = json.load(archivo)
+        self.columnas = {
+            columna: np.load(self.directorio / f'{columna}.npy', mmap_mode='r')
+            for columna in self.meta['columnas']
+        }
+    
+    @property
+    def filas(self):
+        return self.meta['filas']
+    
+    def mascara(self, filtros):
+        """Máscara booleana para filtros {columna: lista de valores o (mínimo, máximo)}"""
+        mascara = np.ones(self.filas, dtype=bool)
+        for columna, condicion in filtros.items():
+            datos = self.columnas[columna]
+            if isinstance(condicion, tuple):
+                minimo, maximo = condicion
+                if minimo is not None:
+                    mascara &= datos >= minimo
+                if maximo is not None:
+                    mascara &= datos <= maximo
+            else:
+                mascara &= np.isin(datos, self._codigos(columna, condicion))
+        return mascara
+    
+    def contar(self, agrupar_por=(), filtros=None):
+        """Conteo de casos agrupado por columnas, como lista de (valores..., casos)"""
+        mascara = self.mascara(filtros or {})
+        if not agrupar_por:
+            return [(int(mascara.sum()),)]
+        
+        valores_unicos = []
+        indices = []
+        for columna in agrupar_por:
+            unicos, inverso = np.unique(self.columnas[columna][mascara], return_inverse=True)
+            valores_unicos.append(unicos)
+            indices.append(inverso)
+        
+        dimensiones = tuple(len(unicos) for unicos in valores_unicos)
+        if 0 in dimensiones:
+            return []
+        combinado = np.ravel_multi_index(indices, dimensiones)
+        conteos = np.bincount(combinado, minlength=int(np.prod(dimensiones)))
+        
+        no_vacios = np.flatnonzero(conteos)
+        posiciones = np.unravel_index(no_vacios, dimensiones)
+        resultado = []
+        for fila, celda in enumerate(no_vacios):
+            valores = tuple(
+                self._etiqueta(columna, valores_unicos[i][posiciones[i][fila]])
+                for i, columna in enumerate(agrupar_por)
+            )
+            resultado.append(valores + (int(conteos[celda]),))
+        return resultado
+    
+    def _codigos(self, columna, valores):
+        if columna in CATEGORIAS:
+            return [CATEGORIAS[columna].index(valor) for valor in valores if valor in CATEGORIAS[columna]]
+        return [int(valor) for valor in valores]
+    
+    def _etiqueta(self, columna, codigo):
+        codigo = int(codigo)
+        if columna in CATEGORIAS:
+            return CATEGORIAS[columna][codigo] if codigo >= 0 else None
+        if columna == 'ubigeo':
+            return f'{codigo:06d}' if codigo >= 0 else None
+        return codigo
+
+
+_snapshot = None
+_snapshot_nombre = None
+_bloqueo = threading.Lock()
+
+
+def obtener_snapshot():
+    """Snapshot vigente (se vuelve a mapear si el cargador publicó uno nuevo)
+
+    Si el directorio leído en ACTUAL se borra antes de abrirlo (el cargador
+    publicó dos snapshots seguidos) se vuelve a leer ACTUAL.
+    """
+    global _snapshot, _snapshot_nombre
+    for _ in range(3):
+        try:
+            nombre = (directorio_snapshot() / ARCHIVO_ACTUAL).read_text().strip()
+        except FileNotFoundError:
+            return None
+        if nombre == _snapshot_nombre:
+            return _snapshot
+        with _bloqueo:
+            if nombre != _snapshot_nombre:
+                try:
+                    _snapshot = SnapshotColumnar(directorio_snapshot() / nombre)
+                except FileNotFoundError:
+                    continue
+                _snapshot_nombre = nombre
+            return _snapshot
+    return None
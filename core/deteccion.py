@@ -0,0 +1,323 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from django.db import transaction
+from django.db.models import Min, Q, Sum
+from .models import CuboCasos, EstadoSerie, Alerta
+from .epidemiologia import semanas_en_anio
+
+# Parámetros de EARS (semanas en lugar de días)
+SEMANAS_BASE = 7
+DESFASE_C2 = 2
+UMBRAL_C1 = 3.0
+UMBRAL_C2 = 3.0
+UMBRAL_C3 = 2.0
+
+# CUSUM sobre los casos estandarizados con la línea base de C1
+K_CUSUM = 0.5
+UMBRAL_CUSUM = 4.0
+
+UMBRALES = {
+    'C1': UMBRAL_C1,
+    'C2': UMBRAL_C2,
+    'C3': UMBRAL_C3,
+    'CUSUM': UMBRAL_CUSUM,
+}
+
+# Evita desviaciones nulas en series con línea base constante (p. ej. solo ceros)
+DE_MINIMA = 0.5
+# No se alerta por semanas con menos casos que este mínimo
+CASOS_MINIMOS = 2
+
+# Semanas anteriores que se guardan por serie: C3 usa C2 de las dos semanas previas
+LARGO_VENTANA = SEMANAS_BASE + DESFASE_C2 + 2
+# Semanas de CUSUM que se guardan por serie para volver a evaluar desde una de ellas
+LARGO_HISTORIAL = 53
+
+
+def _linea_base(acumulados, primera_columna, desfase, largo):
+    """Media y desviación de las SEMANAS_BASE semanas que terminan `desfase` semanas antes de cada columna
+
+    Usa sumas acumuladas de casos y de sus cuadrados para no copiar una ventana por semana.
+    """
+    suma, suma_cuadrados = acumulados
+    inicio = primera_columna - desfase - SEMANAS_BASE
+    fin = inicio + largo
+    total = suma[:, inicio + SEMANAS_BASE:fin + SEMANAS_BASE] - suma[:, inicio:fin]
+    total_cuadrados = (suma_cuadrados[:, inicio + SEMANAS_BASE:fin + SEMANAS_BASE]
+                       - suma_cuadrados[:, inicio:fin])
+    media = total / SEMANAS_BASE
+    varianza = np.maximum(total_cuadrados - total * media, 0) / (SEMANAS_BASE - 1)
+    return media, np.maximum(np.sqrt(varianza), DE_MINIMA)
+
+
+def evaluar_bloque(ventana, cusum, bloque, validas=None):
+    """Evalúa semanas nuevas de todas las series a la vez
+
+    ventana: (n_series, LARGO_VENTANA) casos de las semanas anteriores
+    cusum: (n_series,) valor acumulado de CUSUM
+    bloque: (n_series, n_semanas) casos de las semanas a evaluar
+    validas: (n_series, n_semanas) semanas con la ventana completa de historia
+    real; en las demás CUSUM no acumula (por defecto todas son válidas)
+
+    Devuelve la ventana y el CUSUM actualizados, y por método un par
+    (estadistico, esperado) de forma (n_series, n_semanas).
+    """
+    n_semanas = bloque.shape[1]
+    serie = np.concatenate([ventana, bloque], axis=1)
+    ceros = np.zeros((serie.shape[0], 1))
+    acumulados = (
+        np.concatenate([ceros, serie.cumsum(axis=1)], axis=1),
+        np.concatenate([ceros, (serie ** 2).cumsum(axis=1)], axis=1),
+    )
+    
+    media_c1, de_c1 = _linea_base(acumulados, LARGO_VENTANA, 0, n_semanas)
+    c1 = (bloque - media_c1) / de_c1
+    
+    # C2 también para las dos semanas anteriores al bloque, que usa C3
+    media_c2, de_c2 = _linea_base(acumulados, LARGO_VENTANA - 2, DESFASE_C2, n_semanas + 2)
+    c2 = (serie[:, LARGO_VENTANA - 2:] - media_c2) / de_c2
+    c3 = sliding_window_view(np.maximum(c2 - 1, 0), 3, axis=1).sum(axis=2)
+    
+    # CUSUM es secuencial en el tiempo, pero vectorizado sobre las series
+    estadistico_cusum = np.empty_like(c1)
+    if validas is None:
+        validas = np.ones(bloque.shape, dtype=bool)
+    for semana in range(n_semanas):
+        cusum = np.where(validas[:, semana], np.maximum(0, cusum + c1[:, semana] - K_CUSUM), 0)
+        estadistico_cusum[:, semana] = cusum
+        cusum = np.where(cusum > UMBRAL_CUSUM, 0, cusum)
+    
+    resultados = {
+        'C1': (c1, media_c1),
+        'C2': (c2[:, 2:], media_c2[:, 2:]),
+        'C3': (c3, media_c2[:, 2:]),
+        'CUSUM': (estadistico_cusum, media_c1),
+    }
+    return serie[:, -LARGO_VENTANA:], cusum, resultados
+
+
+def _semanas_pendientes(desde, hasta, cortes=()):
+    """Bloques (anio, primera_semana, ultima_semana) entre dos semanas epidemiológicas, inclusive
+
+    Los bloques se dividen para que cada semana de cortes [(anio, semana), ...]
+    empiece uno.
+    """
+    for anio in range(desde[0], hasta[0] + 1):
+        primera = desde[1] if anio == desde[0] else 1
+        ultima = hasta[1] if anio == hasta[0] else semanas_en_anio(anio)
+        semanas_corte = {semana for anio_corte, semana in cortes if anio_corte == anio and primera < semana <= ultima}
+        for corte in sorted(semanas_corte):
+            yield anio, primera, corte - 1
+            primera = corte
+        if primera <= ultima:
+            yield anio, primera, ultima
+
+
+def _siguiente_semana(anio, semana):
+    return (anio + 1, 1) if semana >= semanas_en_anio(anio) else (anio, semana + 1)
+
+
+def detectar_brotes(reiniciar=False, particiones=None, semanas=None):
+    """Evalúa con EARS y CUSUM las semanas nuevas o modificadas del cubo
+
+    Se procesan las semanas posteriores a la última evaluada; cada serie
+    guarda en estado_serie las semanas previas y el CUSUM que necesita para
+    continuar, el de sus últimas LARGO_HISTORIAL semanas y el del cierre de
+    cada año. Con particiones [(zoonosis_id, anio), ...] o semanas
+    [(zoonosis_id, anio, semana), ...] (lo que cambió en una carga) las series
+    de esas zoonosis vuelven a la primera semana modificada (al inicio del año
+    en las particiones, o si la semana ya salió del historial): su ventana se
+    reconstruye desde el cubo, su CUSUM desde el de la semana anterior, y sus
+    alertas desde esa semana se descartan y se vuelven a evaluar. No se alerta
+    hasta que la zoonosis tiene LARGO_VENTANA semanas de historia real. Con
+    reiniciar=True se descartan estado y alertas y se evalúa toda la historia.
+    """
+    ultima_cubo = CuboCasos.objects.order_by('-anio', '-semana_epidemiologica').values_list(
+        'anio', 'semana_epidemiologica'
+    ).first()
+    resultado = {'semanas': 0, 'series': 0, 'alertas': 0}
+    if ultima_cubo is None:
+        return resultado
+    
+    with transaction.atomic():
+        if reiniciar:
+            EstadoSerie.objects.all().delete()
+            Alerta.objects.all().delete()
+        
+        estados = list(EstadoSerie.objects.values_list(
+            'zoonosis_id', 'distrito_id', 'ventana', 'cusum', 'cusum_anual', 'cusum_semanal',
+            'anio', 'semana_epidemiologica'
+        ))
+        # Primera semana con casos de cada zoonosis: antes no hay historia real
+        inicio_zoonosis = {}
+        for zoonosis_id, anio, semana in CuboCasos.objects.values('zoonosis_id', 'anio').annotate(
+            semana=Min('semana_epidemiologica')
+        ).order_by().values_list('zoonosis_id', 'anio', 'semana'):
+            inicio_zoonosis[zoonosis_id] = min(inicio_zoonosis.get(zoonosis_id, (anio, semana)), (anio, semana))
+        primer_anio = min(anio for anio, _ in inicio_zoonosis.values())
+        
+        if estados:
+            desde = _siguiente_semana(*max((anio, semana) for *_, anio, semana in estados))
+        else:
+            desde = (primer_anio, 1)
+        
+        # Número de semana continuo para comparar semanas de distintos años
+        semanas_antes = {}
+        total = 0
+        for anio in range(min(primer_anio, desde[0]) - 1, max(ultima_cubo, desde)[0] + 1):
+            semanas_antes[anio] = total
+            total += semanas_en_anio(anio)
+        
+        def numero(anio, semana):
+            return semanas_antes[anio] + semana
+        
+        # Primera semana ya evaluada que cambió en cada zoonosis
+        rebobinar = {}
+        cambios = [(zoonosis_id, anio, 1) for zoonosis_id, anio in particiones or ()] + list(semanas or ())
+        for zoonosis_id, anio, semana in cambios:
+            cambio = max((anio, min(max(semana, 1), semanas_en_anio(anio))), (primer_anio, 1))
+            if cambio < desde:
+                rebobinar[zoonosis_id] = min(cambio, rebobinar.get(zoonosis_id, cambio))
+        # Si alguna serie ya no tiene en su historial el CUSUM de la semana anterior, se vuelve al inicio del año
+        for zoonosis_id, _, _, _, _, historial, anio, semana in estados:
+            cambio = rebobinar.get(zoonosis_id)
+            if cambio and cambio[1] > 1 and len(historial) < numero(anio, semana) - numero(*cambio) + 2:
+                rebobinar[zoonosis_id] = (cambio[0], 1)
+        if desde > ultima_cubo and not rebobinar:
+            return resultado
+        inicio = min([desde] + list(rebobinar.values()))
+        
+        # Casos desde LARGO_VENTANA semanas antes del inicio (para reconstruir las ventanas de las series rebobinadas)
+        anio_minimo = min([desde[0]] + [
+            anio - 1 if semana <= LARGO_VENTANA else anio for anio, semana in rebobinar.values()
+        ])
+        filas = CuboCasos.objects.filter(anio__gte=anio_minimo).values(
+            'zoonosis_id', 'distrito_id', 'anio', 'semana_epidemiologica'
+        ).annotate(casos=Sum('total')).order_by().values_list(
+            'zoonosis_id', 'distrito_id', 'anio', 'semana_epidemiologica', 'casos'
+        )
+        df = pd.DataFrame.from_records(
+            list(filas), columns=['zoonosis_id', 'distrito_id', 'anio', 'semana', 'casos']
+        )
+        # Semanas fuera del calendario del año se suman a la última
+        df['semana'] = np.minimum(df['semana'], df['anio'].map(semanas_en_anio)).clip(lower=1)
+        df['numero'] = df['anio'].map(semanas_antes) + df['semana']
+        
+        # Semana desde la que se evalúa cada zoonosis
+        numero_rebobinar = {zoonosis_id: numero(*cambio) for zoonosis_id, cambio in rebobinar.items()}
+        inicio_df = df['zoonosis_id'].map(lambda zoonosis_id: numero_rebobinar.get(zoonosis_id, numero(*desde)))
+        previas = df[df['zoonosis_id'].isin(list(rebobinar)) & (df['numero'] < inicio_df)
+                     & (df['numero'] >= inicio_df - LARGO_VENTANA)]
+        posicion_previas = (previas['numero'] - inicio_df[previas.index] + LARGO_VENTANA).to_numpy()
+        df = df[df['numero'] >= inicio_df]
+        
+        # Series conocidas y series con sus primeros casos
+        claves = [(zoonosis_id, distrito_id) for zoonosis_id, distrito_id, *_ in estados]
+        indices = {clave: i for i, clave in enumerate(claves)}
+        for clave in zip(df['zoonosis_id'], df['distrito_id']):
+            if clave not in indices:
+                indices[clave] = len(claves)
+                claves.append(clave)
+        
+        ventana = np.zeros((len(claves), LARGO_VENTANA))
+        cusum = np.zeros(len(claves))
+        cierres = [{} for _ in claves]
+        # Una serie nueva no tuvo casos antes: su CUSUM fue cero
+        historiales = [[0.0] * LARGO_HISTORIAL for _ in claves]
+        for i, (_, _, ventana_serie, cusum_serie, cierres_serie, historial, _, _) in enumerate(estados):
+            ventana[i] = ventana_serie
+            cusum[i] = cusum_serie
+            cierres[i] = cierres_serie
+            historiales[i] = historial
+        
+        # Series rebobinadas: ventana con los casos de las semanas anteriores y CUSUM al final de la anterior
+        numero_inicio = np.full(len(claves), numero(*desde))
+        for i, (zoonosis_id, _) in enumerate(claves):
+            if zoonosis_id in rebobinar:
+                anio, semana = rebobinar[zoonosis_id]
+                numero_inicio[i] = numero_rebobinar[zoonosis_id]
+                descartadas = numero(*desde) - numero_inicio[i]
+                ventana[i] = 0
+                if semana == 1:
+                    cusum[i] = cierres[i].get(str(anio - 1), 0.0)
+                else:
+                    cusum[i] = historiales[i][-descartadas - 1] if len(historiales[i]) > descartadas else 0.0
+                cierres[i] = {clave: valor for clave, valor in cierres[i].items() if int(clave) < anio}
+                del historiales[i][max(len(historiales[i]) - descartadas, 0):]
+        if len(previas):
+            np.add.at(ventana, (
+                np.array([indices[clave] for clave in zip(previas['zoonosis_id'], previas['distrito_id'])]),
+                posicion_previas,
+            ), previas['casos'].to_numpy())
+        for zoonosis_id, (anio, semana) in rebobinar.items():
+            Alerta.objects.filter(zoonosis_id=zoonosis_id).filter(
+                Q(anio__gt=anio) | Q(anio=anio, semana_epidemiologica__gte=semana)
+            ).delete()
+        
+        df['serie'] = [indices[clave] for clave in zip(df['zoonosis_id'], df['distrito_id'])]
+        
+        # Primera semana con alertas de cada serie: ventana completa con historia real
+        primera_valida = np.array([numero(*inicio_zoonosis[zoonosis_id]) + LARGO_VENTANA for zoonosis_id, _ in claves])
+        
+        alertas = []
+        for anio, primera, ultima in _semanas_pendientes(inicio, ultima_cubo, cortes=[desde, *rebobinar.values()]):
+            activas = np.flatnonzero(numero_inicio <= numero(anio, primera))
+            del_bloque = df[(df['anio'] == anio) & (df['semana'] >= primera) & (df['semana'] <= ultima)]
+            bloque = np.zeros((len(claves), ultima - primera + 1))
+            np.add.at(bloque, (del_bloque['serie'].to_numpy(), del_bloque['semana'].to_numpy() - primera),
+                      del_bloque['casos'].to_numpy())
+            bloque = bloque[activas]
+            validas = (numero(anio, primera) + np.arange(bloque.shape[1]))[None, :] >= primera_valida[activas, None]
+            
+            ventana[activas], cusum[activas], resultados = evaluar_bloque(
+                ventana[activas], cusum[activas], bloque, validas
+            )
+            if ultima == semanas_en_anio(anio):
+                for i in activas:
+                    cierres[i][str(anio)] = round(float(cusum[i]), 4)
+            # CUSUM al final de cada semana (después de reiniciarse si alertó)
+            estadistico_cusum = resultados['CUSUM'][0]
+            cusum_semanas = np.where(estadistico_cusum > UMBRAL_CUSUM, 0, estadistico_cusum).round(4)
+            for fila, i in enumerate(activas):
+                historiales[i].extend(cusum_semanas[fila].tolist())
+                del historiales[i][:-LARGO_HISTORIAL]
+            
+            for metodo, (estadistico, esperado) in resultados.items():
+                series, semanas_alerta = np.nonzero(
+                    (estadistico > UMBRALES[metodo]) & (bloque >= CASOS_MINIMOS) & validas
+                )
+                for i, j in zip(series, semanas_alerta):
+                    zoonosis_id, distrito_id = claves[activas[i]]
+                    alertas.append(Alerta(
+                        zoonosis_id=zoonosis_id,
+                        distrito_id=distrito_id,
+                        anio=anio,
+                        semana_epidemiologica=primera + j,
+                        metodo=metodo,
+                        casos=int(bloque[i, j]),
+                        esperado=round(float(esperado[i, j]), 2),
+                        estadistico=round(float(estadistico[i, j]), 2),
+                        umbral=UMBRALES[metodo],
+                    ))
+            resultado['semanas'] += bloque.shape[1]
+        
+        EstadoSerie.objects.all().delete()
+        EstadoSerie.objects.bulk_create([
+            EstadoSerie(
+                zoonosis_id=zoonosis_id,
+                distrito_id=distrito_id,
+                anio=ultima_cubo[0],
+                semana_epidemiologica=ultima_cubo[1],
+                ventana=[int(casos) for casos in ventana[i]],
+                cusum=round(float(cusum[i]), 4),
+                cusum_anual=cierres[i],
+                cusum_semanal=historiales[i],
+            )
+            for i, (zoonosis_id, distrito_id) in enumerate(claves)
+        ], batch_size=5000)
+        Alerta.objects.bulk_create(alertas, batch_size=5000, ignore_conflicts=True)
+    
+    resultado['series'] = len(claves)
+    resultado['alertas'] = len(alertas)
+    return resultado
@@ -0,0 +1,61 @@
+from datetime import date, timedelta
+from functools import lru_cache
+import numpy as np
+
+MESES_NOMBRES = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+
+# Grupos etarios; el código de cada uno es su posición en la lista
+GRUPOS_ETARIOS = ['Infancia', 'Adolescencia', 'Adulto', 'Adulto Mayor']
+# Edad máxima en años cumplidos de cada grupo, salvo el último
+_EDAD_MAXIMA_GRUPOS = [5, 17, 64]
+# Unidades de tipo_edad por año
+_UNIDADES_POR_ANIO = {'A': 1, 'M': 12, 'D': 365.25}
+
+
+@lru_cache(maxsize=None)
+def inicio_semana_1(anio):
+    """Domingo en que empieza la semana epidemiológica 1 del año
+
+    La semana 1 es la primera semana (domingo a sábado) que tiene al menos
+    cuatro días dentro del año calendario.
+    """
+    primero_enero = date(anio, 1, 1)
+    dias_desde_domingo = (primero_enero.weekday() + 1) % 7
+    if dias_desde_domingo <= 3:
+        return primero_enero - timedelta(days=dias_desde_domingo)
+    return primero_enero + timedelta(days=7 - dias_desde_domingo)
+
+
+@lru_cache(maxsize=None)
+def semanas_en_anio(anio):
+    """Número de semanas epidemiológicas del año (52 o 53)"""
+    return (inicio_semana_1(anio + 1) - inicio_semana_1(anio)).days // 7
+
+
+@lru_cache(maxsize=None)
+def mes_de_semana(anio, semana):
+    """Mes (1-12) al que pertenece una semana epidemiológica
+
+    Se usa el miércoles de la semana, que siempre cae dentro del año de la
+    semana epidemiológica. Las semanas fuera de rango se acotan a 1..52/53.
+    """
+    semana = min(max(int(semana), 1), semanas_en_anio(anio))
+    miercoles = inicio_semana_1(anio) + timedelta(weeks=semana - 1, days=3)
+    return miercoles.month
+
+
+def codigos_grupo_etario(edades, tipos_edad):
+    """Código del grupo etario de cada edad, en años, meses o días según tipo_edad
+
+    Se usa la edad en años cumplidos. Devuelve -1 si la edad o su unidad no son válidas.
+    """
+    edades = np.asarray(edades, dtype=float)
+    tipos = np.asarray(tipos_edad, dtype=object)
+    divisor = np.select(
+        [tipos == tipo for tipo in _UNIDADES_POR_ANIO],
+        list(_UNIDADES_POR_ANIO.values()),
+        np.nan,
+    )
+    anios = np.floor(edades / divisor)
+    codigos = np.searchsorted(_EDAD_MAXIMA_GRUPOS, anios)
+    return np.where(np.isnan(anios) | (anios < 0), -1, codigos)
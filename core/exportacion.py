@@ -0,0 +1,280 @@
+import csv
+import io
+import re
+import zipfile
+import zlib
+from itertools import islice
+from xml.sax.saxutils import escape
+from django.db.models import Case, Sum, Value, When
+from .models import Caso, CuboCasos, IncidenciaAnual
+from .epidemiologia import GRUPOS_ETARIOS
+
+# Filas que se leen de la base de datos y se escriben en cada fragmento de la respuesta
+FILAS_POR_BLOQUE = 2000
+
+# Máximo de filas de datos por hoja de Excel (1 048 576 menos la cabecera)
+MAX_FILAS_HOJA = 1048575
+
+
+def _entero(parametros, nombre, obligatorio=True):
+    valor = parametros.get(nombre)
+    if not valor:
+        if obligatorio:
+            raise ValueError('Parámetros incompletos')
+        return None
+    if not valor.isdigit():
+        raise ValueError(f'El parámetro {nombre} debe ser un entero')
+    return int(valor)
+
+
+def conjunto_tendencias(parametros):
+    """Casos por año y semana epidemiológica de una zoonosis"""
+    zoonosis_id = _entero(parametros, 'zoonosis_id')
+    anio_inicio = _entero(parametros, 'anio_inicio')
+    anio_fin = _entero(parametros, 'anio_fin')
+    
+    filas = CuboCasos.objects.filter(
+        zoonosis_id=zoonosis_id,
+        anio__gte=anio_inicio,
+        anio__lte=anio_fin,
+    ).values('anio', 'semana_epidemiologica').annotate(
+        casos=Sum('total')
+    ).order_by('anio', 'semana_epidemiologica').values_list('anio', 'semana_epidemiologica', 'casos')
+    return ['anio', 'semana_epidemiologica', 'casos'], filas
+
+
+def conjunto_mapa_calor(parametros):
+    """Casos, población y tasa por 100 000 habitantes por departamento"""
+    zoonosis_id = _entero(parametros, 'zoonosis_id')
+    anio = _entero(parametros, 'anio')
+    
+    filas = IncidenciaAnual.objects.filter(
+        zoonosis_id=zoonosis_id,
+        anio=anio,
+        nivel='departamento',
+    ).order_by('nombre').values_list('codigo_ubigeo', 'nombre', 'casos', 'poblacion', 'tasa_100k')
+    return ['ubigeo', 'departamento', 'casos', 'poblacion', 'tasa_100k'], filas
+
+
+def conjunto_casos(parametros):
+    """Casos individuales filtrados por zoonosis, años y departamento"""
+    zoonosis_id = _entero(parametros, 'zoonosis_id')
+    anio_inicio = _entero(parametros, 'anio_inicio')
+    anio_fin = _entero(parametros, 'anio_fin')
+    departamento_id = _entero(parametros, 'departamento_id', obligatorio=False)
+    
+    casos = Caso.objects.filter(zoonosis_id=zoonosis_id, anio__gte=anio_inicio, anio__lte=anio_fin)
+    if departamento_id:
+        casos = casos.filter(departamento_id=departamento_id)
+    
+    columnas = {
+        'id': 'id',
+        'zoonosis': 'zoonosis__nombre',
+        'departamento': 'departamento__nombre',
+        'provincia': 'provincia__nombre',
+        'distrito': 'distrito__nombre',
+        'ubigeo': 'distrito__codigo_ubigeo',
+        'anio': 'anio',
+        'semana_epidemiologica': 'semana_epidemiologica',
+        'fecha_notificacion': 'fecha_notificacion',
+        'tipo_diagnostico': 'tipo_diagnostico',
+        'codigo_diagnostico': 'codigo_diagnostico',
+        'edad': 'edad',
+        'tipo_edad': 'tipo_edad',
+        'genero': 'sexo',
+        'grupo_etario': 'nombre_grupo_etario',
+    }
+    # El grupo etario se guarda como código; se exporta con su nombre
+    casos = casos.annotate(nombre_grupo_etario=Case(
+        *(When(grupo_etario=codigo, then=Value(nombre)) for codigo, nombre in enumerate(GRUPOS_ETARIOS)),
+        default=None,
+    ))
+    # Orden estable por id para poder reanudar con el parámetro 'desde'
+    filas = casos.order_by('id').values_list(*columnas.values())
+    return list(columnas), filas
+
+
+CONJUNTOS_EXPORTACION = {
+    'tendencias': conjunto_tendencias,
+    'mapa_calor': conjunto_mapa_calor,
+    'casos': conjunto_casos,
+}
+
+
+def iterar_filas(filas, desde=0):
+    """Recorre un queryset en bloques del lado del servidor, sin cargarlo completo en memoria"""
+    if desde:
+        filas = filas[desde:]
+    return filas.iterator(chunk_size=FILAS_POR_BLOQUE)
+
+
+def _bloques(filas):
+    filas = iter(filas)
+    while True:
+        bloque = list(islice(filas, FILAS_POR_BLOQUE))
+        if not bloque:
+            return
+        yield bloque
+
+
+def generar_csv(columnas, filas, cabecera=True):
+    """Fragmentos CSV en UTF-8, un bloque de filas por fragmento"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    if cabecera:
+        # BOM para que Excel reconozca los acentos
+        buffer.write('\ufeff')
+        escritor.writerow(columnas)
+    
+    for bloque in _bloques(filas):
+        escritor.writerows(bloque)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _SalidaZip:
+    """Archivo de solo escritura y sin posicionamiento: zipfile escribe ahí y el generador lo vacía"""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+# Caracteres de control que no admite XML 1.0
+_CARACTERES_INVALIDOS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_INICIO_HOJA = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_FIN_HOJA = '</sheetData></worksheet>'
+
+
+def _celda(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    texto = valor.isoformat() if hasattr(valor, 'isoformat') else str(valor)
+    texto = escape(_CARACTERES_INVALIDOS.sub('', texto))
+    return f'<c t="inlineStr"><is><t>{texto}</t></is></c>'
+
+
+def _fila_xlsx(numero, valores):
+    return f'<row r="{numero}">' + ''.join(_celda(valor) for valor in valores) + '</row>'
+
+
+def _partes_libro(num_hojas):
+    """Archivos del libro que dependen del número de hojas; se escriben al final"""
+    hojas = ''.join(
+        f'<sheet name="Datos{"" if i == 1 else f" {i}"}" sheetId="{i}" r:id="rId{i}"/>'
+        for i in range(1, num_hojas + 1)
+    )
+    relaciones_hojas = ''.join(
+        f'<Relationship Id="rId{i}" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        f'Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, num_hojas + 1)
+    )
+    tipos_hojas = ''.join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in range(1, num_hojas + 1)
+    )
+    declaracion = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    return {
+        '[Content_Types].xml': (
+            declaracion
+            + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + tipos_hojas + '</Types>'
+        ),
+        '_rels/.rels': (
+            declaracion
+            + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/></Relationships>'
+        ),
+        'xl/workbook.xml': (
+            declaracion
+            + '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets>' + hojas + '</sheets></workbook>'
+        ),
+        'xl/_rels/workbook.xml.rels': (
+            declaracion
+            + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + relaciones_hojas + '</Relationships>'
+        ),
+    }
+
+
+def generar_xlsx(columnas, filas):
+    """Fragmentos de un libro XLSX escrito en flujo (zip sin posicionamiento)
+
+    Cada hoja admite hasta MAX_FILAS_HOJA filas; las siguientes pasan a una hoja nueva.
+    """
+    salida = _SalidaZip()
+    libro = zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED)
+    num_hojas = 0
+    hoja = None
+    filas_en_hoja = 0
+
+    def abrir_hoja():
+        nonlocal num_hojas, hoja, filas_en_hoja
+        if hoja is not None:
+            hoja.write(_FIN_HOJA.encode('utf-8'))
+            hoja.close()
+        num_hojas += 1
+        hoja = libro.open(f'xl/worksheets/sheet{num_hojas}.xml', 'w', force_zip64=True)
+        hoja.write((_INICIO_HOJA + _fila_xlsx(1, columnas)).encode('utf-8'))
+        filas_en_hoja = 0
+    
+    abrir_hoja()
+    for bloque in _bloques(filas):
+        partes = []
+        for fila in bloque:
+            if filas_en_hoja == MAX_FILAS_HOJA:
+                hoja.write(''.join(partes).encode('utf-8'))
+                partes = []
+                abrir_hoja()
+            filas_en_hoja += 1
+            partes.append(_fila_xlsx(filas_en_hoja + 1, fila))
+        hoja.write(''.join(partes).encode('utf-8'))
+        yield salida.vaciar()
+    
+    hoja.write(_FIN_HOJA.encode('utf-8'))
+    hoja.close()
+    for nombre, contenido in _partes_libro(num_hojas).items():
+        libro.writestr(nombre, contenido)
+    libro.close()
+    yield salida.vaciar()
+
+
+def comprimir_gzip(fragmentos):
+    """Comprime en gzip un flujo de fragmentos sin acumularlo"""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for fragmento in fragmentos:
+        datos = compresor.compress(fragmento)
+        if datos:
+            yield datos
+    yield compresor.flush()
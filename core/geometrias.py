@@ -0,0 +1,120 @@
+import json
+import math
+import unicodedata
+import numpy as np
+
+# Tolerancia (en grados) de cada resolución
+TOLERANCIAS = {
+    'alta': 0.001,
+    'media': 0.005,
+    'baja': 0.02,
+}
+
+
+def normalizar_nombre(nombre):
+    """Nombre en mayúsculas y sin tildes para comparar unidades geográficas"""
+    nombre = unicodedata.normalize('NFKD', str(nombre)).encode('ascii', 'ignore').decode()
+    return ' '.join(nombre.upper().split())
+
+
+def codigos_inei(distritos):
+    """Ubigeo del INEI -> código registrado, por nivel
+
+    distritos son tuplas (ubigeo, código de su provincia, código de su
+    departamento). Los distritos guardan el ubigeo del INEI, pero los códigos
+    de provincias y departamentos son correlativos asignados por cargar_datos:
+    el ubigeo del INEI de una provincia (o departamento) se deduce de los 4 (o
+    2) primeros dígitos de sus distritos. Los prefijos compartidos por varias
+    unidades se descartan.
+    """
+    codigos = {'distrito': {}, 'provincia': {}, 'departamento': {}}
+    for ubigeo, provincia, departamento in distritos:
+        codigos['distrito'].setdefault(ubigeo, set()).add(ubigeo)
+        codigos['provincia'].setdefault(f'{ubigeo[:4]}00', set()).add(provincia)
+        codigos['departamento'].setdefault(f'{ubigeo[:2]}0000', set()).add(departamento)
+    return {
+        nivel: {inei: registrados.pop() for inei, registrados in unidades.items() if len(registrados) == 1}
+        for nivel, unidades in codigos.items()
+    }
+
+
+def simplificar_anillo(puntos, tolerancia):
+    """Simplifica un anillo cerrado con Douglas-Peucker (mantiene al menos 4 puntos)"""
+    n = len(puntos)
+    if n <= 4:
+        return puntos
+    
+    conservar = np.zeros(n, dtype=bool)
+    conservar[0] = conservar[-1] = True
+    pila = [(0, n - 1)]
+    while pila:
+        i, j = pila.pop()
+        if j <= i + 1:
+            continue
+        a = puntos[i]
+        dx, dy = puntos[j] - a
+        relativos = puntos[i + 1:j] - a
+        norma = math.hypot(dx, dy)
+        if norma == 0:
+            distancias = np.hypot(relativos[:, 0], relativos[:, 1])
+        else:
+            distancias = np.abs(dx * relativos[:, 1] - dy * relativos[:, 0]) / norma
+        k = int(np.argmax(distancias))
+        if distancias[k] > tolerancia:
+            medio = i + 1 + k
+            conservar[medio] = True
+            pila.append((i, medio))
+            pila.append((medio, j))
+    
+    if conservar.sum() < 4:
+        # Anillo colapsado: se conserva un cuadrilátero con los puntos de referencia
+        conservar[[n // 3, 2 * n // 3]] = True
+    return puntos[conservar]
+
+
+def simplificar_geometria(geometria, tolerancia):
+    """Simplifica un Polygon o MultiPolygon y redondea sus coordenadas
+
+    Devuelve (geometria, numero_de_vertices). Los huecos que colapsan por
+    debajo de la tolerancia se descartan.
+    """
+    decimales = max(0, math.ceil(-math.log10(tolerancia))) + 1
+    
+    if geometria['type'] == 'Polygon':
+        poligonos = [geometria['coordinates']]
+    elif geometria['type'] == 'MultiPolygon':
+        poligonos = geometria['coordinates']
+    else:
+        raise ValueError(f'Tipo de geometría no soportado: {geometria["type"]}')
+    
+    resultado = []
+    vertices = 0
+    for poligono in poligonos:
+        anillos = []
+        for indice, anillo in enumerate(poligono):
+            puntos = np.asarray(anillo, dtype=float)[:, :2]
+            simplificado = simplificar_anillo(puntos, tolerancia)
+            if indice > 0 and len(simplificado) < len(puntos) and _area(simplificado) < tolerancia ** 2:
+                continue
+            simplificado = np.round(simplificado, decimales)
+            anillos.append(simplificado.tolist())
+            vertices += len(simplificado)
+        resultado.append(anillos)
+    
+    if len(resultado) == 1:
+        return {'type': 'Polygon', 'coordinates': resultado[0]}, vertices
+    return {'type': 'MultiPolygon', 'coordinates': resultado}, vertices
+
+
+def feature_compacto(geometria, ubigeo, nombre):
+    """Feature GeoJSON serializado sin espacios"""
+    return json.dumps({
+        'type': 'Feature',
+        'properties': {'ubigeo': ubigeo, 'nombre': nombre},
+        'geometry': geometria,
+    }, separators=(',', ':'), ensure_ascii=False)
+
+
+def _area(puntos):
+    x, y = puntos[:, 0], puntos[:, 1]
+    return abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1))) / 2
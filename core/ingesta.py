@@ -0,0 +1,179 @@
+"""Lectura por bloques y limpieza en paralelo del CSV de vigilancia del MINSA
+
+El CSV se lee en bloques de filas con tipos explícitos (todas las columnas
+como categorías: pocos valores distintos y textos que solo se limpian una vez
+por valor). Cada bloque se limpia en un proceso del pool y los bloques limpios
+se entregan en el orden del archivo a un único escritor. Nunca hay más de
+2 × procesos bloques en memoria.
+
+Cada registro guardado lleva una huella (ver Huellas) que permite volver a
+cargar el mismo CSV, o una versión actualizada, insertando solo lo nuevo.
+Este módulo no usa Django para que los procesos de limpieza lo importen rápido.
+"""
+import hashlib
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .epidemiologia import codigos_grupo_etario
+
+# Columnas usadas del CSV y su tipo al leerlo
+COLUMNAS_CSV = {
+    'departamento': 'category',
+    'provincia': 'category',
+    'distrito': 'category',
+    'ubigeo': 'category',
+    'enfermedad': 'category',
+    'diagnostic': 'category',
+    'diresa': 'category',
+    'ano': 'category',
+    'semana': 'category',
+    'edad': 'category',
+    'tipo_edad': 'category',
+    'sexo': 'category',
+    'tipo_dx': 'category',
+}
+
+# Columnas sin las que un registro se descarta
+COLUMNAS_CRITICAS = ['departamento', 'provincia', 'distrito', 'enfermedad', 'ano', 'semana']
+
+# Campos de Caso que definen el contenido de un registro para su huella
+CAMPOS_HUELLA = [
+    'zoonosis_id', 'distrito_id', 'anio', 'semana_epidemiologica', 'edad', 'tipo_edad', 'sexo',
+    'codigo_diagnostico', 'tipo_diagnostico', 'codigo_diresa',
+]
+
+
+def _por_valor(serie, funcion):
+    """Aplica funcion una sola vez por valor distinto de una columna categórica"""
+    valores = pd.Series(funcion(pd.Series(serie.cat.categories, dtype=object)))
+    return pd.Series(valores.reindex(serie.cat.codes).to_numpy(), index=serie.index)
+
+
+def _texto(serie, reparar_enie=False):
+    """Texto sin espacios extremos y en mayúsculas, reparando la Ñ mal codificada si se pide"""
+    def limpiar(valores):
+        if reparar_enie:
+            valores = valores.str.replace('ï¿½', 'Ñ', regex=False)
+        return valores.str.strip().str.upper()
+    
+    return _por_valor(serie, limpiar).astype('category')
+
+
+def _numero(serie):
+    """Valor numérico de una columna leída como texto (NaN si no es un número)"""
+    return _por_valor(serie, lambda valores: pd.to_numeric(valores, errors='coerce')).astype(float)
+
+
+def limpiar_bloque(bloque):
+    """Limpia y normaliza un bloque del CSV; devuelve (filas leídas, bloque limpio)
+
+    Se descartan los registros sin datos críticos. ano, semana y edad quedan
+    numéricos (NaN si no son válidos) y se agregan grupo_etario (-1 si la edad
+    no es válida) y fecha (aproximada a partir del año y la semana).
+    """
+    leidas = len(bloque)
+    bloque = bloque.assign(
+        departamento=_texto(bloque['departamento']),
+        provincia=_texto(bloque['provincia'], reparar_enie=True),
+        distrito=_texto(bloque['distrito'], reparar_enie=True),
+    )
+    bloque = bloque.dropna(subset=COLUMNAS_CRITICAS).reset_index(drop=True)
+    
+    anio = _numero(bloque['ano'])
+    semana = _numero(bloque['semana'])
+    edad = _numero(bloque['edad'])
+    # Semanas fuera de rango se asignan a la semana 1
+    semana = np.trunc(semana).where(semana.between(1, 53) | semana.isna(), 1)
+    
+    return leidas, bloque.assign(
+        ano=anio,
+        semana=semana,
+        edad=edad,
+        grupo_etario=codigos_grupo_etario(edad, bloque['tipo_edad'].astype(object)).astype(np.int8),
+        fecha=pd.to_datetime(pd.DataFrame({'year': anio, 'month': 1, 'day': 1}), errors='coerce')
+              + pd.to_timedelta((semana - 1) * 7, unit='D'),
+    )
+
+
+def bloques_limpios(ruta, filas_bloque=100000, procesos=1):
+    """Itera (filas leídas, bloque limpio) en el orden del archivo
+
+    Con procesos > 1 la limpieza se reparte en un pool de procesos mientras
+    el llamador escribe el bloque anterior.
+    """
+    lector = pd.read_csv(
+        ruta, encoding='utf-8', usecols=list(COLUMNAS_CSV), dtype=COLUMNAS_CSV, chunksize=filas_bloque,
+    )
+    with lector:
+        if procesos <= 1:
+            for bloque in lector:
+                yield limpiar_bloque(bloque)
+            return
+        
+        # 'spawn' evita heredar la conexión a la base de datos del proceso que escribe
+        pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'))
+        pendientes = deque()
+        try:
+            for bloque in lector:
+                pendientes.append(pool.submit(limpiar_bloque, bloque))
+                if len(pendientes) >= 2 * procesos:
+                    yield pendientes.popleft().result()
+            while pendientes:
+                yield pendientes.popleft().result()
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+
+def contenido_caso(caso):
+    """Texto con los CAMPOS_HUELLA de un caso (instancia de Caso u objeto con esos atributos)"""
+    valores = (getattr(caso, campo) for campo in CAMPOS_HUELLA)
+    return '|'.join('' if valor is None else str(valor) for valor in valores)
+
+
+def digesto_contenido(contenido):
+    """Clave corta (16 caracteres hex) de un contenido para contar sus apariciones"""
+    return hashlib.sha1(contenido.encode()).hexdigest()[:16]
+
+
+def huella_contenido(contenido, ocurrencia):
+    """Huella de la ocurrencia número ocurrencia (desde 0) de un contenido"""
+    return hashlib.sha1(f'{contenido}|{ocurrencia}'.encode()).hexdigest()
+
+
+class Huellas:
+    """Asigna a los registros de una carga una huella estable
+
+    El CSV no trae un identificador por caso y puede repetir registros
+    idénticos, así que la huella es el sha1 del contenido más el número de
+    veces que ese contenido ya apareció antes en el archivo. Volver a cargar
+    el mismo archivo produce las mismas huellas.
+
+    Las apariciones se cuentan por el digesto corto del contenido. Esta clase
+    las guarda en memoria; para archivos grandes una subclase redefine previas
+    y anotar para guardarlas fuera (ver cargar_datos).
+    """
+
+    def __init__(self):
+        self.apariciones = Counter()
+
+    def previas(self, digestos):
+        """{digesto: apariciones anteriores} de los digestos que ya aparecieron"""
+        return {digesto: self.apariciones[digesto] for digesto in digestos if digesto in self.apariciones}
+
+    def anotar(self, conteo):
+        """Suma las apariciones {digesto: cantidad} de un bloque"""
+        self.apariciones.update(conteo)
+
+    def asignar(self, casos):
+        """Guarda en cada caso (en el orden del archivo) su huella"""
+        contenidos = [contenido_caso(caso) for caso in casos]
+        digestos = [digesto_contenido(contenido) for contenido in contenidos]
+        previas = self.previas(set(digestos))
+        conteo = Counter()
+        for caso, contenido, digesto in zip(casos, contenidos, digestos):
+            caso.huella = huella_contenido(contenido, previas.get(digesto, 0) + conteo[digesto])
+            conteo[digesto] += 1
+        self.anotar(conteo)
+        return casos
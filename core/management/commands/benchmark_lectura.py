@@ -0,0 +1,169 @@
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import closing
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from core.models import CuboCasos, IncidenciaAnual
+from core.sqlite import sentencias_pragmas
+
+
+def _consultas_dashboard():
+    """SQL de consultas típicas de los dashboards, con parámetros de datos reales"""
+    zoonosis_id, anio = CuboCasos.objects.order_by('-anio').values_list('zoonosis_id', 'anio').first()
+    querysets = [
+        # Tendencias: casos por año y semana de una zoonosis
+        CuboCasos.objects.filter(zoonosis_id=zoonosis_id, anio__gte=anio - 8, anio__lte=anio).values(
+            'anio', 'semana_epidemiologica'
+        ).annotate(total=Sum('total')),
+        # Mapa de calor: incidencia por departamento
+        IncidenciaAnual.objects.filter(zoonosis_id=zoonosis_id, anio=anio, nivel='departamento').values(
+            'codigo_ubigeo', 'casos', 'tasa_100k'
+        ),
+        # Reportes: casos por zoonosis, departamento y año
+        CuboCasos.objects.filter(anio__gte=anio - 8).values('zoonosis_id', 'departamento_id', 'anio').annotate(
+            total=Sum('total')
+        ),
+    ]
+    consultas = []
+    for queryset in querysets:
+        sql, parametros = queryset.query.get_compiler('default').as_sql()
+        consultas.append((sql.replace('%s', '?').replace('%%', '%'), parametros))
+    return consultas
+
+
+class _Escenario:
+    """Lectores concurrentes sobre una copia de la base, con o sin una carga escribiendo a la vez"""
+
+    def __init__(self, ruta, perfil, consultas, lectores, filas_lote):
+        self.ruta = ruta
+        self.perfil = perfil
+        self.consultas = consultas
+        self.lectores = lectores
+        self.filas_lote = filas_lote
+        self.pragmas = settings.SQLITE_PRAGMAS_PRODUCCION if perfil == 'produccion' else {}
+
+    def _conexion(self, solo_lectura=False):
+        if solo_lectura:
+            conexion = sqlite3.connect(f'file:{self.ruta}?mode=ro', uri=True, timeout=5, check_same_thread=False)
+        else:
+            conexion = sqlite3.connect(self.ruta, timeout=20, isolation_level=None, check_same_thread=False)
+        for sentencia in sentencias_pragmas(self.pragmas, solo_lectura):
+            conexion.execute(sentencia)
+        return conexion
+
+    def _lector(self, indice, detener, latencias, errores):
+        # Desarrollo: una conexión nueva por petición (CONN_MAX_AGE = 0)
+        # Producción: conexión de solo lectura persistente
+        persistente = self._conexion(solo_lectura=True) if self.perfil == 'produccion' else None
+        numero = indice
+        while not detener.is_set():
+            sql, parametros = self.consultas[numero % len(self.consultas)]
+            numero += 1
+            inicio = time.perf_counter()
+            try:
+                conexion = persistente or self._conexion()
+                conexion.execute(sql, parametros).fetchall()
+                if persistente is None:
+                    conexion.close()
+                latencias.append(time.perf_counter() - inicio)
+            except sqlite3.OperationalError:
+                errores.append(1)
+        if persistente is not None:
+            persistente.close()
+
+    def _escritor(self, detener, filas_escritas):
+        # Simula cargar_datos: transacciones grandes de inserciones seguidas
+        conexion = self._conexion()
+        conexion.execute('CREATE TABLE IF NOT EXISTS benchmark_carga (id INTEGER PRIMARY KEY, dato TEXT)')
+        relleno = 'x' * 120
+        while not detener.is_set():
+            try:
+                conexion.execute('BEGIN')
+                conexion.executemany(
+                    'INSERT INTO benchmark_carga (dato) VALUES (?)',
+                    ((relleno,) for _ in range(self.filas_lote)),
+                )
+                conexion.execute('COMMIT')
+                filas_escritas.append(self.filas_lote)
+            except sqlite3.OperationalError:
+                if conexion.in_transaction:
+                    conexion.execute('ROLLBACK')
+        conexion.close()
+
+    def ejecutar(self, segundos, con_carga):
+        detener = threading.Event()
+        latencias, errores, filas_escritas = [], [], []
+        hilos = [
+            threading.Thread(target=self._lector, args=(i, detener, latencias, errores))
+            for i in range(self.lectores)
+        ]
+        if con_carga:
+            hilos.append(threading.Thread(target=self._escritor, args=(detener, filas_escritas)))
+        for hilo in hilos:
+            hilo.start()
+        time.sleep(segundos)
+        detener.set()
+        for hilo in hilos:
+            hilo.join()
+        
+        latencias.sort()
+        return {
+            'consultas_s': len(latencias) / segundos,
+            'p50_ms': statistics.median(latencias) * 1000 if latencias else 0,
+            'p95_ms': latencias[int(len(latencias) * 0.95)] * 1000 if latencias else 0,
+            'errores': len(errores),
+            'filas_s': sum(filas_escritas) / segundos,
+        }
+
+
+class Command(BaseCommand):
+    help = ('Compara la lectura concurrente de los dashboards con el perfil SQLite de desarrollo y el de '
+            'producción, con y sin una carga escribiendo (sobre una copia temporal de la base)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lectores', type=int, default=4, help='Hilos lectores concurrentes')
+        parser.add_argument('--segundos', type=float, default=5, help='Duración de cada escenario')
+        parser.add_argument('--filas-lote', type=int, default=50000,
+                            help='Filas por transacción de la carga simulada')
+
+    def handle(self, *args, **kwargs):
+        origen = settings.DATABASES['default']['NAME']
+        if settings.DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3' or not os.path.exists(origen):
+            raise CommandError('El benchmark necesita la base de datos SQLite del proyecto')
+        if not CuboCasos.objects.exists():
+            raise CommandError('No hay datos en el cubo; ejecuta primero cargar_datos')
+        
+        consultas = _consultas_dashboard()
+        directorio = tempfile.mkdtemp(prefix='benchmark_lectura_')
+        try:
+            ruta = os.path.join(directorio, 'copia.sqlite3')
+            with closing(sqlite3.connect(f'file:{origen}?mode=ro', uri=True)) as fuente, \
+                    closing(sqlite3.connect(ruta)) as copia:
+                fuente.backup(copia)
+            
+            self.stdout.write(
+                f"{'perfil':<12} {'carga':<6} {'consultas/s':>12} {'p50 ms':>8} {'p95 ms':>8} "
+                f"{'errores':>8} {'filas/s':>10}"
+            )
+            for perfil in ('desarrollo', 'produccion'):
+                with closing(sqlite3.connect(ruta)) as conexion:
+                    conexion.execute(f"PRAGMA journal_mode = {'wal' if perfil == 'produccion' else 'delete'}")
+                escenario = _Escenario(ruta, perfil, consultas, kwargs['lectores'], kwargs['filas_lote'])
+                for con_carga in (False, True):
+                    r = escenario.ejecutar(kwargs['segundos'], con_carga)
+                    self.stdout.write(
+                        f"{perfil:<12} {'sí' if con_carga else 'no':<6} {r['consultas_s']:>12.1f} "
+                        f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['errores']:>8} {r['filas_s']:>10.0f}"
+                    )
+        finally:
+            shutil.rmtree(directorio, ignore_errors=True)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Benchmark completado: {kwargs['lectores']} lectores, {kwargs['segundos']:g}s por escenario"
+        ))
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.canal_endemico import calcular_canales, ANIOS_BASE_MINIMO
+from core.cache_api import incrementar_version
+
+
+class Command(BaseCommand):
+    help = 'Calcula el canal endémico de todas las series zoonosis × unidad geográfica para un año'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--anio', type=int, default=None,
+                            help='Año objetivo (por defecto el último año con datos)')
+        parser.add_argument('--anios-base', type=int, default=7,
+                            help=f'Años anteriores usados para las bandas (mínimo {ANIOS_BASE_MINIMO})')
+    
+    def handle(self, *args, **kwargs):
+        anios_base = kwargs['anios_base']
+        if anios_base < ANIOS_BASE_MINIMO:
+            raise CommandError(f'Se necesitan al menos {ANIOS_BASE_MINIMO} años de base')
+        
+        inicio = time.time()
+        filas = calcular_canales(anio=kwargs['anio'], anios_base=anios_base)
+        if not filas:
+            self.stdout.write(self.style.WARNING(
+                'No hay suficientes años anteriores con datos para calcular el canal endémico'
+            ))
+            return
+        
+        incrementar_version()
+        duracion = time.time() - inicio
+        self.stdout.write(self.style.SUCCESS(f'Filas de canal endémico: {filas} ({duracion:.1f}s)'))
@@ -1,70 +1,209 @@
+import os
+import time
 import pandas as pd
 from django.core.management.base import BaseCommand
-from core.models import Departamento, Provincia, Distrito, TipoZoonosis, Paciente, Caso
-from datetime import datetime, timedelta
-from django.db import transaction
+from core.models import Departamento, Provincia, Distrito, TipoZoonosis, Caso
+from core.epidemiologia import codigos_grupo_etario
+from core.ingesta import Huellas, bloques_limpios
+from core.cargas import agregar_ids_dimensiones, caso_desde_fila
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from core.agregados import actualizar_agregados
+
+# Tabla temporal con las huellas del archivo: los ausentes se buscan en la base, no en memoria
+TABLA_HUELLAS = 'huellas_archivo'
+# Tabla temporal con las apariciones de cada contenido del archivo (ver HuellasEnTabla)
+TABLA_APARICIONES = 'apariciones_archivo'
+
+
+def datos_completos(df):
+    """Filas de un bloque limpio con edad, tipo de edad, sexo, año y semana válidos"""
+    return (
+        df['edad'].notna() & df['tipo_edad'].notna() & df['sexo'].notna()
+        & df['ano'].notna() & df['semana'].notna()
+    )
+
+
+class HuellasEnTabla(Huellas):
+    """Huellas con las apariciones de cada contenido en una tabla temporal: la memoria no crece con el archivo"""
+
+    def __init__(self):
+        super().__init__()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLA_APARICIONES}')
+            cursor.execute(
+                f'CREATE TEMP TABLE {TABLA_APARICIONES} (digesto CHAR(16) PRIMARY KEY, apariciones INTEGER NOT NULL)'
+            )
+
+    def previas(self, digestos):
+        digestos = list(digestos)
+        previas = {}
+        with connection.cursor() as cursor:
+            for i in range(0, len(digestos), 500):
+                parte = digestos[i:i + 500]
+                cursor.execute(
+                    f'SELECT digesto, apariciones FROM {TABLA_APARICIONES} '
+                    f'WHERE digesto IN ({", ".join(["%s"] * len(parte))})',
+                    parte,
+                )
+                previas.update(cursor.fetchall())
+        return previas
+
+    def anotar(self, conteo):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {TABLA_APARICIONES} (digesto, apariciones) VALUES (%s, %s) '
+                f'ON CONFLICT (digesto) DO UPDATE SET apariciones = apariciones + excluded.apariciones',
+                list(conteo.items()),
+            )
+
+    def cerrar(self):
+        """Borra la tabla temporal"""
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLA_APARICIONES}')
 
 class Command(BaseCommand):
     help = 'Carga datos desde el CSV de MINSA'
     
     def add_arguments(self, parser):
         parser.add_argument('csv_path', type=str, help='Ruta al archivo CSV')
+        parser.add_argument(
+            '--modo', choices=['bulk', 'filas'], default='bulk',
+            help='bulk: resuelve dimensiones en memoria y usa bulk_create; filas: una consulta por registro'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Registros por lote en modo bulk')
+        parser.add_argument(
+            '--filas-bloque', type=int, default=100000,
+            help='Filas del CSV leídas por bloque (acota la memoria usada)'
+        )
+        parser.add_argument(
+            '--procesos', type=int, default=os.cpu_count() or 1,
+            help='Procesos que limpian los bloques en paralelo (1 = en el mismo proceso)'
+        )
+        parser.add_argument(
+            '--conservar-ausentes', action='store_true',
+            help='El archivo es parcial: no borra los casos de sus años que ya no están en él'
+        )
     
     def handle(self, *args, **kwargs):
         csv_path = kwargs['csv_path']
-        self.stdout.write('Iniciando carga de datos...')
+        modo = kwargs['modo']
+        batch_size = kwargs['batch_size']
+        procesos = kwargs['procesos']
+        self.stdout.write(
+            f'Iniciando carga de datos (bloques de {kwargs["filas_bloque"]} filas, {procesos} procesos)...'
+        )
         
-        # Leer CSV
-        df = pd.read_csv(csv_path, encoding='utf-8', low_memory=False)
-        self.stdout.write(f'Total de registros: {len(df)}')
+        self.contador_departamentos = Departamento.objects.count() + 1
+        self.contador_provincias = Provincia.objects.count() + 1
+        self.dimensiones_vistas = set()
+        # Solo se insertan los casos cuya huella no está en la base
+        self.huellas = HuellasEnTabla()
+        # (zoonosis_id, anio) con casos nuevos o eliminados, para actualizar sus agregados
+        self.particiones = set()
+        # El archivo es completo para sus zoonosis × año: los casos de esas particiones que no están en él se borran
+        self.eliminar = not kwargs['conservar_ausentes']
+        self.particiones_archivo = set()
+        if self.eliminar:
+            self.crear_tabla_huellas()
+        
+        # Leer y limpiar el CSV por bloques; se escriben en el orden del archivo
+        total = validos = casos_creados = casos_existentes = casos_error = 0
+        inicio = time.perf_counter()
+        for leidas, df in bloques_limpios(csv_path, kwargs['filas_bloque'], procesos):
+            total += leidas
+            validos += len(df)
+            
+            self.cargar_dimensiones(df)
+            if modo == 'bulk':
+                creados, existentes, errores = self.cargar_casos_bulk(df, batch_size)
+            else:
+                creados, existentes, errores = self.cargar_casos_filas(df)
+            casos_creados += creados
+            casos_existentes += existentes
+            casos_error += errores
+            
+            # Progreso
+            duracion = time.perf_counter() - inicio
+            velocidad = total / duracion if duracion > 0 else 0
+            self.stdout.write(
+                f'Procesados: {total} | Casos creados: {casos_creados} | Sin cambios: {casos_existentes} | '
+                f'Errores: {casos_error} | {velocidad:.0f} filas/s'
+            )
         
-        # Limpieza de datos
-        df['provincia'] = df['provincia'].str.replace('ï¿½', 'Ñ')
-        df['distrito'] = df['distrito'].str.replace('ï¿½', 'Ñ')
-        df['departamento'] = df['departamento'].str.strip().str.upper()
-        df['provincia'] = df['provincia'].str.strip().str.upper()
-        df['distrito'] = df['distrito'].str.strip().str.upper()
+        casos_eliminados = 0
+        if self.eliminar:
+            if self.particiones_archivo:
+                casos_eliminados = self.eliminar_ausentes()
+            else:
+                self.stdout.write(self.style.WARNING('El archivo no tiene casos válidos; no se elimina ningún caso'))
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {TABLA_HUELLAS}')
+        self.huellas.cerrar()
+        duracion = time.perf_counter() - inicio
+        velocidad = total / duracion if duracion > 0 else 0
+        self.stdout.write(f'Total de registros: {total}')
+        self.stdout.write(f'Registros válidos: {validos}')
         
-        # Eliminar filas con datos faltantes críticos
-        df = df.dropna(subset=['departamento', 'provincia', 'distrito', 'enfermedad', 'ano', 'semana'])
-        self.stdout.write(f'Registros válidos: {len(df)}')
+        # Recalcular solo los agregados de las zoonosis y años que cambiaron
+        if self.particiones:
+            self.stdout.write(f'Actualizando agregados ({len(self.particiones)} zoonosis × año)...')
+            agregados = actualizar_agregados(particiones=self.particiones)
+        else:
+            self.stdout.write('Sin cambios respecto a la base: los agregados no se recalculan')
+            agregados = {}
         
-        # Cargar Departamentos con código único
-        self.stdout.write('Cargando departamentos...')
-        departamentos_unicos = df['departamento'].unique()
-        dept_counter = 1
-        for dept_nombre in departamentos_unicos:
-            codigo = f"{dept_counter:02d}0000"
+        self.stdout.write(self.style.SUCCESS(f'\n=== CARGA COMPLETADA ==='))
+        self.stdout.write(self.style.SUCCESS(f'Total casos creados: {casos_creados}'))
+        self.stdout.write(self.style.SUCCESS(f'Casos ya cargados: {casos_existentes}'))
+        self.stdout.write(self.style.SUCCESS(f'Casos eliminados: {casos_eliminados}'))
+        self.stdout.write(self.style.SUCCESS(f'Total errores: {casos_error}'))
+        self.stdout.write(self.style.SUCCESS(f'Tiempo de carga: {duracion:.1f} s ({velocidad:.0f} filas/s)'))
+        self.stdout.write(self.style.SUCCESS(f'Departamentos: {Departamento.objects.count()}'))
+        self.stdout.write(self.style.SUCCESS(f'Provincias: {Provincia.objects.count()}'))
+        self.stdout.write(self.style.SUCCESS(f'Distritos: {Distrito.objects.count()}'))
+        self.stdout.write(self.style.SUCCESS(f'Zoonosis: {TipoZoonosis.objects.count()}'))
+        for nombre, valor in agregados.items():
+            self.stdout.write(self.style.SUCCESS(f'{nombre}: {valor}'))
+
+    def nuevas(self, df, columnas):
+        """Combinaciones de columnas del bloque que aún no se registraron en esta carga"""
+        combinaciones = df[columnas].drop_duplicates()
+        nuevas = []
+        for fila in combinaciones.itertuples(index=False):
+            clave = (tuple(columnas), tuple(fila))
+            if clave not in self.dimensiones_vistas:
+                self.dimensiones_vistas.add(clave)
+                nuevas.append(fila._asdict())
+        return nuevas
+
+    def cargar_dimensiones(self, df):
+        """Crea los departamentos, provincias, distritos y zoonosis que aparecen por primera vez en el bloque"""
+        # Departamentos con código único
+        for row in self.nuevas(df, ['departamento']):
+            codigo = f"{self.contador_departamentos:02d}0000"
             Departamento.objects.get_or_create(
-                nombre=dept_nombre,
+                nombre=row['departamento'],
                 defaults={'codigo_ubigeo': codigo}
             )
-            dept_counter += 1
-        self.stdout.write(f'Departamentos cargados: {Departamento.objects.count()}')
+            self.contador_departamentos += 1
         
-        # Cargar Provincias con código único
-        self.stdout.write('Cargando provincias...')
-        provincias_df = df[['departamento', 'provincia']].drop_duplicates()
-        prov_counter = 1
-        for _, row in provincias_df.iterrows():
+        # Provincias con código único
+        for row in self.nuevas(df, ['departamento', 'provincia']):
             try:
                 dept = Departamento.objects.get(nombre=row['departamento'])
-                codigo = f"{dept.codigo_ubigeo[:2]}{prov_counter:02d}00"
+                codigo = f"{dept.codigo_ubigeo[:2]}{self.contador_provincias:02d}00"
                 Provincia.objects.get_or_create(
                     departamento=dept,
                     nombre=row['provincia'],
                     defaults={'codigo_ubigeo': codigo}
                 )
-                prov_counter += 1
+                self.contador_provincias += 1
             except Departamento.DoesNotExist:
                 self.stdout.write(self.style.WARNING(f'Departamento no encontrado: {row["departamento"]}'))
-        self.stdout.write(f'Provincias cargadas: {Provincia.objects.count()}')
         
-        # Cargar Distritos usando ubigeo del CSV
-        self.stdout.write('Cargando distritos...')
-        distritos_df = df[['departamento', 'provincia', 'distrito', 'ubigeo']].drop_duplicates()
-        distritos_creados = 0
-        for _, row in distritos_df.iterrows():
+        # Distritos usando ubigeo del CSV
+        for row in self.nuevas(df, ['departamento', 'provincia', 'distrito', 'ubigeo']):
             try:
                 dept = Departamento.objects.get(nombre=row['departamento'])
                 prov = Provincia.objects.get(departamento=dept, nombre=row['provincia'])
@@ -74,30 +213,31 @@ class Command(BaseCommand):
                     nombre=row['distrito'],
                     defaults={'codigo_ubigeo': ubigeo}
                 )
-                distritos_creados += 1
             except Exception as e:
                 self.stdout.write(self.style.WARNING(f'Error en distrito: {e}'))
-        self.stdout.write(f'Distritos cargados: {Distrito.objects.count()}')
         
-        # Cargar Zoonosis
-        self.stdout.write('Cargando tipos de zoonosis...')
-        enfermedades_df = df[['enfermedad', 'diagnostic']].drop_duplicates()
-        for _, row in enfermedades_df.iterrows():
+        # Zoonosis
+        for row in self.nuevas(df, ['enfermedad', 'diagnostic']):
             TipoZoonosis.objects.get_or_create(
                 nombre=row['enfermedad'],
                 defaults={'codigo_cie10': row['diagnostic']}
             )
-        self.stdout.write(f'Zoonosis cargadas: {TipoZoonosis.objects.count()}')
-        
-        # Cargar Casos (por lotes con transacciones)
-        self.stdout.write('Cargando casos...')
+
+    def cargar_casos_filas(self, df):
+        """Carga fila por fila con consultas ORM (modo original)"""
         batch_size = 500
         casos_creados = 0
-        casos_error = 0
+        casos_existentes = 0
         
+        # Mismas reglas de descarte que el modo bulk
+        completas = datos_completos(df)
+        casos_error = int((~completas).sum())
+        df = df[completas]
+    
         for i in range(0, len(df), batch_size):
             batch = df[i:i+batch_size]
-            
+            casos_lote = []
+        
             with transaction.atomic():
                 for _, row in batch.iterrows():
                     try:
@@ -106,56 +246,107 @@ class Command(BaseCommand):
                         dept = Departamento.objects.get(nombre=row['departamento'])
                         prov = Provincia.objects.get(departamento=dept, nombre=row['provincia'])
                         distrito = Distrito.objects.get(provincia=prov, nombre=row['distrito'])
-                        
-                        # Validar datos
-                        if pd.isna(row['edad']) or pd.isna(row['tipo_edad']) or pd.isna(row['sexo']):
-                            casos_error += 1
-                            continue
-                        
-                        # Crear paciente
-                        paciente = Paciente.objects.create(
-                            edad=int(row['edad']),
-                            tipo_edad=row['tipo_edad'],
-                            genero=row['sexo']
-                        )
-                        
-                        # Calcular fecha aproximada
-                        try:
-                            anio = int(row['ano'])
-                            semana = int(row['semana'])
-                            if semana < 1 or semana > 53:
-                                semana = 1
-                            fecha_inicio_anio = datetime(anio, 1, 1)
-                            fecha_caso = fecha_inicio_anio + timedelta(weeks=semana-1)
-                        except:
-                            fecha_caso = datetime(2000, 1, 1)
-                        
-                        # Crear caso
-                        Caso.objects.create(
+                    
+                        codigo_grupo = codigos_grupo_etario([int(row['edad'])], [row['tipo_edad']])[0]
+                        grupo_etario = int(codigo_grupo) if codigo_grupo >= 0 else None
+                    
+                        # Crear caso si no estaba cargado
+                        caso = Caso(
                             zoonosis=zoonosis,
                             distrito=distrito,
-                            paciente=paciente,
-                            fecha_notificacion=fecha_caso.date(),
-                            semana_epidemiologica=semana,
-                            anio=anio,
+                            provincia=prov,
+                            departamento=dept,
+                            edad=int(row['edad']),
+                            tipo_edad=row['tipo_edad'],
+                            sexo=row['sexo'],
+                            grupo_etario=grupo_etario,
+                            fecha_notificacion=row['fecha'].date(),
+                            semana_epidemiologica=int(row['semana']),
+                            anio=int(row['ano']),
                             codigo_diagnostico=row['diagnostic'],
                             tipo_diagnostico=row['tipo_dx'] if not pd.isna(row['tipo_dx']) else 'P',
                             codigo_diresa=str(row['diresa']) if not pd.isna(row['diresa']) else None
                         )
+                        self.huellas.asignar([caso])
+                        casos_lote.append(caso)
+                        if Caso.objects.filter(huella=caso.huella).exists():
+                            casos_existentes += 1
+                            continue
+                        caso.save()
+                        self.particiones.add((caso.zoonosis_id, caso.anio))
                         casos_creados += 1
-                        
+                    
                     except Exception as e:
                         casos_error += 1
                         if casos_error < 10:  # Solo mostrar primeros 10 errores
                             self.stdout.write(self.style.WARNING(f'Error en caso: {e}'))
+                
+                self.registrar_huellas(casos_lote)
+    
+        return casos_creados, casos_existentes, casos_error
+    
+    def cargar_casos_bulk(self, df, batch_size):
+        """Carga por lotes resolviendo dimensiones en memoria y usando bulk_create"""
+        df = agregar_ids_dimensiones(df)
+        
+        # Mismas reglas de descarte que el modo por filas
+        validos = df['zoonosis_id'].notna() & df['distrito_id'].notna() & datos_completos(df)
+        casos_error = int((~validos).sum())
+        df = df[validos]
+        
+        casos_creados = 0
+        casos_existentes = 0
+        for i in range(0, len(df), batch_size):
+            batch = df.iloc[i:i+batch_size]
+            casos = self.huellas.asignar([caso_desde_fila(row) for row in batch.itertuples(index=False)])
+            self.registrar_huellas(casos)
             
-            # Progreso
-            self.stdout.write(f'Procesados: {i+len(batch)}/{len(df)} | Casos creados: {casos_creados} | Errores: {casos_error}')
+            # Se omiten los casos ya cargados (misma huella)
+            cargadas = set(Caso.objects.filter(
+                huella__in=[caso.huella for caso in casos]
+            ).values_list('huella', flat=True))
+            nuevos = [caso for caso in casos if caso.huella not in cargadas]
+            with transaction.atomic():
+                Caso.objects.bulk_create(nuevos, batch_size=batch_size)
+            
+            self.particiones.update((caso.zoonosis_id, caso.anio) for caso in nuevos)
+            casos_creados += len(nuevos)
+            casos_existentes += len(casos) - len(nuevos)
         
-        self.stdout.write(self.style.SUCCESS(f'\n=== CARGA COMPLETADA ==='))
-        self.stdout.write(self.style.SUCCESS(f'Total casos creados: {casos_creados}'))
-        self.stdout.write(self.style.SUCCESS(f'Total errores: {casos_error}'))
-        self.stdout.write(self.style.SUCCESS(f'Departamentos: {Departamento.objects.count()}'))
-        self.stdout.write(self.style.SUCCESS(f'Provincias: {Provincia.objects.count()}'))
-        self.stdout.write(self.style.SUCCESS(f'Distritos: {Distrito.objects.count()}'))
-        self.stdout.write(self.style.SUCCESS(f'Zoonosis: {TipoZoonosis.objects.count()}'))
\ No newline at end of file
+        return casos_creados, casos_existentes, casos_error
+    
+    def crear_tabla_huellas(self):
+        """Crea (vacía) la tabla temporal con las huellas del archivo"""
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLA_HUELLAS}')
+            cursor.execute(f'CREATE TEMP TABLE {TABLA_HUELLAS} (huella VARCHAR(40) PRIMARY KEY)')
+    
+    def registrar_huellas(self, casos):
+        """Anota las particiones y, si se eliminan ausentes, las huellas de los casos leídos del archivo"""
+        self.particiones_archivo.update((caso.zoonosis_id, caso.anio) for caso in casos)
+        if self.eliminar and casos:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO {TABLA_HUELLAS} (huella) VALUES (%s)', [(caso.huella,) for caso in casos]
+                )
+    
+    def eliminar_ausentes(self):
+        """Borra los casos con huella de las particiones zoonosis × año del archivo que no aparecen en él
+
+        Cada partición se compara contra la tabla temporal de huellas, así que
+        la memoria no depende del tamaño del archivo. Las zoonosis y años que
+        no están en el archivo no se tocan.
+        """
+        en_archivo = RawSQL(f'SELECT huella FROM {TABLA_HUELLAS}', [])
+        
+        casos_eliminados = 0
+        for zoonosis_id, anio in sorted(self.particiones_archivo):
+            with transaction.atomic():
+                eliminados, _ = Caso.objects.filter(
+                    zoonosis_id=zoonosis_id, anio=anio, huella__isnull=False
+                ).exclude(huella__in=en_archivo).delete()
+            if eliminados:
+                self.particiones.add((zoonosis_id, anio))
+                casos_eliminados += eliminados
+        
+        return casos_eliminados
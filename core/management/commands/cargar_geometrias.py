@@ -0,0 +1,121 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.models import Departamento, Provincia, Distrito, GeometriaLimite
+from core.geometrias import TOLERANCIAS, codigos_inei, normalizar_nombre, simplificar_geometria, feature_compacto
+from core.cache_api import incrementar_version
+
+
+class Command(BaseCommand):
+    help = 'Precalcula geometrías simplificadas de límites a partir de un archivo GeoJSON local'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('geojson_path', type=str, help='Ruta al archivo GeoJSON (FeatureCollection)')
+        parser.add_argument('--nivel', choices=['departamento', 'provincia', 'distrito'], required=True)
+        parser.add_argument('--campo-ubigeo', default='ubigeo', help='Propiedad con el código ubigeo')
+        parser.add_argument('--campo-nombre', default='nombre', help='Propiedad con el nombre de la unidad')
+        parser.add_argument(
+            '--campo-departamento', default='departamento',
+            help='Propiedad con el nombre del departamento (nivel provincia)'
+        )
+        parser.add_argument(
+            '--tolerancias', default=None,
+            help='Tolerancias en grados, p. ej. "alta=0.001,media=0.005,baja=0.02"'
+        )
+    
+    def handle(self, *args, **kwargs):
+        nivel = kwargs['nivel']
+        campo_ubigeo = kwargs['campo_ubigeo']
+        campo_nombre = kwargs['campo_nombre']
+        campo_departamento = kwargs['campo_departamento']
+        
+        tolerancias = dict(TOLERANCIAS)
+        if kwargs['tolerancias']:
+            try:
+                for par in kwargs['tolerancias'].split(','):
+                    resolucion, valor = par.split('=')
+                    if resolucion.strip() not in TOLERANCIAS:
+                        raise ValueError(resolucion)
+                    tolerancias[resolucion.strip()] = float(valor)
+            except ValueError:
+                raise CommandError('Formato de tolerancias no válido')
+        
+        with open(kwargs['geojson_path'], encoding='utf-8') as archivo:
+            coleccion = json.load(archivo)
+        features = coleccion.get('features', [])
+        self.stdout.write(f'Features leídos: {len(features)}')
+        
+        # Unidades registradas: código -> (código, nombre, código del padre)
+        por_nombre = {}
+        if nivel == 'departamento':
+            filas = Departamento.objects.values_list('codigo_ubigeo', 'nombre')
+            unidades = {codigo: (codigo, nombre, '') for codigo, nombre in filas}
+            por_nombre = {normalizar_nombre(nombre): unidades[codigo] for codigo, nombre in filas}
+        elif nivel == 'provincia':
+            filas = Provincia.objects.values_list(
+                'codigo_ubigeo', 'nombre', 'departamento__codigo_ubigeo', 'departamento__nombre'
+            )
+            unidades = {codigo: (codigo, nombre, padre) for codigo, nombre, padre, _ in filas}
+            # Hay provincias con el mismo nombre en distintos departamentos
+            por_nombre = {
+                (normalizar_nombre(departamento), normalizar_nombre(nombre)): unidades[codigo]
+                for codigo, nombre, _, departamento in filas
+            }
+        else:
+            filas = Distrito.objects.values_list('codigo_ubigeo', 'nombre', 'provincia__codigo_ubigeo')
+            unidades = {codigo: (codigo, nombre, padre) for codigo, nombre, padre in filas}
+        # Los códigos de departamentos y provincias no son los del INEI: se busca primero por nombre
+        # y, si no coincide, por el ubigeo del INEI deducido de sus distritos
+        codigos = codigos_inei(Distrito.objects.values_list(
+            'codigo_ubigeo', 'provincia__codigo_ubigeo', 'provincia__departamento__codigo_ubigeo'
+        ))[nivel]
+        
+        geometrias = []
+        ignorados = 0
+        vertices_originales = 0
+        vertices_por_resolucion = dict.fromkeys(tolerancias, 0)
+        for feature in features:
+            propiedades = feature.get('properties') or {}
+            ubigeo = str(propiedades.get(campo_ubigeo, '')).strip().ljust(6, '0')
+            clave = normalizar_nombre(propiedades.get(campo_nombre, ''))
+            if nivel == 'provincia':
+                clave = (normalizar_nombre(propiedades.get(campo_departamento, '')), clave)
+            unidad = por_nombre.get(clave) or unidades.get(codigos.get(ubigeo))
+            if unidad is None or not feature.get('geometry'):
+                ignorados += 1
+                if ignorados <= 10:
+                    self.stdout.write(self.style.WARNING(f'Unidad no encontrada: {ubigeo} {propiedades.get(campo_nombre, "")}'))
+                continue
+            
+            codigo, nombre, padre = unidad
+            vertices_originales += _contar_vertices(feature['geometry'])
+            for resolucion, tolerancia in tolerancias.items():
+                geometria, vertices = simplificar_geometria(feature['geometry'], tolerancia)
+                vertices_por_resolucion[resolucion] += vertices
+                geometrias.append(GeometriaLimite(
+                    nivel=nivel,
+                    codigo_ubigeo=codigo,
+                    codigo_padre=padre,
+                    nombre=nombre,
+                    resolucion=resolucion,
+                    feature=feature_compacto(geometria, codigo, nombre),
+                    num_vertices=vertices,
+                ))
+        
+        with transaction.atomic():
+            GeometriaLimite.objects.filter(nivel=nivel).delete()
+            GeometriaLimite.objects.bulk_create(geometrias, batch_size=500)
+        # Las URLs de geometrías incluyen la versión de datos
+        incrementar_version()
+        
+        self.stdout.write(f'Features ignorados: {ignorados}')
+        self.stdout.write(f'Vértices originales: {vertices_originales}')
+        for resolucion, vertices in vertices_por_resolucion.items():
+            self.stdout.write(f'Vértices resolución {resolucion} (tolerancia {tolerancias[resolucion]}): {vertices}')
+        self.stdout.write(self.style.SUCCESS(f'Geometrías guardadas: {len(geometrias)}'))
+
+
+def _contar_vertices(geometria):
+    if geometria['type'] == 'Polygon':
+        return sum(len(anillo) for anillo in geometria['coordinates'])
+    return sum(len(anillo) for poligono in geometria['coordinates'] for anillo in poligono)
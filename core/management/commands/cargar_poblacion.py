@@ -0,0 +1,95 @@
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.models import Departamento, Provincia, Distrito, Poblacion
+from core.agregados import reconstruir_incidencia
+from core.cache_api import incrementar_version
+from core.geometrias import codigos_inei
+
+
+class Command(BaseCommand):
+    help = 'Carga la población por departamento, provincia y distrito para cada año'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'csv_path', type=str,
+            help='CSV con columnas ubigeo, anio, poblacion y opcionalmente nivel (departamento/provincia/distrito)'
+        )
+    
+    def handle(self, *args, **kwargs):
+        csv_path = kwargs['csv_path']
+        
+        df = pd.read_csv(csv_path, dtype={'ubigeo': str, 'nivel': str}, encoding='utf-8')
+        faltantes = {'ubigeo', 'anio', 'poblacion'} - set(df.columns)
+        if faltantes:
+            raise CommandError(f'Columnas faltantes: {", ".join(sorted(faltantes))}')
+        
+        df = df.dropna(subset=['ubigeo', 'anio', 'poblacion'])
+        df['ubigeo'] = df['ubigeo'].str.strip().str.zfill(6)
+        df['anio'] = df['anio'].astype(int)
+        df['poblacion'] = df['poblacion'].astype(int)
+        self.stdout.write(f'Registros leídos: {len(df)}')
+        
+        # Jerarquía de códigos registrada en la base de datos
+        distrito_a_provincia = dict(Distrito.objects.values_list('codigo_ubigeo', 'provincia__codigo_ubigeo'))
+        provincia_a_departamento = dict(Provincia.objects.values_list('codigo_ubigeo', 'departamento__codigo_ubigeo'))
+        # Los códigos de provincias y departamentos no son los del INEI: se deducen de sus distritos
+        codigos = codigos_inei(Distrito.objects.values_list(
+            'codigo_ubigeo', 'provincia__codigo_ubigeo', 'provincia__departamento__codigo_ubigeo'
+        ))
+        
+        # Población explícita del archivo
+        poblaciones = {}
+        ignorados = 0
+        for row in df.itertuples(index=False):
+            nivel = getattr(row, 'nivel', None) if 'nivel' in df.columns else None
+            if not isinstance(nivel, str) or not nivel.strip():
+                nivel = next((n for n in ('distrito', 'provincia', 'departamento') if row.ubigeo in codigos[n]), None)
+            else:
+                nivel = nivel.strip().lower()
+            if nivel not in codigos or row.ubigeo not in codigos[nivel]:
+                ignorados += 1
+                if ignorados <= 10:
+                    self.stdout.write(self.style.WARNING(f'Ubigeo no encontrado: {row.ubigeo}'))
+                continue
+            poblaciones[(nivel, codigos[nivel][row.ubigeo], row.anio)] = row.poblacion
+        
+        # Completar provincias y departamentos sin dato sumando sus unidades
+        for nivel_hijo, nivel_padre, padre_de in (
+            ('distrito', 'provincia', distrito_a_provincia),
+            ('provincia', 'departamento', provincia_a_departamento),
+        ):
+            sumas = {}
+            for (nivel, codigo, anio), poblacion in poblaciones.items():
+                if nivel == nivel_hijo:
+                    clave = (nivel_padre, padre_de[codigo], anio)
+                    sumas[clave] = sumas.get(clave, 0) + poblacion
+            for clave, poblacion in sumas.items():
+                poblaciones.setdefault(clave, poblacion)
+        
+        anios = sorted({anio for _, _, anio in poblaciones})
+        with transaction.atomic():
+            Poblacion.objects.filter(anio__in=anios).delete()
+            Poblacion.objects.bulk_create([
+                Poblacion(nivel=nivel, codigo_ubigeo=codigo, anio=anio, poblacion=poblacion)
+                for (nivel, codigo, anio), poblacion in poblaciones.items()
+            ], batch_size=5000)
+            
+            # Departamento.poblacion guarda el dato del año más reciente
+            departamentos = list(Departamento.objects.all())
+            for departamento in departamentos:
+                ultimo = Poblacion.objects.filter(
+                    nivel='departamento', codigo_ubigeo=departamento.codigo_ubigeo
+                ).order_by('-anio').values_list('poblacion', flat=True).first()
+                departamento.poblacion = ultimo
+            Departamento.objects.bulk_update(departamentos, ['poblacion'])
+        
+        self.stdout.write(f'Registros ignorados: {ignorados}')
+        for nivel in ('departamento', 'provincia', 'distrito'):
+            total = sum(1 for clave in poblaciones if clave[0] == nivel)
+            self.stdout.write(f'Poblaciones de {nivel}: {total}')
+        
+        self.stdout.write('Recalculando tasas de incidencia...')
+        filas = reconstruir_incidencia()
+        incrementar_version()
+        self.stdout.write(self.style.SUCCESS(f'Filas de incidencia: {filas}'))
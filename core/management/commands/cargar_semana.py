@@ -0,0 +1,25 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from core.cargas import LoteInvalido, LoteRepetido, cargar_lote
+
+
+class Command(BaseCommand):
+    help = 'Agrega un lote semanal de notificaciones (CSV de MINSA) actualizando solo los agregados afectados'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', type=str, help='Ruta al CSV del lote semanal')
+    
+    def handle(self, *args, **kwargs):
+        csv_path = kwargs['csv_path']
+        try:
+            with open(csv_path, 'rb') as archivo:
+                resultado = cargar_lote(archivo, os.path.basename(csv_path))
+        except LoteRepetido as error:
+            raise CommandError(str(error))
+        except LoteInvalido as error:
+            for mensaje in error.errores:
+                self.stderr.write(mensaje)
+            raise CommandError(str(error))
+        
+        for nombre, valor in resultado.items():
+            self.stdout.write(self.style.SUCCESS(f'{nombre}: {valor}'))
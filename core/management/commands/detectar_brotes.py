@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from core.deteccion import detectar_brotes
+from core.cache_api import incrementar_version
+
+
+class Command(BaseCommand):
+    help = 'Evalúa con EARS (C1, C2, C3) y CUSUM las semanas nuevas de cada serie zoonosis × distrito'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--reiniciar', action='store_true',
+                            help='Descarta el estado y las alertas y evalúa toda la historia')
+    
+    def handle(self, *args, **kwargs):
+        inicio = time.time()
+        resultado = detectar_brotes(reiniciar=kwargs['reiniciar'])
+        duracion = time.time() - inicio
+        
+        if not resultado['semanas']:
+            self.stdout.write(self.style.WARNING('No hay semanas nuevas para evaluar'))
+            return
+        
+        incrementar_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Semanas evaluadas: {resultado['semanas']} | Series: {resultado['series']} | "
+            f"Alertas nuevas: {resultado['alertas']} ({duracion:.1f}s)"
+        ))
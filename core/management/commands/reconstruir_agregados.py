@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core.agregados import actualizar_agregados
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las tablas pre-agregadas usadas por los dashboards'
+    
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Recalculando agregados...')
+        resultado = actualizar_agregados()
+        for nombre, valor in resultado.items():
+            self.stdout.write(self.style.SUCCESS(f'{nombre}: {valor}'))
@@ -0,0 +1,205 @@
+"""Métricas por petición: consultas SQL, tiempo de base de datos, duración y tamaño de respuesta
+
+metricas_middleware mide cada petición y agrega la cabecera Server-Timing
+(bd, app y total) para verla en las herramientas del navegador. Las consultas
+se cuentan con un execute_wrapper instalado en cada conexión, así que también
+se miden las que corren en los hilos de vistas_async (copian el contexto de la
+petición). Las peticiones y consultas lentas se registran en el log y los
+histogramas por nombre de URL se publican en /metrics en el formato de texto
+de Prometheus. Los histogramas son de cada proceso. En las respuestas en flujo
+(exportaciones) solo se mide hasta que empieza el envío.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (le) de los histogramas
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+LIMITES_BYTES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# nombre -> (descripción, límites)
+HISTOGRAMAS = {
+    'zoonosight_peticion_segundos': ('Duración de las peticiones', LIMITES_SEGUNDOS),
+    'zoonosight_peticion_bd_segundos': ('Tiempo en la base de datos por petición', LIMITES_SEGUNDOS),
+    'zoonosight_peticion_consultas_sql': ('Consultas SQL por petición', LIMITES_CONSULTAS),
+    'zoonosight_respuesta_bytes': ('Tamaño de las respuestas (sin las de flujo)', LIMITES_BYTES),
+}
+
+# Nombre de URL de las peticiones que no resuelven a ninguna vista
+SIN_RUTA = 'sin_ruta'
+
+_medicion_actual = contextvars.ContextVar('medicion_actual', default=None)
+_lock = threading.Lock()
+# nombre -> {vista: [conteo por límite..., conteo sobre el último límite, suma]}
+_histogramas = {nombre: {} for nombre in HISTOGRAMAS}
+# (vista, estado) -> peticiones
+_peticiones = {}
+
+
+class Medicion:
+    """Consultas y tiempo de base de datos de una petición, compartida con los hilos que la atienden"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_bd = 0.0
+        self._lock = threading.Lock()
+
+    def registrar_consulta(self, duracion):
+        with self._lock:
+            self.consultas += 1
+            self.tiempo_bd += duracion
+
+
+def medir_consulta(execute, sql, params, many, context):
+    """execute_wrapper que suma cada consulta a la medición de la petición en curso"""
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracion = time.perf_counter() - inicio
+        medicion.registrar_consulta(duracion)
+        if duracion * 1000 >= settings.METRICAS_CONSULTA_LENTA_MS:
+            logger.warning(
+                'Consulta lenta (%.0f ms, %s): %s',
+                duracion * 1000, context['connection'].alias, sql[:1000],
+            )
+
+
+@receiver(connection_created)
+def instrumentar_conexion(sender, connection, **kwargs):
+    """Instala medir_consulta en cada conexión (una vez, aunque se vuelva a abrir)"""
+    if settings.METRICAS and medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(medir_consulta)
+
+
+def observar(nombre, vista, valor):
+    """Agrega un valor al histograma nombre de una vista"""
+    limites = HISTOGRAMAS[nombre][1]
+    with _lock:
+        serie = _histogramas[nombre].setdefault(vista, [0] * (len(limites) + 2))
+        serie[bisect.bisect_left(limites, valor)] += 1
+        serie[-1] += valor
+
+
+def _registrar(request, respuesta, medicion):
+    """Agrega Server-Timing, registra la petición en los histogramas y en el log si fue lenta"""
+    total = time.perf_counter() - medicion.inicio
+    tiempo_bd = medicion.tiempo_bd
+    respuesta['Server-Timing'] = (
+        f'bd;dur={tiempo_bd * 1000:.1f};desc="{medicion.consultas} consultas", '
+        f'app;dur={(total - tiempo_bd) * 1000:.1f}, total;dur={total * 1000:.1f}'
+    )
+    
+    coincidencia = request.resolver_match
+    vista = (coincidencia.url_name or coincidencia.view_name) if coincidencia else SIN_RUTA
+    if vista == 'metricas':
+        return respuesta
+    
+    observar('zoonosight_peticion_segundos', vista, total)
+    observar('zoonosight_peticion_bd_segundos', vista, tiempo_bd)
+    observar('zoonosight_peticion_consultas_sql', vista, medicion.consultas)
+    if not respuesta.streaming:
+        observar('zoonosight_respuesta_bytes', vista, len(respuesta.content))
+    with _lock:
+        clave = (vista, str(respuesta.status_code))
+        _peticiones[clave] = _peticiones.get(clave, 0) + 1
+    
+    if total * 1000 >= settings.METRICAS_PETICION_LENTA_MS:
+        logger.warning(
+            'Petición lenta: %s %s (%s) %.0f ms, %d consultas SQL en %.0f ms',
+            request.method, request.get_full_path(), vista, total * 1000, medicion.consultas, tiempo_bd * 1000,
+        )
+    return respuesta
+
+
+@sync_and_async_middleware
+def metricas_middleware(get_response):
+    """Mide cada petición (consultas SQL, tiempo en la base, duración y tamaño de respuesta)"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            medicion = Medicion()
+            token = _medicion_actual.set(medicion)
+            try:
+                respuesta = await get_response(request)
+            finally:
+                _medicion_actual.reset(token)
+            return _registrar(request, respuesta, medicion)
+    else:
+        def middleware(request):
+            medicion = Medicion()
+            token = _medicion_actual.set(medicion)
+            try:
+                respuesta = get_response(request)
+            finally:
+                _medicion_actual.reset(token)
+            return _registrar(request, respuesta, medicion)
+    
+    return middleware
+
+
+def _etiquetas(**valores):
+    texto = ','.join(
+        '{}="{}"'.format(nombre, str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for nombre, valor in valores.items()
+    )
+    return '{' + texto + '}'
+
+
+def exposicion():
+    """Métricas acumuladas en el formato de texto de Prometheus"""
+    with _lock:
+        histogramas = {nombre: {vista: list(serie) for vista, serie in series.items()}
+                       for nombre, series in _histogramas.items()}
+        peticiones = dict(_peticiones)
+    
+    lineas = [
+        '# HELP zoonosight_peticiones_total Peticiones atendidas por vista y código de estado',
+        '# TYPE zoonosight_peticiones_total counter',
+    ]
+    for (vista, estado), cantidad in sorted(peticiones.items()):
+        lineas.append(f'zoonosight_peticiones_total{_etiquetas(vista=vista, estado=estado)} {cantidad}')
+    
+    for nombre, (descripcion, limites) in HISTOGRAMAS.items():
+        lineas += [f'# HELP {nombre} {descripcion}', f'# TYPE {nombre} histogram']
+        for vista, serie in sorted(histogramas[nombre].items()):
+            acumulado = 0
+            for limite, conteo in zip(limites, serie):
+                acumulado += conteo
+                lineas.append(f'{nombre}_bucket{_etiquetas(vista=vista, le=limite)} {acumulado}')
+            total = acumulado + serie[-2]
+            lineas += [
+                f'{nombre}_bucket{_etiquetas(vista=vista, le="+Inf")} {total}',
+                f'{nombre}_sum{_etiquetas(vista=vista)} {serie[-1]!r}',
+                f'{nombre}_count{_etiquetas(vista=vista)} {total}',
+            ]
+    return '\n'.join(lineas) + '\n'
+
+
+def vista_metricas(request):
+    """Endpoint /metrics para Prometheus (con METRICAS_TOKEN exige 'Authorization: Bearer <token>')
+
+    Con METRICAS_EXIGE_TOKEN (perfil de producción) y sin token definido no se publica.
+    """
+    if settings.METRICAS_TOKEN:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {settings.METRICAS_TOKEN}'):
+            return JsonResponse({'error': 'No autorizado'}, status=403)
+    elif settings.METRICAS_EXIGE_TOKEN:
+        return JsonResponse({'error': 'Métricas no disponibles: defina METRICAS_TOKEN'}, status=403)
+    return HttpResponse(exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')
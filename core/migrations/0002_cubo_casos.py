@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-17 18:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CuboCasos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio', models.IntegerField()),
+                ('semana_epidemiologica', models.IntegerField()),
+                ('tipo_diagnostico', models.CharField(choices=[('P', 'Presuntivo'), ('C', 'Confirmado')], max_length=1)),
+                ('total', models.IntegerField()),
+                ('departamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.departamento')),
+                ('distrito', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.distrito')),
+                ('provincia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.provincia')),
+                ('zoonosis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.tipozoonosis')),
+            ],
+            options={
+                'verbose_name': 'Celda del cubo de casos',
+                'verbose_name_plural': 'Cubo de casos',
+                'db_table': 'cubo_casos',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='cubocasos',
+            index=models.Index(fields=['zoonosis', 'anio'], name='cubo_casos_zoonosi_e699e6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cubocasos',
+            index=models.Index(fields=['zoonosis', 'departamento', 'anio'], name='cubo_casos_zoonosi_4bb799_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cubocasos',
+            unique_together={('zoonosis', 'distrito', 'anio', 'semana_epidemiologica', 'tipo_diagnostico')},
+        ),
+    ]
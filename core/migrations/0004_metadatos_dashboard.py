@@ -0,0 +1,26 @@
+# Generated by Django 4.2 on 2026-10-17 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_version_datos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetadatosDashboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datos', models.JSONField(default=dict)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Metadatos de dashboards',
+                'verbose_name_plural': 'Metadatos de dashboards',
+                'db_table': 'metadatos_dashboard',
+            },
+        ),
+    ]
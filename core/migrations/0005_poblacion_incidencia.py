@@ -0,0 +1,59 @@
+# Generated by Django 4.2 on 2026-10-17 19:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_metadatos_dashboard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Poblacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nivel', models.CharField(choices=[('nacional', 'Nacional'), ('departamento', 'Departamento'), ('provincia', 'Provincia'), ('distrito', 'Distrito')], max_length=12)),
+                ('codigo_ubigeo', models.CharField(max_length=6)),
+                ('anio', models.IntegerField()),
+                ('poblacion', models.IntegerField()),
+            ],
+            options={
+                'verbose_name': 'Población',
+                'verbose_name_plural': 'Poblaciones',
+                'db_table': 'poblacion',
+                'ordering': ['nivel', 'codigo_ubigeo', 'anio'],
+                'unique_together': {('nivel', 'codigo_ubigeo', 'anio')},
+            },
+        ),
+        migrations.CreateModel(
+            name='IncidenciaAnual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nivel', models.CharField(choices=[('nacional', 'Nacional'), ('departamento', 'Departamento'), ('provincia', 'Provincia'), ('distrito', 'Distrito')], max_length=12)),
+                ('codigo_ubigeo', models.CharField(max_length=6)),
+                ('nombre', models.CharField(max_length=100)),
+                ('codigo_padre', models.CharField(blank=True, default='', max_length=6)),
+                ('anio', models.IntegerField()),
+                ('casos', models.IntegerField()),
+                ('poblacion', models.IntegerField(blank=True, null=True)),
+                ('tasa_100k', models.FloatField(blank=True, null=True)),
+                ('zoonosis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.tipozoonosis')),
+            ],
+            options={
+                'verbose_name': 'Incidencia anual',
+                'verbose_name_plural': 'Incidencias anuales',
+                'db_table': 'incidencia_anual',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='incidenciaanual',
+            index=models.Index(fields=['zoonosis', 'anio', 'nivel'], name='incidencia__zoonosi_086b9a_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='incidenciaanual',
+            unique_together={('zoonosis', 'nivel', 'codigo_ubigeo', 'anio')},
+        ),
+    ]
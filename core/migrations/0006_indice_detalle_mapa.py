@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-17 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_poblacion_incidencia'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='incidenciaanual',
+            name='incidencia__zoonosi_086b9a_idx',
+        ),
+        migrations.AddIndex(
+            model_name='incidenciaanual',
+            index=models.Index(fields=['zoonosis', 'anio', 'nivel', 'codigo_padre'], name='incidencia__zoonosi_6ce90b_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-17 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_indice_detalle_mapa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeometriaLimite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nivel', models.CharField(choices=[('nacional', 'Nacional'), ('departamento', 'Departamento'), ('provincia', 'Provincia'), ('distrito', 'Distrito')], max_length=12)),
+                ('codigo_ubigeo', models.CharField(max_length=6)),
+                ('codigo_padre', models.CharField(blank=True, default='', max_length=6)),
+                ('nombre', models.CharField(max_length=100)),
+                ('resolucion', models.CharField(choices=[('alta', 'Alta'), ('media', 'Media'), ('baja', 'Baja')], max_length=5)),
+                ('feature', models.TextField()),
+                ('num_vertices', models.IntegerField()),
+            ],
+            options={
+                'verbose_name': 'Geometría de límite',
+                'verbose_name_plural': 'Geometrías de límites',
+                'db_table': 'geometria_limite',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='geometrialimite',
+            index=models.Index(fields=['nivel', 'resolucion', 'codigo_padre'], name='geometria_l_nivel_5ac1a1_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='geometrialimite',
+            unique_together={('nivel', 'codigo_ubigeo', 'resolucion')},
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-17 19:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_geometria_limite'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CanalEndemico',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nivel', models.CharField(choices=[('nacional', 'Nacional'), ('departamento', 'Departamento'), ('provincia', 'Provincia'), ('distrito', 'Distrito')], max_length=12)),
+                ('codigo_ubigeo', models.CharField(max_length=6)),
+                ('anio', models.IntegerField()),
+                ('semana_epidemiologica', models.IntegerField()),
+                ('casos', models.IntegerField()),
+                ('percentil_25', models.FloatField(null=True)),
+                ('mediana', models.FloatField(null=True)),
+                ('percentil_75', models.FloatField(null=True)),
+                ('media', models.FloatField(null=True)),
+                ('limite_superior', models.FloatField(null=True)),
+                ('anios_base', models.IntegerField()),
+                ('zoonosis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.tipozoonosis')),
+            ],
+            options={
+                'verbose_name': 'Canal endémico',
+                'verbose_name_plural': 'Canales endémicos',
+                'db_table': 'canal_endemico',
+                'unique_together': {('zoonosis', 'nivel', 'codigo_ubigeo', 'anio', 'semana_epidemiologica')},
+            },
+        ),
+    ]
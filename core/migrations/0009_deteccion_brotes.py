@@ -0,0 +1,61 @@
+# Generated by Django 4.2 on 2026-10-17 19:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_canal_endemico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Alerta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio', models.IntegerField()),
+                ('semana_epidemiologica', models.IntegerField()),
+                ('metodo', models.CharField(choices=[('C1', 'EARS C1'), ('C2', 'EARS C2'), ('C3', 'EARS C3'), ('CUSUM', 'CUSUM')], max_length=5)),
+                ('casos', models.IntegerField()),
+                ('esperado', models.FloatField()),
+                ('estadistico', models.FloatField()),
+                ('umbral', models.FloatField()),
+                ('fecha_deteccion', models.DateTimeField(auto_now_add=True)),
+                ('distrito', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas', to='core.distrito')),
+                ('zoonosis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas', to='core.tipozoonosis')),
+            ],
+            options={
+                'verbose_name': 'Alerta',
+                'verbose_name_plural': 'Alertas',
+                'db_table': 'alertas',
+            },
+        ),
+        migrations.CreateModel(
+            name='EstadoSerie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio', models.IntegerField()),
+                ('semana_epidemiologica', models.IntegerField()),
+                ('ventana', models.JSONField()),
+                ('cusum', models.FloatField(default=0)),
+                ('distrito', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.distrito')),
+                ('zoonosis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.tipozoonosis')),
+            ],
+            options={
+                'verbose_name': 'Estado de serie',
+                'verbose_name_plural': 'Estados de series',
+                'db_table': 'estado_serie',
+                'unique_together': {('zoonosis', 'distrito')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(fields=['anio', 'semana_epidemiologica'], name='alertas_anio_40321a_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='alerta',
+            unique_together={('zoonosis', 'distrito', 'anio', 'semana_epidemiologica', 'metodo')},
+        ),
+    ]
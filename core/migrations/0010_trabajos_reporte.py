@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-17 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_deteccion_brotes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoReporte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=20)),
+                ('parametros', models.JSONField()),
+                ('huella', models.CharField(db_index=True, max_length=40)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=10)),
+                ('progreso', models.IntegerField(default=0)),
+                ('mensaje', models.TextField(blank=True, default='')),
+                ('archivo', models.FileField(blank=True, upload_to='reportes/')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Trabajo de reporte',
+                'verbose_name_plural': 'Trabajos de reporte',
+                'db_table': 'trabajos_reporte',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-17 19:27
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def rellenar_geografia(apps, schema_editor):
+    """Copia en cada caso la provincia y el departamento de su distrito"""
+    Caso = apps.get_model('core', 'Caso')
+    Distrito = apps.get_model('core', 'Distrito')
+    alias = schema_editor.connection.alias
+    distrito = Distrito.objects.using(alias).filter(pk=OuterRef('distrito_id'))
+    Caso.objects.using(alias).update(
+        provincia_id=Subquery(distrito.values('provincia_id')[:1]),
+        departamento_id=Subquery(distrito.values('provincia__departamento_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_trabajos_reporte'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='caso',
+            name='departamento',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.departamento'),
+        ),
+        migrations.AddField(
+            model_name='caso',
+            name='provincia',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.provincia'),
+        ),
+        migrations.RunPython(rellenar_geografia, migrations.RunPython.noop),
+    ]
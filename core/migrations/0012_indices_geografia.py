@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-17 19:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_geografia_caso'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='caso',
+            name='caso_zoonosi_14e10e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='cubocasos',
+            name='cubo_casos_zoonosi_e699e6_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='cubocasos',
+            name='cubo_casos_zoonosi_4bb799_idx',
+        ),
+        migrations.AlterField(
+            model_name='caso',
+            name='departamento',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.departamento'),
+        ),
+        migrations.AlterField(
+            model_name='caso',
+            name='provincia',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.provincia'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['zoonosis', 'anio', 'departamento'], name='caso_zoonosi_3ccf2e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['zoonosis', 'departamento', 'anio', 'semana_epidemiologica'], name='caso_zoonosi_d1f909_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cubocasos',
+            index=models.Index(fields=['zoonosis', 'anio', 'semana_epidemiologica', 'total'], name='cubo_casos_zoonosi_0b22ed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cubocasos',
+            index=models.Index(fields=['zoonosis', 'departamento', 'anio', 'semana_epidemiologica', 'total'], name='cubo_casos_zoonosi_fe423a_idx'),
+        ),
+    ]
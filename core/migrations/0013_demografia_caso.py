@@ -0,0 +1,78 @@
+# Generated by Django 4.2 on 2026-10-17 19:29
+
+from django.db import migrations, models
+from django.db.models import Case, OuterRef, Subquery, Value, When
+import django.db.models.deletion
+
+# Edad máxima de cada grupo etario salvo el último (0 Infancia, 1 Adolescencia, 2 Adulto),
+# en la unidad de tipo_edad y en años cumplidos: 5, 17 y 64 años
+LIMITES_GRUPOS = {
+    'A': [5, 17, 64],
+    'M': [71, 215, 779],
+    'D': [2191, 6574, 23741],
+}
+
+
+def copiar_demografia(apps, schema_editor):
+    """Copia edad, tipo de edad y sexo del paciente a cada caso y calcula su grupo etario"""
+    Caso = apps.get_model('core', 'Caso')
+    Paciente = apps.get_model('core', 'Paciente')
+    alias = schema_editor.connection.alias
+    paciente = Paciente.objects.using(alias).filter(pk=OuterRef('paciente_id'))
+    casos = Caso.objects.using(alias).filter(paciente__isnull=False)
+    casos.update(
+        edad=Subquery(paciente.values('edad')[:1]),
+        tipo_edad=Subquery(paciente.values('tipo_edad')[:1]),
+        sexo=Subquery(paciente.values('genero')[:1]),
+    )
+    
+    condiciones = []
+    for tipo_edad, limites in LIMITES_GRUPOS.items():
+        for codigo, limite in enumerate(limites):
+            condiciones.append(When(tipo_edad=tipo_edad, edad__range=(0, limite), then=Value(codigo)))
+        condiciones.append(When(tipo_edad=tipo_edad, edad__gte=0, then=Value(len(limites))))
+    casos.update(grupo_etario=Case(*condiciones, default=None))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_indices_geografia'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='caso',
+            name='caso_zoonosi_3ccf2e_idx',
+        ),
+        migrations.AddField(
+            model_name='caso',
+            name='edad',
+            field=models.SmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='caso',
+            name='grupo_etario',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Infancia'), (1, 'Adolescencia'), (2, 'Adulto'), (3, 'Adulto Mayor')], null=True),
+        ),
+        migrations.AddField(
+            model_name='caso',
+            name='sexo',
+            field=models.CharField(choices=[('M', 'Masculino'), ('F', 'Femenino')], max_length=1, null=True),
+        ),
+        migrations.AddField(
+            model_name='caso',
+            name='tipo_edad',
+            field=models.CharField(choices=[('A', 'Años'), ('M', 'Meses'), ('D', 'Días')], max_length=1, null=True),
+        ),
+        migrations.AlterField(
+            model_name='caso',
+            name='paciente',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='casos', to='core.paciente'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['zoonosis', 'anio', 'departamento', 'grupo_etario', 'sexo'], name='caso_zoonosi_e8306a_idx'),
+        ),
+        migrations.RunPython(copiar_demografia, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def eliminar_pacientes_copiados(apps, schema_editor):
+    """Desvincula y borra los pacientes sin más datos que los ya copiados en su caso"""
+    Caso = apps.get_model('core', 'Caso')
+    Paciente = apps.get_model('core', 'Paciente')
+    alias = schema_editor.connection.alias
+    copiados = Paciente.objects.using(alias).filter(ocupacion__isnull=True, zona_residencia__isnull=True)
+    Caso.objects.using(alias).filter(paciente__in=copiados).update(paciente=None)
+    # Borrado directo: el ORM cargaría cada paciente para revisar la cascada hacia caso
+    schema_editor.execute(
+        f'DELETE FROM {schema_editor.quote_name(Paciente._meta.db_table)} '
+        'WHERE ocupacion IS NULL AND zona_residencia IS NULL'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_demografia_caso'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_pacientes_copiados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+import hashlib
+from collections import Counter
+from django.db import migrations, models
+
+# Copia de core.ingesta al crear la migración: sus cambios posteriores no deben alterarla
+CAMPOS_HUELLA = [
+    'zoonosis_id', 'distrito_id', 'anio', 'semana_epidemiologica', 'edad', 'tipo_edad', 'sexo',
+    'codigo_diagnostico', 'tipo_diagnostico', 'codigo_diresa',
+]
+
+
+class Huellas:
+    """sha1 del contenido de cada caso más las veces que ese contenido ya apareció"""
+
+    def __init__(self):
+        self.apariciones = Counter()
+
+    def asignar(self, casos):
+        for caso in casos:
+            contenido = '|'.join(
+                '' if valor is None else str(valor) for valor in (getattr(caso, campo) for campo in CAMPOS_HUELLA)
+            )
+            ocurrencia = self.apariciones[contenido]
+            self.apariciones[contenido] += 1
+            caso.huella = hashlib.sha1(f'{contenido}|{ocurrencia}'.encode()).hexdigest()
+        return casos
+
+
+def asignar_huellas(apps, schema_editor):
+    """Asigna huella a los casos existentes, en el orden en que se cargaron"""
+    Caso = apps.get_model('core', 'Caso')
+    casos = Caso.objects.using(schema_editor.connection.alias)
+    # Las cargas anteriores guardaban la DIRESA leída como número ('15.0')
+    for codigo in casos.filter(codigo_diresa__endswith='.0').values_list('codigo_diresa', flat=True).distinct():
+        casos.filter(codigo_diresa=codigo).update(codigo_diresa=codigo[:-2])
+    
+    huellas = Huellas()
+    lote = []
+    with schema_editor.connection.cursor() as cursor:
+        sql = f'UPDATE {schema_editor.quote_name(Caso._meta.db_table)} SET huella = %s WHERE id = %s'
+        for caso in casos.order_by('id').only('id', *CAMPOS_HUELLA).iterator(chunk_size=5000):
+            lote.append(caso)
+            if len(lote) >= 5000:
+                cursor.executemany(sql, [(c.huella, c.id) for c in huellas.asignar(lote)])
+                lote = []
+        if lote:
+            cursor.executemany(sql, [(c.huella, c.id) for c in huellas.asignar(lote)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_eliminar_pacientes'),
+    ]
+    
+    operations = [
+        migrations.AddField(
+            model_name='caso',
+            name='huella',
+            field=models.CharField(blank=True, max_length=40, null=True, unique=True),
+        ),
+        migrations.RunPython(asignar_huellas, migrations.RunPython.noop),
+    ]
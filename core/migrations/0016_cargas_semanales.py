@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-17 19:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0015_huella_caso'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaSemanal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('huella', models.CharField(max_length=40, unique=True)),
+                ('nombre_archivo', models.CharField(max_length=255)),
+                ('casos', models.PositiveIntegerField(default=0)),
+                ('semanas', models.JSONField(default=list)),
+                ('fecha_carga', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Carga semanal',
+                'verbose_name_plural': 'Cargas semanales',
+                'db_table': 'carga_semanal',
+                'ordering': ['-fecha_carga'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+
+def descartar_deteccion(apps, schema_editor):
+    # El estado anterior no tiene el CUSUM al cierre de cada año; detectar_brotes vuelve a evaluar toda la historia
+    apps.get_model('core', 'EstadoSerie').objects.all().delete()
+    apps.get_model('core', 'Alerta').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_cargas_semanales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estadoserie',
+            name='cusum_anual',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(descartar_deteccion, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-17 21:12
+
+from django.db import migrations, models
+
+
+def descartar_duplicados(apps, schema_editor):
+    # Deja un solo trabajo activo por huella (el más reciente) antes de crear la restricción
+    TrabajoReporte = apps.get_model('core', 'TrabajoReporte')
+    vistas = set()
+    for trabajo in TrabajoReporte.objects.filter(estado__in=['pendiente', 'en_proceso']).order_by('-fecha_creacion'):
+        if trabajo.huella in vistas:
+            trabajo.estado = 'error'
+            trabajo.mensaje = 'Trabajo duplicado'
+            trabajo.save(update_fields=['estado', 'mensaje'])
+        vistas.add(trabajo.huella)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_cusum_anual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoreporte',
+            name='latido',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(descartar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='trabajoreporte',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['pendiente', 'en_proceso'])), fields=('huella',), name='trabajo_activo_unico'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-17 23:40
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copiar_version(apps, schema_editor):
+    # Hasta ahora toda carga invalidaba todo: la versión base es la versión actual
+    apps.get_model('core', 'VersionDatos').objects.update(version_base=F('version'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_trabajo_activo_unico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estadoserie',
+            name='cusum_semanal',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='versiondatos',
+            name='version_base',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='versiondatos',
+            name='versiones_zoonosis',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(copiar_version, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import models
+from .epidemiologia import GRUPOS_ETARIOS, codigos_grupo_etario
 
 class Departamento(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
@@ -67,6 +69,12 @@ class TipoZoonosis(models.Model):
         return self.nombre
 
 
+def calcular_grupo_etario(edad, tipo_edad):
+    """Devuelve el grupo etario para una edad en años, meses o días (None si no es válida)"""
+    codigo = codigos_grupo_etario([edad], [tipo_edad])[0]
+    return GRUPOS_ETARIOS[codigo] if codigo >= 0 else None
+
+
 class Paciente(models.Model):
     TIPO_EDAD_CHOICES = [
         ('A', 'Años'),
@@ -96,15 +104,9 @@ class Paciente(models.Model):
     
     def save(self, *args, **kwargs):
         # Calcular grupo etario automáticamente
-        if self.tipo_edad == 'A':
-            if self.edad <= 5:
-                self.grupo_etario = 'Infancia'
-            elif self.edad <= 17:
-                self.grupo_etario = 'Adolescencia'
-            elif self.edad <= 64:
-                self.grupo_etario = 'Adulto'
-            else:
-                self.grupo_etario = 'Adulto Mayor'
+        grupo = calcular_grupo_etario(self.edad, self.tipo_edad)
+        if grupo:
+            self.grupo_etario = grupo
         super().save(*args, **kwargs)
 
 
@@ -122,7 +124,16 @@ class Caso(models.Model):
     
     zoonosis = models.ForeignKey(TipoZoonosis, on_delete=models.CASCADE, related_name='casos')
     distrito = models.ForeignKey(Distrito, on_delete=models.CASCADE, related_name='casos')
-    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='casos')
+    # Copias de la provincia y el departamento del distrito para filtrar y agrupar sin joins
+    provincia = models.ForeignKey(Provincia, on_delete=models.CASCADE, related_name='+')
+    departamento = models.ForeignKey(Departamento, on_delete=models.CASCADE, related_name='+')
+    # Solo en casos antiguos; los datos demográficos se guardan en el propio caso
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='casos', null=True, blank=True)
+    
+    edad = models.SmallIntegerField(null=True)
+    tipo_edad = models.CharField(max_length=1, choices=Paciente.TIPO_EDAD_CHOICES, null=True)
+    sexo = models.CharField(max_length=1, choices=Paciente.SEXO_CHOICES, null=True)
+    grupo_etario = models.PositiveSmallIntegerField(choices=list(enumerate(GRUPOS_ETARIOS)), null=True)
     
     fecha_notificacion = models.DateField()
     semana_epidemiologica = models.IntegerField()
@@ -133,6 +144,8 @@ class Caso(models.Model):
     estado_caso = models.CharField(max_length=50, choices=ESTADO_CHOICES, default='ACTIVO')
     
     codigo_diresa = models.CharField(max_length=10, null=True, blank=True)
+    # Identifica el registro del CSV de origen en las recargas (ver core/ingesta.py)
+    huella = models.CharField(max_length=40, unique=True, null=True, blank=True)
     
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
@@ -145,8 +158,299 @@ class Caso(models.Model):
         indexes = [
             models.Index(fields=['anio', 'semana_epidemiologica']),
             models.Index(fields=['anio']),
-            models.Index(fields=['zoonosis', 'anio']),
+            models.Index(fields=['zoonosis', 'anio', 'departamento', 'grupo_etario', 'sexo']),
+            models.Index(fields=['zoonosis', 'departamento', 'anio', 'semana_epidemiologica']),
         ]
     
     def __str__(self):
-        return f"Caso {self.id} - {self.zoonosis.nombre} - {self.anio}/S{self.semana_epidemiologica}"
\ No newline at end of file
+        return f"Caso {self.id} - {self.zoonosis.nombre} - {self.anio}/S{self.semana_epidemiologica}"
+
+class CuboCasos(models.Model):
+    """Conteo de casos pre-agregado por zoonosis, distrito, año, semana y tipo de diagnóstico"""
+    zoonosis = models.ForeignKey(TipoZoonosis, on_delete=models.CASCADE, related_name='+')
+    departamento = models.ForeignKey(Departamento, on_delete=models.CASCADE, related_name='+')
+    provincia = models.ForeignKey(Provincia, on_delete=models.CASCADE, related_name='+')
+    distrito = models.ForeignKey(Distrito, on_delete=models.CASCADE, related_name='+')
+    
+    anio = models.IntegerField()
+    semana_epidemiologica = models.IntegerField()
+    tipo_diagnostico = models.CharField(max_length=1, choices=Caso.TIPO_DX_CHOICES)
+    
+    total = models.IntegerField()
+    
+    class Meta:
+        db_table = 'cubo_casos'
+        verbose_name = 'Celda del cubo de casos'
+        verbose_name_plural = 'Cubo de casos'
+        unique_together = ['zoonosis', 'distrito', 'anio', 'semana_epidemiologica', 'tipo_diagnostico']
+        # Incluyen semana y total para que las agregaciones de las APIs se resuelvan solo con el índice
+        indexes = [
+            models.Index(fields=['zoonosis', 'anio', 'semana_epidemiologica', 'total']),
+            models.Index(fields=['zoonosis', 'departamento', 'anio', 'semana_epidemiologica', 'total']),
+        ]
+    
+    def __str__(self):
+        return f"{self.zoonosis_id} - {self.distrito_id} - {self.anio}/S{self.semana_epidemiologica}: {self.total}"
+
+
+class VersionDatos(models.Model):
+    """Contador de versión de los datos (fila única), incrementado en cada carga"""
+    version = models.PositiveIntegerField(default=0)
+    # Versión en que se invalidó todo y, por zoonosis ({"3": 12, ...}), versión de su último cambio
+    version_base = models.PositiveIntegerField(default=0)
+    versiones_zoonosis = models.JSONField(default=dict)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'version_datos'
+        verbose_name = 'Versión de datos'
+        verbose_name_plural = 'Versión de datos'
+    
+    def __str__(self):
+        return f"Versión {self.version} - {self.fecha_actualizacion}"
+
+
+class MetadatosDashboard(models.Model):
+    """Instantánea de años, zoonosis y departamentos para los filtros de los dashboards (fila única)"""
+    datos = models.JSONField(default=dict)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'metadatos_dashboard'
+        verbose_name = 'Metadatos de dashboards'
+        verbose_name_plural = 'Metadatos de dashboards'
+    
+    def __str__(self):
+        return f"Metadatos - {self.fecha_actualizacion}"
+
+
+NIVEL_GEOGRAFICO_CHOICES = [
+    ('nacional', 'Nacional'),
+    ('departamento', 'Departamento'),
+    ('provincia', 'Provincia'),
+    ('distrito', 'Distrito'),
+]
+
+
+class Poblacion(models.Model):
+    """Población de una unidad geográfica en un año"""
+    nivel = models.CharField(max_length=12, choices=NIVEL_GEOGRAFICO_CHOICES)
+    codigo_ubigeo = models.CharField(max_length=6)
+    anio = models.IntegerField()
+    poblacion = models.IntegerField()
+    
+    class Meta:
+        db_table = 'poblacion'
+        verbose_name = 'Población'
+        verbose_name_plural = 'Poblaciones'
+        ordering = ['nivel', 'codigo_ubigeo', 'anio']
+        unique_together = ['nivel', 'codigo_ubigeo', 'anio']
+    
+    def __str__(self):
+        return f"{self.nivel} {self.codigo_ubigeo} - {self.anio}: {self.poblacion}"
+
+
+class IncidenciaAnual(models.Model):
+    """Casos y tasa de incidencia por 100 000 habitantes por zoonosis, unidad geográfica y año"""
+    zoonosis = models.ForeignKey(TipoZoonosis, on_delete=models.CASCADE, related_name='+')
+    nivel = models.CharField(max_length=12, choices=NIVEL_GEOGRAFICO_CHOICES)
+    codigo_ubigeo = models.CharField(max_length=6)
+    nombre = models.CharField(max_length=100)
+    codigo_padre = models.CharField(max_length=6, blank=True, default='')
+    anio = models.IntegerField()
+    
+    casos = models.IntegerField()
+    poblacion = models.IntegerField(null=True, blank=True)
+    tasa_100k = models.FloatField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'incidencia_anual'
+        verbose_name = 'Incidencia anual'
+        verbose_name_plural = 'Incidencias anuales'
+        unique_together = ['zoonosis', 'nivel', 'codigo_ubigeo', 'anio']
+        indexes = [
+            models.Index(fields=['zoonosis', 'anio', 'nivel', 'codigo_padre']),
+        ]
+    
+    def __str__(self):
+        return f"{self.zoonosis_id} - {self.nombre} - {self.anio}: {self.casos}"
+
+
+class GeometriaLimite(models.Model):
+    """Límite simplificado de una unidad geográfica, como Feature GeoJSON compacto, para una resolución"""
+    RESOLUCION_CHOICES = [
+        ('alta', 'Alta'),
+        ('media', 'Media'),
+        ('baja', 'Baja'),
+    ]
+    
+    nivel = models.CharField(max_length=12, choices=NIVEL_GEOGRAFICO_CHOICES)
+    codigo_ubigeo = models.CharField(max_length=6)
+    codigo_padre = models.CharField(max_length=6, blank=True, default='')
+    nombre = models.CharField(max_length=100)
+    resolucion = models.CharField(max_length=5, choices=RESOLUCION_CHOICES)
+    
+    feature = models.TextField()
+    num_vertices = models.IntegerField()
+    
+    class Meta:
+        db_table = 'geometria_limite'
+        verbose_name = 'Geometría de límite'
+        verbose_name_plural = 'Geometrías de límites'
+        unique_together = ['nivel', 'codigo_ubigeo', 'resolucion']
+        indexes = [
+            models.Index(fields=['nivel', 'resolucion', 'codigo_padre']),
+        ]
+    
+    def __str__(self):
+        return f"{self.nombre} ({self.nivel}, {self.resolucion})"
+
+
+class CanalEndemico(models.Model):
+    """Canal endémico semanal (cuartiles y media + 2 DE de los años anteriores) por zoonosis, unidad geográfica y año"""
+    zoonosis = models.ForeignKey(TipoZoonosis, on_delete=models.CASCADE, related_name='+')
+    nivel = models.CharField(max_length=12, choices=NIVEL_GEOGRAFICO_CHOICES)
+    codigo_ubigeo = models.CharField(max_length=6)
+    anio = models.IntegerField()
+    semana_epidemiologica = models.IntegerField()
+    
+    casos = models.IntegerField()
+    percentil_25 = models.FloatField(null=True)
+    mediana = models.FloatField(null=True)
+    percentil_75 = models.FloatField(null=True)
+    media = models.FloatField(null=True)
+    limite_superior = models.FloatField(null=True)  # media + 2 DE
+    
+    anios_base = models.IntegerField()
+    
+    class Meta:
+        db_table = 'canal_endemico'
+        verbose_name = 'Canal endémico'
+        verbose_name_plural = 'Canales endémicos'
+        unique_together = ['zoonosis', 'nivel', 'codigo_ubigeo', 'anio', 'semana_epidemiologica']
+    
+    def __str__(self):
+        return f"{self.zoonosis_id} - {self.nivel} {self.codigo_ubigeo} - {self.anio}/S{self.semana_epidemiologica}"
+
+
+class EstadoSerie(models.Model):
+    """Estado acumulado de la detección de brotes de una serie zoonosis × distrito"""
+    zoonosis = models.ForeignKey(TipoZoonosis, on_delete=models.CASCADE, related_name='+')
+    distrito = models.ForeignKey(Distrito, on_delete=models.CASCADE, related_name='+')
+    
+    # Última semana evaluada y casos de las semanas anteriores que necesitan los estadísticos
+    anio = models.IntegerField()
+    semana_epidemiologica = models.IntegerField()
+    ventana = models.JSONField()
+    cusum = models.FloatField(default=0)
+    # CUSUM al cierre de cada año evaluado ({"2023": 1.5, ...}), para volver a evaluar desde un año
+    cusum_anual = models.JSONField(default=dict)
+    # CUSUM de las últimas semanas evaluadas (la última es la de anio/semana_epidemiologica)
+    cusum_semanal = models.JSONField(default=list)
+    
+    class Meta:
+        db_table = 'estado_serie'
+        verbose_name = 'Estado de serie'
+        verbose_name_plural = 'Estados de series'
+        unique_together = ['zoonosis', 'distrito']
+    
+    def __str__(self):
+        return f"{self.zoonosis_id} - {self.distrito_id} ({self.anio}/S{self.semana_epidemiologica})"
+
+
+class Alerta(models.Model):
+    """Semana con casos inusuales en un distrito según EARS (C1, C2, C3) o CUSUM"""
+    METODO_CHOICES = [
+        ('C1', 'EARS C1'),
+        ('C2', 'EARS C2'),
+        ('C3', 'EARS C3'),
+        ('CUSUM', 'CUSUM'),
+    ]
+    
+    zoonosis = models.ForeignKey(TipoZoonosis, on_delete=models.CASCADE, related_name='alertas')
+    distrito = models.ForeignKey(Distrito, on_delete=models.CASCADE, related_name='alertas')
+    anio = models.IntegerField()
+    semana_epidemiologica = models.IntegerField()
+    metodo = models.CharField(max_length=5, choices=METODO_CHOICES)
+    
+    casos = models.IntegerField()
+    esperado = models.FloatField()
+    estadistico = models.FloatField()
+    umbral = models.FloatField()
+    fecha_deteccion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'alertas'
+        verbose_name = 'Alerta'
+        verbose_name_plural = 'Alertas'
+        unique_together = ['zoonosis', 'distrito', 'anio', 'semana_epidemiologica', 'metodo']
+        indexes = [
+            models.Index(fields=['anio', 'semana_epidemiologica']),
+        ]
+    
+    def __str__(self):
+        return f"{self.metodo} - {self.distrito} - {self.anio}/S{self.semana_epidemiologica}"
+
+
+class TrabajoReporte(models.Model):
+    """Generación de un reporte o exportación en segundo plano"""
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+    
+    tipo = models.CharField(max_length=20)
+    parametros = models.JSONField()
+    # Hash de tipo, parámetros y versión de datos para reutilizar trabajos idénticos
+    huella = models.CharField(max_length=40, db_index=True)
+    
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='pendiente')
+    progreso = models.IntegerField(default=0)
+    mensaje = models.TextField(blank=True, default='')
+    archivo = models.FileField(upload_to='reportes/', blank=True)
+    
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    # Lo actualiza periódicamente el proceso que ejecuta el trabajo (ver core/trabajos.py)
+    latido = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'trabajos_reporte'
+        verbose_name = 'Trabajo de reporte'
+        verbose_name_plural = 'Trabajos de reporte'
+        ordering = ['-fecha_creacion']
+        constraints = [
+            # Un solo trabajo pendiente o en proceso por huella, aunque lleguen pedidos simultáneos
+            models.UniqueConstraint(
+                fields=['huella'],
+                condition=models.Q(estado__in=['pendiente', 'en_proceso']),
+                name='trabajo_activo_unico',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.estado})"
+
+
+class CargaSemanal(models.Model):
+    """Lote semanal de notificaciones cargado por una DIRESA (ver core/cargas.py)"""
+    # sha1 del archivo: un mismo lote no se carga dos veces
+    huella = models.CharField(max_length=40, unique=True)
+    nombre_archivo = models.CharField(max_length=255)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    casos = models.PositiveIntegerField(default=0)
+    # [[anio, semana], ...] con casos en el lote
+    semanas = models.JSONField(default=list)
+    fecha_carga = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'carga_semanal'
+        verbose_name = 'Carga semanal'
+        verbose_name_plural = 'Cargas semanales'
+        ordering = ['-fecha_carga']
+    
+    def __str__(self):
+        return f"{self.nombre_archivo} ({self.casos} casos)"
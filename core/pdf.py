@@ -0,0 +1,241 @@
+"""Escritura mínima de PDF (texto, tablas y gráficos vectoriales) sin dependencias externas
+
+Los gráficos se dibujan como Form XObjects: cada uno es un flujo independiente
+que se puede generar en otro proceso y luego colocarse en cualquier página.
+Este módulo no usa Django para que los procesos de gráficos lo importen rápido.
+"""
+import math
+import unicodedata
+import zlib
+
+ANCHO_A4 = 595.28
+ALTO_A4 = 841.89
+
+# Anchos de Helvetica (AFM, milésimas de em) para los caracteres 32..126
+_ANCHOS_HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+
+PALETA = [
+    (0.05, 0.43, 0.99), (0.86, 0.21, 0.27), (0.10, 0.53, 0.33), (1.00, 0.76, 0.03),
+    (0.44, 0.26, 0.76), (0.99, 0.49, 0.08), (0.05, 0.79, 0.94), (0.42, 0.46, 0.49),
+]
+
+
+def ancho_texto(texto, tam, negrita=False):
+    """Ancho aproximado en puntos de un texto en Helvetica"""
+    total = 0
+    for caracter in texto:
+        base = unicodedata.normalize('NFD', caracter)[0]
+        codigo = ord(base)
+        total += _ANCHOS_HELVETICA[codigo - 32] if 32 <= codigo <= 126 else 556
+    return total * tam / 1000 * (1.05 if negrita else 1)
+
+
+def recortar(texto, ancho, tam, negrita=False):
+    """Recorta un texto con '...' para que no pase del ancho indicado"""
+    if ancho_texto(texto, tam, negrita) <= ancho:
+        return texto
+    while texto and ancho_texto(texto + '...', tam, negrita) > ancho:
+        texto = texto[:-1]
+    return texto + '...'
+
+
+def _cadena(texto):
+    """Cadena literal PDF en WinAnsiEncoding"""
+    texto = str(texto).encode('cp1252', errors='replace').decode('cp1252')
+    return '(' + texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+
+def _num(valor):
+    return f'{valor:.2f}'.rstrip('0').rstrip('.')
+
+
+class Lienzo:
+    """Secuencia de operaciones de dibujo de una página o de un gráfico"""
+
+    def __init__(self):
+        self.operaciones = []
+
+    def rect(self, x, y, ancho, alto, relleno=None, borde=None, grosor=0.5):
+        if relleno:
+            self.operaciones.append('%s %s %s rg' % tuple(_num(c) for c in relleno))
+        if borde:
+            self.operaciones.append('%s %s %s RG %s w' % (*(_num(c) for c in borde), _num(grosor)))
+        operador = 'B' if relleno and borde else ('f' if relleno else 'S')
+        self.operaciones.append(f'{_num(x)} {_num(y)} {_num(ancho)} {_num(alto)} re {operador}')
+
+    def linea(self, x1, y1, x2, y2, color=(0, 0, 0), grosor=0.5):
+        self.polilinea([(x1, y1), (x2, y2)], color, grosor)
+
+    def polilinea(self, puntos, color=(0, 0, 0), grosor=0.5):
+        if len(puntos) < 2:
+            return
+        self.operaciones.append('%s %s %s RG %s w' % (*(_num(c) for c in color), _num(grosor)))
+        trazo = [f'{_num(puntos[0][0])} {_num(puntos[0][1])} m']
+        trazo += [f'{_num(x)} {_num(y)} l' for x, y in puntos[1:]]
+        self.operaciones.append(' '.join(trazo) + ' S')
+
+    def texto(self, x, y, texto, tam=10, negrita=False, alinear='izquierda', color=(0, 0, 0)):
+        texto = str(texto)
+        if alinear != 'izquierda':
+            ancho = ancho_texto(texto, tam, negrita)
+            x -= ancho if alinear == 'derecha' else ancho / 2
+        fuente = 'F2' if negrita else 'F1'
+        self.operaciones.append(
+            '%s %s %s rg BT /%s %s Tf %s %s Td %s Tj ET'
+            % (*(_num(c) for c in color), fuente, _num(tam), _num(x), _num(y), _cadena(texto))
+        )
+
+    def forma(self, nombre, x, y):
+        """Coloca un gráfico (Form XObject) con su esquina inferior izquierda en (x, y)"""
+        self.operaciones.append(f'q 1 0 0 1 {_num(x)} {_num(y)} cm /{nombre} Do Q')
+
+    def contenido(self):
+        return '\n'.join(self.operaciones).encode('cp1252', errors='replace')
+
+
+def _escala(maximo, divisiones=5):
+    """Paso 'redondo' (1, 2 o 5 × 10^n) para un eje de 0 a maximo"""
+    if maximo <= 0:
+        return 1
+    bruto = maximo / divisiones
+    potencia = 10 ** math.floor(math.log10(bruto))
+    for factor in (1, 2, 5, 10):
+        if bruto <= factor * potencia:
+            return max(1, factor * potencia)
+    return 10 * potencia
+
+
+def grafico_barras(titulo, etiquetas, valores, ancho):
+    """Barras horizontales (una por etiqueta); devuelve (contenido, ancho, alto)"""
+    alto_barra = 14
+    margen_izq = 110
+    alto = 40 + alto_barra * len(etiquetas)
+    lienzo = Lienzo()
+    lienzo.texto(0, alto - 12, titulo, tam=10, negrita=True)
+    
+    maximo = max(valores, default=0) or 1
+    ancho_util = ancho - margen_izq - 40
+    for i, (etiqueta, valor) in enumerate(zip(etiquetas, valores)):
+        y = alto - 30 - alto_barra * (i + 1)
+        lienzo.texto(margen_izq - 4, y + 3, recortar(etiqueta, margen_izq - 8, 7), tam=7, alinear='derecha')
+        largo = ancho_util * valor / maximo
+        if largo > 0:
+            lienzo.rect(margen_izq, y + 1, largo, alto_barra - 3, relleno=PALETA[0])
+        lienzo.texto(margen_izq + largo + 3, y + 3, valor, tam=7, color=(0.3, 0.3, 0.3))
+    lienzo.linea(margen_izq, 8, margen_izq, alto - 30, color=(0.6, 0.6, 0.6))
+    return lienzo.contenido(), ancho, alto
+
+
+def grafico_lineas(titulo, anios, series, ancho, alto=220):
+    """Líneas de casos por año, una por serie (nombre, valores); devuelve (contenido, ancho, alto)"""
+    margen_izq, margen_inf, margen_sup = 40, 50, 25
+    lienzo = Lienzo()
+    lienzo.texto(0, alto - 12, titulo, tam=10, negrita=True)
+    
+    ancho_util = ancho - margen_izq - 10
+    alto_util = alto - margen_inf - margen_sup
+    maximo = max((max(valores, default=0) for _, valores in series), default=0)
+    paso = _escala(maximo)
+    tope = paso * max(1, math.ceil(maximo / paso))
+    
+    # Eje Y con líneas de referencia
+    valor = 0
+    while valor <= tope:
+        y = margen_inf + alto_util * valor / tope
+        lienzo.linea(margen_izq, y, margen_izq + ancho_util, y, color=(0.88, 0.88, 0.88))
+        lienzo.texto(margen_izq - 4, y - 2.5, int(valor), tam=7, alinear='derecha')
+        valor += paso
+
+    def x_de(posicion):
+        return margen_izq + (ancho_util * posicion / (len(anios) - 1) if len(anios) > 1 else ancho_util / 2)
+    
+    salto = max(1, math.ceil(len(anios) / 12))
+    for posicion, anio in enumerate(anios):
+        if posicion % salto == 0:
+            lienzo.texto(x_de(posicion), margen_inf - 12, anio, tam=7, alinear='centro')
+    
+    for indice, (nombre, valores) in enumerate(series):
+        color = PALETA[indice % len(PALETA)]
+        puntos = [(x_de(p), margen_inf + alto_util * v / tope) for p, v in enumerate(valores)]
+        lienzo.polilinea(puntos, color=color, grosor=1.2)
+        
+        # Leyenda en dos filas de cuatro
+        columna, fila = indice % 4, indice // 4
+        x = margen_izq + columna * (ancho_util / 4)
+        y = 18 - fila * 11
+        lienzo.rect(x, y, 8, 6, relleno=color)
+        lienzo.texto(x + 11, y, recortar(nombre, ancho_util / 4 - 16, 7), tam=7)
+    return lienzo.contenido(), ancho, alto
+
+
+class DocumentoPDF:
+    """Documento PDF con fuentes Helvetica, páginas A4 y gráficos como Form XObjects"""
+
+    def __init__(self, titulo=''):
+        self.titulo = titulo
+        # Objetos 1 y 2 (catálogo y árbol de páginas) se completan al guardar
+        self.objetos = [
+            None,
+            None,
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+        ]
+        self.paginas = []
+        self.formas = {}
+
+    def _agregar(self, datos):
+        self.objetos.append(datos)
+        return len(self.objetos)
+
+    @staticmethod
+    def _flujo(diccionario, contenido):
+        comprimido = zlib.compress(contenido)
+        return (
+            f'<< {diccionario} /Filter /FlateDecode /Length {len(comprimido)} >>\nstream\n'.encode('ascii')
+            + comprimido + b'\nendstream'
+        )
+
+    def agregar_forma(self, nombre, contenido, ancho, alto):
+        """Registra un gráfico para usarlo con Lienzo.forma(nombre, x, y)"""
+        self.formas[nombre] = self._agregar(self._flujo(
+            f'/Type /XObject /Subtype /Form /BBox [0 0 {_num(ancho)} {_num(alto)}] '
+            '/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >>',
+            contenido,
+        ))
+
+    def agregar_pagina(self, lienzo):
+        contenido = self._agregar(self._flujo('', lienzo.contenido()))
+        formas = ' '.join(f'/{nombre} {numero} 0 R' for nombre, numero in self.formas.items())
+        self.paginas.append(self._agregar(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_num(ANCHO_A4)} {_num(ALTO_A4)}] '
+            f'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> /XObject << {formas} >> >> '
+            f'/Contents {contenido} 0 R >>'.encode('ascii')
+        ))
+
+    def guardar(self, archivo):
+        """Escribe el documento en un archivo binario abierto"""
+        self.objetos[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+        hijos = ' '.join(f'{numero} 0 R' for numero in self.paginas)
+        self.objetos[1] = f'<< /Type /Pages /Kids [{hijos}] /Count {len(self.paginas)} >>'.encode('ascii')
+        info = self._agregar(b'<< /Producer (ZoonoSight) /Title ' + _cadena(self.titulo).encode('cp1252') + b' >>')
+        
+        posicion = archivo.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        desplazamientos = []
+        for numero, datos in enumerate(self.objetos, start=1):
+            desplazamientos.append(posicion)
+            posicion += archivo.write(f'{numero} 0 obj\n'.encode('ascii') + datos + b'\nendobj\n')
+        
+        referencias = [f'xref\n0 {len(self.objetos) + 1}\n', '0000000000 65535 f \n']
+        referencias += [f'{d:010d} 00000 n \n' for d in desplazamientos]
+        archivo.write(''.join(referencias).encode('ascii'))
+        archivo.write(
+            f'trailer\n<< /Size {len(self.objetos) + 1} /Root 1 0 R /Info {info} 0 R >>\n'
+            f'startxref\n{posicion}\n%%EOF\n'.encode('ascii')
+        )
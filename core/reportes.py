@@ -0,0 +1,305 @@
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+from .models import CuboCasos, Departamento, TipoZoonosis
+from .cache_api import obtener_version
+from .pdf import ANCHO_A4, ALTO_A4, PALETA, DocumentoPDF, Lienzo, grafico_barras, grafico_lineas, recortar
+
+MARGEN_PDF = 40
+
+_pool_graficos = None
+_lock_pool = threading.Lock()
+
+
+def datos_reporte(departamentos_ids, zoonosis_ids, anio_inicio, anio_fin):
+    """Datos del reporte comparativo por zoonosis y departamento
+
+    Lanza Departamento.DoesNotExist o TipoZoonosis.DoesNotExist si algún id no
+    existe, y ValueError si algún id o año no es un entero (las vistas lo validan antes).
+    """
+    departamentos_ids = list(dict.fromkeys(int(d) for d in departamentos_ids))
+    zoonosis_ids = list(dict.fromkeys(int(z) for z in zoonosis_ids))
+    
+    departamentos_por_id = Departamento.objects.in_bulk(departamentos_ids)
+    zoonosis_por_id = TipoZoonosis.objects.in_bulk(zoonosis_ids)
+    if len(departamentos_por_id) != len(departamentos_ids):
+        raise Departamento.DoesNotExist('Departamento no encontrado')
+    if len(zoonosis_por_id) != len(zoonosis_ids):
+        raise TipoZoonosis.DoesNotExist('Zoonosis no encontrada')
+    
+    # Una sola pasada agrupada por zoonosis, departamento y año
+    celdas = CuboCasos.objects.filter(
+        zoonosis_id__in=zoonosis_ids,
+        departamento_id__in=departamentos_ids,
+        anio__gte=anio_inicio,
+        anio__lte=anio_fin
+    ).values('zoonosis_id', 'departamento_id', 'anio').annotate(
+        total=Sum('total')
+    ).order_by('anio')
+    
+    casos_por_anio = {}
+    for celda in celdas:
+        clave = (celda['zoonosis_id'], celda['departamento_id'])
+        casos_por_anio.setdefault(clave, []).append({'anio': celda['anio'], 'total': celda['total']})
+    
+    num_anios = int(anio_fin) - int(anio_inicio) + 1
+    
+    reportes = []
+    for zoonosis_id in zoonosis_ids:
+        # Obtener datos para cada departamento
+        datos_departamentos = []
+        for dept_id in departamentos_ids:
+            serie = casos_por_anio.get((zoonosis_id, dept_id), [])
+            total_casos = sum(item['total'] for item in serie)
+            promedio_anual = total_casos / num_anios if num_anios > 0 else 0
+            
+            # Calcular tendencia
+            if len(serie) >= 2:
+                primer_anio_casos = serie[0]['total']
+                ultimo_anio_casos = serie[-1]['total']
+                tendencia = ((ultimo_anio_casos - primer_anio_casos) / primer_anio_casos * 100) if primer_anio_casos > 0 else 0
+            else:
+                tendencia = 0
+            
+            datos_departamentos.append({
+                'nombre': departamentos_por_id[dept_id].nombre,
+                'total_casos': total_casos,
+                'promedio_anual': round(promedio_anual, 1),
+                'tendencia': round(tendencia, 1),
+                'casos_por_anio': serie
+            })
+        
+        reportes.append({
+            'zoonosis_id': zoonosis_id,
+            'zoonosis_nombre': zoonosis_por_id[zoonosis_id].nombre,
+            'departamentos': datos_departamentos,
+        })
+    
+    # 'departamentos' y 'zoonosis_nombre' describen la primera zoonosis
+    # para mantener el formato de respuesta de una sola zoonosis
+    return {
+        'departamentos': reportes[0]['departamentos'],
+        'zoonosis_nombre': reportes[0]['zoonosis_nombre'],
+        'reportes': reportes,
+        'periodo': f"{anio_inicio}-{anio_fin}"
+    }
+
+
+def reporte_csv(datos):
+    """Reporte comparativo en CSV: una fila por zoonosis, departamento y año, más los totales"""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(['zoonosis', 'departamento', 'anio', 'casos'])
+    for reporte in datos['reportes']:
+        for dept in reporte['departamentos']:
+            for item in dept['casos_por_anio']:
+                escritor.writerow([reporte['zoonosis_nombre'], dept['nombre'], item['anio'], item['total']])
+    
+    escritor.writerow([])
+    escritor.writerow(['zoonosis', 'departamento', 'total_casos', 'promedio_anual', 'tendencia_%'])
+    for reporte in datos['reportes']:
+        for dept in reporte['departamentos']:
+            escritor.writerow([
+                reporte['zoonosis_nombre'], dept['nombre'],
+                dept['total_casos'], dept['promedio_anual'], dept['tendencia'],
+            ])
+    # BOM para que Excel reconozca los acentos
+    return ('\ufeff' + salida.getvalue()).encode('utf-8')
+
+
+def renderizar_graficos(tareas):
+    """Dibuja en paralelo, en procesos aparte, los gráficos [(funcion, argumentos), ...]"""
+    global _pool_graficos
+    if settings.PDF_PROCESOS_GRAFICOS <= 1 or len(tareas) < 2:
+        return [funcion(*argumentos) for funcion, argumentos in tareas]
+    
+    with _lock_pool:
+        if _pool_graficos is None:
+            # 'spawn' evita heredar los hilos y conexiones del proceso web
+            _pool_graficos = ProcessPoolExecutor(
+                max_workers=settings.PDF_PROCESOS_GRAFICOS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+    futuros = [_pool_graficos.submit(funcion, *argumentos) for funcion, argumentos in tareas]
+    return [futuro.result() for futuro in futuros]
+
+
+class _Paginador:
+    """Reparte bloques de contenido en páginas A4 y agrega el pie de cada página"""
+
+    def __init__(self, documento, pie):
+        self.documento = documento
+        self.pie = pie
+        self.lienzo = None
+        self.numero = 0
+        self.nueva_pagina()
+
+    def nueva_pagina(self):
+        if self.lienzo is not None:
+            self._cerrar()
+        self.lienzo = Lienzo()
+        self.numero += 1
+        self.y = ALTO_A4 - MARGEN_PDF
+
+    def cabe(self, alto):
+        return self.y - alto >= MARGEN_PDF + 20
+
+    def reservar(self, alto):
+        """Devuelve la coordenada superior de un bloque de la altura indicada"""
+        if not self.cabe(alto):
+            self.nueva_pagina()
+        superior = self.y
+        self.y -= alto
+        return superior
+
+    def _cerrar(self):
+        self.lienzo.linea(MARGEN_PDF, MARGEN_PDF + 8, ANCHO_A4 - MARGEN_PDF, MARGEN_PDF + 8, color=(0.8, 0.8, 0.8))
+        self.lienzo.texto(MARGEN_PDF, MARGEN_PDF - 4, self.pie, tam=7, color=(0.4, 0.4, 0.4))
+        self.lienzo.texto(ANCHO_A4 - MARGEN_PDF, MARGEN_PDF - 4, f'Página {self.numero}', tam=7,
+                          alinear='derecha', color=(0.4, 0.4, 0.4))
+        self.documento.agregar_pagina(self.lienzo)
+
+    def terminar(self):
+        self._cerrar()
+
+
+# Columnas de la tabla comparativa: (título, campo, x del borde, alineación)
+_COLUMNAS_TABLA = [
+    ('Departamento', 'nombre', MARGEN_PDF + 4, 'izquierda'),
+    ('Total Casos', 'total_casos', 360, 'derecha'),
+    ('Promedio Anual', 'promedio_anual', 460, 'derecha'),
+    ('Tendencia', 'tendencia', ANCHO_A4 - MARGEN_PDF - 4, 'derecha'),
+]
+
+
+def _encabezado_tabla(paginador):
+    superior = paginador.reservar(18)
+    paginador.lienzo.rect(MARGEN_PDF, superior - 18, ANCHO_A4 - 2 * MARGEN_PDF, 18, relleno=(0.93, 0.94, 0.95))
+    for titulo, _, x, alinear in _COLUMNAS_TABLA:
+        paginador.lienzo.texto(x, superior - 12.5, titulo, tam=9, negrita=True, alinear=alinear)
+
+
+def _tabla_departamentos(paginador, departamentos):
+    _encabezado_tabla(paginador)
+    for dept in departamentos:
+        if not paginador.cabe(16):
+            paginador.nueva_pagina()
+            _encabezado_tabla(paginador)
+        superior = paginador.reservar(16)
+        lienzo = paginador.lienzo
+        for _, campo, x, alinear in _COLUMNAS_TABLA:
+            valor = dept[campo]
+            color = (0, 0, 0)
+            if campo == 'nombre':
+                valor = recortar(valor, 250, 9)
+            elif campo == 'tendencia':
+                color = (0.86, 0.21, 0.27) if valor > 0 else ((0.10, 0.53, 0.33) if valor < 0 else (0.4, 0.4, 0.4))
+                valor = f'{valor}%'
+            lienzo.texto(x, superior - 11.5, valor, tam=9, alinear=alinear, color=color)
+        lienzo.linea(MARGEN_PDF, superior - 16, ANCHO_A4 - MARGEN_PDF, superior - 16, color=(0.87, 0.89, 0.9))
+
+
+def reporte_pdf(datos, version, incluir_graficos=True, incluir_tablas=True):
+    """Reporte comparativo en PDF: tabla y gráficos por zoonosis"""
+    ancho_util = ANCHO_A4 - 2 * MARGEN_PDF
+    anio_inicio, anio_fin = (int(anio) for anio in datos['periodo'].split('-'))
+    anios = list(range(anio_inicio, anio_fin + 1))
+    
+    tareas = []
+    if incluir_graficos:
+        for reporte in datos['reportes']:
+            departamentos = sorted(reporte['departamentos'], key=lambda dept: -dept['total_casos'])
+            tareas.append((grafico_barras, (
+                'Total de casos por departamento',
+                [dept['nombre'] for dept in departamentos],
+                [dept['total_casos'] for dept in departamentos],
+                ancho_util,
+            )))
+            series = []
+            for dept in departamentos[:len(PALETA)]:
+                por_anio = {item['anio']: item['total'] for item in dept['casos_por_anio']}
+                series.append((dept['nombre'], [por_anio.get(anio, 0) for anio in anios]))
+            titulo = 'Casos por año' + (
+                f' ({len(PALETA)} departamentos con más casos)' if len(departamentos) > len(PALETA) else ''
+            )
+            tareas.append((grafico_lineas, (titulo, anios, series, ancho_util)))
+    
+    titulo = ('Reporte Comparativo de Zoonosis' if len(datos['reportes']) > 1
+              else f"Reporte Comparativo de {datos['zoonosis_nombre']}")
+    documento = DocumentoPDF(titulo)
+    graficos = renderizar_graficos(tareas)
+    for indice, (contenido, ancho, alto) in enumerate(graficos):
+        documento.agregar_forma(f'G{indice}', contenido, ancho, alto)
+    
+    generado = timezone.localtime().strftime('%d/%m/%Y %H:%M')
+    paginador = _Paginador(documento, f'ZoonoSight - generado el {generado} - versión de datos {version}')
+    
+    superior = paginador.reservar(60)
+    paginador.lienzo.texto(ANCHO_A4 / 2, superior - 18, titulo, tam=16, negrita=True, alinear='centro')
+    paginador.lienzo.texto(ANCHO_A4 / 2, superior - 36, f"Período: {datos['periodo']}", tam=10,
+                           alinear='centro', color=(0.4, 0.4, 0.4))
+    
+    for indice, reporte in enumerate(datos['reportes']):
+        superior = paginador.reservar(28)
+        paginador.lienzo.texto(MARGEN_PDF, superior - 18, reporte['zoonosis_nombre'], tam=12, negrita=True)
+        
+        if incluir_tablas:
+            _tabla_departamentos(paginador, reporte['departamentos'])
+        
+        if incluir_graficos:
+            for numero in (2 * indice, 2 * indice + 1):
+                alto = graficos[numero][2]
+                superior = paginador.reservar(alto + 15)
+                paginador.lienzo.forma(f'G{numero}', MARGEN_PDF, superior - 15 - alto)
+    
+    paginador.terminar()
+    return documento
+
+
+def obtener_reporte_pdf(parametros, progreso=None):
+    """Nombre (relativo a MEDIA_ROOT) del PDF del reporte
+
+    El archivo se guarda en disco con una clave de parámetros y versión de datos,
+    así un mismo reporte pedido muchas veces se genera una sola vez. Si se pasa
+    progreso, se llama con el avance (0-100) de cada etapa.
+    """
+    version = obtener_version()
+    huella = hashlib.sha1(json.dumps([parametros, version], sort_keys=True).encode('utf-8')).hexdigest()
+    nombre = (f"reportes_pdf/reporte_{parametros['anio_inicio']}-{parametros['anio_fin']}"
+              f"_v{version}_{huella[:16]}.pdf")
+    ruta = Path(settings.MEDIA_ROOT) / nombre
+    if ruta.exists():
+        return nombre
+    
+    opciones = {
+        'incluir_graficos': parametros.get('incluir_graficos', True),
+        'incluir_tablas': parametros.get('incluir_tablas', True),
+    }
+    datos = datos_reporte(**{clave: valor for clave, valor in parametros.items() if clave not in opciones})
+    if progreso:
+        progreso(30)
+    documento = reporte_pdf(datos, version, **opciones)
+    if progreso:
+        progreso(90)
+    
+    # Se escribe en un temporal y se publica con un reemplazo atómico
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_name(f'{ruta.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(temporal, 'wb') as archivo:
+        documento.guardar(archivo)
+    os.replace(temporal, ruta)
+    
+    # Los PDF de versiones de datos anteriores ya no se vuelven a pedir
+    for anterior in ruta.parent.glob('reporte_*.pdf'):
+        if f'_v{version}_' not in anterior.name:
+            anterior.unlink(missing_ok=True)
+    return nombre
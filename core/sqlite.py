@@ -0,0 +1,80 @@
+"""Conexiones SQLite del perfil de producción (DB_PERFIL=produccion)
+
+Cada conexión nueva recibe los PRAGMAS de SQLITE_PRAGMAS. Con WAL los
+lectores no esperan a que termine una carga: leen la última versión confirmada
+mientras cargar_datos escribe. Las peticiones GET y HEAD leen por el alias
+'lectura', una conexión persistente abierta con mode=ro.
+"""
+import contextvars
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.decorators import sync_and_async_middleware
+
+ALIAS_LECTURA = 'lectura'
+
+_peticion_lectura = contextvars.ContextVar('peticion_lectura', default=False)
+
+
+def sentencias_pragmas(pragmas, solo_lectura=False):
+    """Sentencias PRAGMA para una conexión; journal_mode solo lo fija una conexión de escritura"""
+    sentencias = [
+        f'PRAGMA {nombre} = {valor}' for nombre, valor in pragmas.items()
+        if not (solo_lectura and nombre == 'journal_mode')
+    ]
+    if solo_lectura:
+        sentencias.append('PRAGMA query_only = 1')
+    return sentencias
+
+
+@receiver(connection_created)
+def configurar_conexion(sender, connection, **kwargs):
+    """Aplica SQLITE_PRAGMAS a cada conexión SQLite nueva"""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    for sentencia in sentencias_pragmas(settings.SQLITE_PRAGMAS, connection.alias == ALIAS_LECTURA):
+        connection.connection.execute(sentencia)
+
+
+class RouterLectura:
+    """Envía a 'lectura' las consultas de las peticiones marcadas por lectura_middleware"""
+
+    def db_for_read(self, model, **hints):
+        # Dentro de una transacción se lee de 'default' para ver lo que aún no se confirmó
+        if _peticion_lectura.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return ALIAS_LECTURA
+        return None
+
+    def db_for_write(self, model, **hints):
+        # También para instancias leídas por 'lectura'
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Ambos alias son el mismo archivo
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db == ALIAS_LECTURA else None
+
+
+@sync_and_async_middleware
+def lectura_middleware(get_response):
+    """Marca las peticiones GET y HEAD para que lean por la conexión de solo lectura"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = _peticion_lectura.set(request.method in ('GET', 'HEAD'))
+            try:
+                return await get_response(request)
+            finally:
+                _peticion_lectura.reset(token)
+    else:
+        def middleware(request):
+            token = _peticion_lectura.set(request.method in ('GET', 'HEAD'))
+            try:
+                return get_response(request)
+            finally:
+                _peticion_lectura.reset(token)
+    
+    return middleware
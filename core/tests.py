@@ -1,3 +1,709 @@
-from django.test import TestCase
+import csv
+import gzip
+import os
+import tempfile
+from io import BytesIO, StringIO
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+from xml.etree import ElementTree
+from zipfile import ZipFile
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import Permission, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from . import columnar, exportacion, trabajos, views, vistas_async
+from .agregados import actualizar_derivados
+from .cache_api import cache, incrementar_version, obtener_version
+from .cargas import LoteInvalido, LoteRepetido, cargar_lote
+from .columnar import ARCHIVO_ACTUAL, COLUMNAS, generar_snapshot, obtener_snapshot
+from .ingesta import COLUMNAS_CSV
+from .models import (
+    Alerta, CanalEndemico, CargaSemanal, Caso, CuboCasos, Departamento, Distrito, EstadoSerie, Provincia,
+    TipoZoonosis, TrabajoReporte, VersionDatos,
+)
 
-# Create your tests here.
+
+class VistasAsyncTest(TransactionTestCase):
+    """Las vistas async devuelven exactamente lo mismo que las sync
+
+    TransactionTestCase: las vistas async consultan desde los hilos de su pool,
+    con otra conexión que no ve una transacción sin confirmar.
+    """
+
+    def setUp(self):
+        departamento = Departamento.objects.create(nombre='LIMA', codigo_ubigeo='15')
+        provincia = Provincia.objects.create(departamento=departamento, nombre='LIMA', codigo_ubigeo='1501')
+        distrito = Distrito.objects.create(provincia=provincia, nombre='LIMA', codigo_ubigeo='150101')
+        self.departamento = departamento
+        self.zoonosis = [
+            TipoZoonosis.objects.create(nombre=nombre) for nombre in ('RABIA', 'LEPTOSPIROSIS', 'PESTE')
+        ]
+        CuboCasos.objects.bulk_create([
+            CuboCasos(
+                zoonosis=zoonosis, departamento=departamento, provincia=provincia, distrito=distrito,
+                anio=anio, semana_epidemiologica=semana, tipo_diagnostico=tipo, total=(i + 1) * semana % 7 + 1,
+            )
+            for i, zoonosis in enumerate(self.zoonosis)
+            for anio in (2021, 2022)
+            for semana in range(1, 53, 3)
+            for tipo in ('P', 'C')
+        ])
+
+    def comparar(self, nombre, ruta, parametros):
+        """Compara estado y cuerpo de la vista sync y la async con la caché vacía"""
+        request = RequestFactory().get(ruta, parametros)
+        cache().clear()
+        sync = getattr(views, nombre)(request)
+        cache().clear()
+        asincrona = async_to_sync(getattr(vistas_async, nombre))(request)
+        self.assertEqual(asincrona.status_code, sync.status_code)
+        self.assertEqual(asincrona.content, sync.content)
+        return sync
+
+    def test_patrones_estacionales(self):
+        ids = [str(zoonosis.pk) for zoonosis in reversed(self.zoonosis)]
+        for parametros in (
+            {'zoonosis_ids[]': ids, 'anio_inicio': 2021, 'anio_fin': 2022},
+            {'zoonosis_ids[]': ids[:2], 'anio_inicio': 2021, 'anio_fin': 2022, 'resolucion': 'semanal',
+             'departamento_id': self.departamento.pk},
+            {'zoonosis_ids[]': ids, 'anio_inicio': 2021, 'anio_fin': 'x'},
+        ):
+            with self.subTest(parametros=parametros):
+                self.comparar('api_patrones_estacionales', '/api/patrones-estacionales/', parametros)
+
+    def test_generar_reporte(self):
+        respuesta = self.comparar('api_generar_reporte', '/api/generar-reporte/', {
+            'departamentos[]': [self.departamento.pk],
+            'zoonosis_ids[]': [zoonosis.pk for zoonosis in self.zoonosis],
+            'anio_inicio': 2021,
+            'anio_fin': 2022,
+        })
+        self.assertEqual(respuesta.status_code, 200)
+
+
+class ParametrosNoValidosTest(TestCase):
+    """Los parámetros numéricos no válidos responden 400, no 500"""
+
+    def assertNoValido(self, ruta, parametros):
+        """Cada parámetro con un valor no numérico (y los demás válidos) responde 400"""
+        for parametro in parametros:
+            with self.subTest(parametro=parametro):
+                respuesta = self.client.get(ruta, {**parametros, parametro: 'x'})
+                self.assertEqual(respuesta.status_code, 400)
+
+    def test_mapa_detalle(self):
+        self.assertNoValido('/api/mapa-detalle/', {'zoonosis_id': '1', 'anio': '2022'})
+
+    def test_canal_endemico(self):
+        self.assertNoValido('/api/canal-endemico/', {'zoonosis_id': '1', 'anio': '2022'})
+
+    def test_alertas(self):
+        self.assertNoValido('/api/alertas/', {
+            'zoonosis_id': '1', 'departamento_id': '1', 'anio': '2022', 'limite': '10',
+        })
+
+    def test_demografia(self):
+        self.assertNoValido('/api/demografia/', {
+            'zoonosis_id': '1', 'anio_inicio': '2020', 'anio_fin': '2022', 'departamento_id': '1',
+        })
+
+    def test_generar_reporte(self):
+        self.assertNoValido('/api/generar-reporte/', {
+            'departamentos[]': '1', 'zoonosis_ids[]': '1', 'anio_inicio': '2020', 'anio_fin': '2022',
+        })
+
+    def test_trabajos(self):
+        parametros = {'departamentos[]': '1', 'zoonosis_ids[]': '1', 'anio_inicio': '2020', 'anio_fin': '2022'}
+        for parametro in parametros:
+            with self.subTest(parametro=parametro):
+                respuesta = self.client.post('/api/trabajos/', {**parametros, parametro: 'x'})
+                self.assertEqual(respuesta.status_code, 400)
+
+
+class PatronesEstacionalesTest(TestCase):
+    """Los promedios de patrones estacionales son por período mostrado (mes o semana)"""
+
+    def setUp(self):
+        departamento = Departamento.objects.create(nombre='LIMA', codigo_ubigeo='15')
+        provincia = Provincia.objects.create(departamento=departamento, nombre='LIMA', codigo_ubigeo='1501')
+        distrito = Distrito.objects.create(provincia=provincia, nombre='LIMA', codigo_ubigeo='150101')
+        self.zoonosis = TipoZoonosis.objects.create(nombre='RABIA')
+        CuboCasos.objects.bulk_create([
+            CuboCasos(
+                zoonosis=self.zoonosis, departamento=departamento, provincia=provincia, distrito=distrito,
+                anio=2022, semana_epidemiologica=semana, tipo_diagnostico='C', total=10,
+            )
+            for semana in range(1, 53)
+        ])
+        cache().clear()
+
+    def test_promedio_por_periodo(self):
+        for resolucion, periodos in (('mensual', 12), ('semanal', 53)):
+            with self.subTest(resolucion=resolucion):
+                data = self.client.get('/api/patrones-estacionales/', {
+                    'zoonosis_ids[]': self.zoonosis.pk, 'anio_inicio': 2022, 'anio_fin': 2022,
+                    'resolucion': resolucion,
+                }).json()
+                self.assertEqual(len(data['etiquetas']), periodos)
+                self.assertEqual(data['estadisticas']['total_general'], 520)
+                self.assertEqual(data['estadisticas']['zoonosis_data'][0]['promedio'], round(520 / periodos, 1))
+
+
+class CacheApiTest(TestCase):
+    """Caché de respuestas por versión de datos y respuestas condicionales (ETag, Last-Modified)"""
+
+    def setUp(self):
+        cache().clear()
+        incrementar_version()
+        self.zoonosis = {'zoonosis_id': '1', 'anio': '2022'}
+
+    def cache_de(self, ruta, parametros):
+        respuesta = self.client.get(ruta, parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta['X-Cache']
+
+    def test_hit_y_miss(self):
+        self.assertEqual(self.cache_de('/api/mapa-calor/', self.zoonosis), 'MISS')
+        self.assertEqual(self.cache_de('/api/mapa-calor/', self.zoonosis), 'HIT')
+        self.assertEqual(self.cache_de('/api/mapa-calor/', {**self.zoonosis, 'anio': '2021'}), 'MISS')
+        incrementar_version()
+        self.assertEqual(self.cache_de('/api/mapa-calor/', self.zoonosis), 'MISS')
+
+    def test_errores_sin_cache(self):
+        for _ in range(2):
+            respuesta = self.client.get('/api/mapa-calor/', {'zoonosis_id': '1'})
+            self.assertEqual(respuesta.status_code, 400)
+            self.assertNotIn('X-Cache', respuesta)
+            self.assertNotIn('ETag', respuesta)
+
+    def test_invalidacion_por_zoonosis(self):
+        for ruta, parametros in (('/api/mapa-calor/', self.zoonosis), ('/api/alertas/', {})):
+            self.cache_de(ruta, parametros)
+
+        # Una carga de otra zoonosis solo invalida las respuestas no limitadas a una zoonosis
+        incrementar_version([2])
+        self.assertEqual(self.cache_de('/api/mapa-calor/', self.zoonosis), 'HIT')
+        self.assertEqual(self.cache_de('/api/alertas/', {}), 'MISS')
+
+        incrementar_version([1])
+        self.assertEqual(self.cache_de('/api/mapa-calor/', self.zoonosis), 'MISS')
+        incrementar_version()
+        self.assertEqual(self.cache_de('/api/mapa-calor/', self.zoonosis), 'MISS')
+
+    def test_etag(self):
+        respuesta = self.client.get('/api/mapa-calor/', self.zoonosis)
+        etag = respuesta['ETag']
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+
+        respuesta = self.client.get('/api/mapa-calor/', self.zoonosis, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta['ETag'], etag)
+        self.assertEqual(respuesta.content, b'')
+
+        respuesta = self.client.get('/api/mapa-calor/', {**self.zoonosis, 'anio': '2021'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+
+        incrementar_version([1])
+        respuesta = self.client.get('/api/mapa-calor/', self.zoonosis, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_last_modified(self):
+        ultima_modificacion = self.client.get('/api/mapa-calor/', self.zoonosis)['Last-Modified']
+        respuesta = self.client.get('/api/mapa-calor/', self.zoonosis, HTTP_IF_MODIFIED_SINCE=ultima_modificacion)
+        self.assertEqual(respuesta.status_code, 304)
+
+        VersionDatos.objects.update(fecha_actualizacion=timezone.now() + timedelta(minutes=1))
+        cache().clear()
+        respuesta = self.client.get('/api/mapa-calor/', self.zoonosis, HTTP_IF_MODIFIED_SINCE=ultima_modificacion)
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_version_de_otro_proceso(self):
+        # Una carga hecha en otro proceso solo se ve al expirar la versión guardada en la caché
+        version = obtener_version()
+        VersionDatos.objects.update(version=version + 1, version_base=version + 1)
+        self.assertEqual(obtener_version(), version)
+        with override_settings(API_CACHE_VERSION_TTL=0):
+            cache().clear()
+            obtener_version()
+            VersionDatos.objects.update(version=version + 2, version_base=version + 2)
+            self.assertEqual(obtener_version(), version + 2)
+
+
+class SnapshotColumnarTest(TestCase):
+    """Publicación del snapshot columnar mientras otros procesos lo leen"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = Path(directorio.name)
+        ajustes = override_settings(SNAPSHOT_COLUMNAR_DIR=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def actual(self):
+        return (self.directorio / ARCHIVO_ACTUAL).read_text()
+
+    def test_conserva_el_snapshot_anterior(self):
+        generar_snapshot()
+        primero = self.actual()
+        generar_snapshot()
+        segundo = self.actual()
+        self.assertTrue((self.directorio / primero).is_dir())
+
+        generar_snapshot()
+        self.assertFalse((self.directorio / primero).exists())
+        self.assertTrue((self.directorio / segundo).is_dir())
+
+    def test_snapshot_borrado_al_abrirlo(self):
+        # El primer intento encuentra el directorio ya borrado; el segundo vuelve a leer ACTUAL
+        generar_snapshot()
+        mapeado = columnar.SnapshotColumnar(self.directorio / self.actual())
+        with mock.patch.object(columnar, 'SnapshotColumnar', side_effect=[FileNotFoundError(), mapeado]) as mapear:
+            self.assertIs(obtener_snapshot(), mapeado)
+        self.assertEqual(mapear.call_count, 2)
+
+
+class MapaTest(TestCase):
+    """El mapa no depende de CDNs y las geometrías solo se guardan en el navegador con versión"""
+
+    def setUp(self):
+        cache().clear()
+
+    def test_geometrias_con_version(self):
+        respuesta = self.client.get('/api/geometrias/', {'nivel': 'departamento', 'v': '3'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('max-age=31536000', respuesta['Cache-Control'])
+
+    def test_geometrias_sin_version(self):
+        respuesta = self.client.get('/api/geometrias/', {'nivel': 'departamento'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+        self.assertNotIn('max-age', respuesta['Cache-Control'])
+
+    def test_leaflet_local(self):
+        respuesta = self.client.get('/dashboard/mapas/')
+        self.assertContains(respuesta, '/static/vendor/leaflet/leaflet.js')
+        self.assertNotContains(respuesta, 'unpkg.com')
+
+    @override_settings(MAPA_TILES_URL='')
+    def test_sin_mapa_base(self):
+        respuesta = self.client.get('/dashboard/mapas/')
+        self.assertContains(respuesta, '<script id="tiles-url" type="application/json">""</script>', html=True)
+
+
+class ExportacionTest(TestCase):
+    """Exportación en flujo de /api/exportar/ en CSV, gzip y XLSX"""
+
+    def setUp(self):
+        departamento = Departamento.objects.create(nombre='LIMA', codigo_ubigeo='15')
+        provincia = Provincia.objects.create(departamento=departamento, nombre='LIMA', codigo_ubigeo='1501')
+        distrito = Distrito.objects.create(provincia=provincia, nombre='LIMA', codigo_ubigeo='150101')
+        self.zoonosis = TipoZoonosis.objects.create(nombre='RABIA')
+        CuboCasos.objects.bulk_create([
+            CuboCasos(
+                zoonosis=self.zoonosis, departamento=departamento, provincia=provincia, distrito=distrito,
+                anio=2022, semana_epidemiologica=semana, tipo_diagnostico='C', total=semana * 2,
+            )
+            for semana in range(1, 6)
+        ])
+        self.parametros = {'zoonosis_id': self.zoonosis.pk, 'anio_inicio': 2022, 'anio_fin': 2022}
+        self.filas = [['2022', str(semana), str(semana * 2)] for semana in range(1, 6)]
+
+    def exportar(self, **parametros):
+        respuesta = self.client.get('/api/exportar/tendencias/', {**self.parametros, **parametros})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, b''.join(respuesta.streaming_content)
+
+    def leer_xlsx(self, contenido):
+        """Filas (listas de textos) de cada hoja del libro"""
+        espacio = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        libro = ZipFile(BytesIO(contenido))
+        hojas = sorted(nombre for nombre in libro.namelist() if nombre.startswith('xl/worksheets/'))
+        return [
+            [
+                [''.join(celda.itertext()) for celda in fila.iter(f'{espacio}c')]
+                for fila in ElementTree.fromstring(libro.read(hoja)).iter(f'{espacio}row')
+            ]
+            for hoja in hojas
+        ]
+
+    def test_csv(self):
+        respuesta, contenido = self.exportar()
+        self.assertEqual(respuesta['Content-Disposition'], 'attachment; filename="tendencias.csv"')
+        filas = list(csv.reader(StringIO(contenido.decode('utf-8-sig'))))
+        self.assertEqual(filas, [['anio', 'semana_epidemiologica', 'casos']] + self.filas)
+
+    def test_csv_desde(self):
+        # La continuación se concatena al archivo cortado: sin cabecera ni filas repetidas
+        _, completo = self.exportar()
+        _, parcial = self.exportar(desde=2)
+        filas = list(csv.reader(StringIO(parcial.decode('utf-8'))))
+        self.assertEqual(filas, self.filas[2:])
+        self.assertTrue(completo.endswith(parcial))
+
+    def test_gzip(self):
+        _, plano = self.exportar()
+        respuesta, comprimido = self.exportar(gzip=1)
+        self.assertEqual(respuesta['Content-Type'], 'application/gzip')
+        self.assertEqual(respuesta['Content-Disposition'], 'attachment; filename="tendencias.csv.gz"')
+        self.assertEqual(gzip.decompress(comprimido), plano)
+
+    def test_xlsx(self):
+        _, contenido = self.exportar(formato='xlsx')
+        self.assertEqual(self.leer_xlsx(contenido), [[['anio', 'semana_epidemiologica', 'casos']] + self.filas])
+
+    def test_xlsx_varias_hojas(self):
+        with mock.patch.object(exportacion, 'MAX_FILAS_HOJA', 2):
+            _, contenido = self.exportar(formato='xlsx', gzip=1)
+        hojas = self.leer_xlsx(gzip.decompress(contenido))
+        self.assertEqual([len(hoja) for hoja in hojas], [3, 3, 2])
+        self.assertEqual([fila for hoja in hojas for fila in hoja[1:]], self.filas)
+
+    def test_parametros_no_validos(self):
+        for parametros in ({'formato': 'xlsx', 'desde': 2}, {'desde': 'x'}, {'formato': 'ods'}, {'anio_fin': 'x'}):
+            with self.subTest(parametros=parametros):
+                respuesta = self.client.get('/api/exportar/tendencias/', {**self.parametros, **parametros})
+                self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self.client.get('/api/exportar/otro/', self.parametros).status_code, 404)
+
+
+def escribir_csv(archivo, filas):
+    """Escribe filas (diccionarios) con las columnas del CSV de MINSA"""
+    escritor = csv.DictWriter(archivo, fieldnames=list(COLUMNAS_CSV))
+    escritor.writeheader()
+    escritor.writerows(filas)
+
+
+class CargaBaseTest(TestCase):
+    """Datos de prueba y carga de CSV con cargar_datos (sin pruebas propias)"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        ajustes = override_settings(SNAPSHOT_COLUMNAR_DIR=os.path.join(self.directorio, 'snapshot'))
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        base = {
+            'departamento': 'LIMA', 'provincia': 'LIMA', 'distrito': 'LIMA', 'ubigeo': '150101',
+            'enfermedad': 'LEPTOSPIROSIS', 'diagnostic': 'A27.9', 'diresa': '15', 'ano': '2022',
+            'semana': '5', 'edad': '30', 'tipo_edad': 'A', 'sexo': 'M', 'tipo_dx': 'C',
+        }
+        self.filas = [
+            base,
+            dict(base),  # registro repetido: otro caso con el mismo contenido
+            {**base, 'semana': '6', 'sexo': 'F'},
+            {**base, 'ano': '2023', 'edad': '8'},
+            {**base, 'enfermedad': 'RABIA', 'diagnostic': 'A82.9', 'edad': '45'},
+        ]
+
+    def cargar(self, filas, *opciones):
+        ruta = os.path.join(self.directorio, 'datos.csv')
+        with open(ruta, 'w', newline='', encoding='utf-8') as archivo:
+            escribir_csv(archivo, filas)
+        call_command('cargar_datos', ruta, '--procesos', '1', *opciones, stdout=StringIO())
+
+
+class CargarDatosTest(CargaBaseTest):
+    """Recargas de un CSV completo con cargar_datos"""
+
+    def test_recargar_mismo_archivo(self):
+        self.cargar(self.filas)
+        self.assertEqual(Caso.objects.count(), 5)
+        huellas = set(Caso.objects.values_list('huella', flat=True))
+
+        self.cargar(self.filas)
+        self.assertEqual(Caso.objects.count(), 5)
+        self.assertEqual(set(Caso.objects.values_list('huella', flat=True)), huellas)
+
+    def test_recargar_fila_corregida(self):
+        self.cargar(self.filas)
+        corregidas = [dict(fila) for fila in self.filas]
+        corregidas[2]['edad'] = '31'
+
+        self.cargar(corregidas)
+        self.assertEqual(Caso.objects.count(), 5)
+        self.assertEqual(Caso.objects.filter(semana_epidemiologica=6, edad=31).count(), 1)
+        self.assertFalse(Caso.objects.filter(semana_epidemiologica=6, edad=30).exists())
+        self.assertEqual(
+            CuboCasos.objects.filter(anio=2022).aggregate(total=Sum('total'))['total'], 4
+        )
+
+    def test_archivo_parcial(self):
+        self.cargar(self.filas)
+        self.cargar(self.filas[3:4] + [{**self.filas[3], 'edad': '9'}], '--conservar-ausentes')
+        self.assertEqual(Caso.objects.count(), 6)
+
+        # Sin --conservar-ausentes solo se borran los casos de las zoonosis y años del archivo
+        self.cargar(self.filas[3:4])
+        self.assertEqual(Caso.objects.count(), 5)
+        self.assertEqual(Caso.objects.filter(anio=2022).count(), 4)
+
+    def test_archivo_parcial_no_borra_otras_particiones(self):
+        anios = [{**self.filas[0], 'ano': str(anio)} for anio in range(2019, 2024)]
+        self.cargar(self.filas + anios)
+        self.assertEqual(Caso.objects.count(), 10)
+
+        # 2019 y 2023 de leptospirosis: no se tocan 2020-2022 ni la rabia
+        self.cargar([anios[0], self.filas[3]])
+        self.assertEqual(Caso.objects.count(), 9)
+        self.assertEqual(
+            sorted(Caso.objects.filter(anio__in=[2019, 2023]).values_list('anio', flat=True)), [2019, 2023]
+        )
+        self.assertEqual(Caso.objects.filter(anio__in=[2020, 2021]).count(), 2)
+        self.assertEqual(Caso.objects.filter(anio=2022, zoonosis__nombre='LEPTOSPIROSIS').count(), 4)
+        self.assertEqual(Caso.objects.filter(zoonosis__nombre='RABIA').count(), 1)
+
+
+    def test_modos_filas_y_bulk(self):
+        # Los registros con errores se descartan igual en ambos modos
+        filas = self.filas + [
+            {**self.filas[0], 'semana': 'x'},
+            {**self.filas[0], 'ano': 'dos mil'},
+            {**self.filas[0], 'edad': ''},
+            {**self.filas[0], 'sexo': ''},
+            {**self.filas[0], 'semana': '60', 'edad': '31'},
+        ]
+        cargados = {}
+        for modo in ('filas', 'bulk'):
+            Caso.objects.all().delete()
+            self.cargar(filas, '--modo', modo)
+            cargados[modo] = sorted(Caso.objects.values_list(
+                'huella', 'anio', 'semana_epidemiologica', 'fecha_notificacion', 'edad', 'grupo_etario',
+            ))
+        self.assertEqual(len(cargados['bulk']), 6)
+        self.assertEqual(cargados['filas'], cargados['bulk'])
+
+
+class CargaSemanalTest(CargaBaseTest):
+    """Lotes semanales con cargar_lote sobre la base cargada con cargar_datos"""
+
+    def setUp(self):
+        super().setUp()
+        self.cargar(self.filas)
+
+    def lote(self, filas):
+        texto = StringIO()
+        escribir_csv(texto, filas)
+        return BytesIO(texto.getvalue().encode('utf-8'))
+
+    def test_fila_igual_a_un_caso_cargado(self):
+        # Una notificación nueva con el mismo contenido que un caso ya cargado es otro caso
+        resultado = cargar_lote(self.lote([self.filas[2]]), 'semana_6.csv')
+        self.assertEqual(resultado['casos'], 1)
+        self.assertEqual(Caso.objects.count(), 6)
+        self.assertEqual(Caso.objects.filter(semana_epidemiologica=6).count(), 2)
+
+        # La carga completa que incluye ambos casos los reconoce por su huella
+        self.cargar(self.filas + [self.filas[2]])
+        self.assertEqual(Caso.objects.count(), 6)
+
+    def test_lote_valido(self):
+        nuevas = [{**self.filas[0], 'semana': '7', 'edad': '40'}, {**self.filas[4], 'edad': '46'}]
+        resultado = cargar_lote(self.lote(nuevas), 'semana_7.csv')
+        self.assertEqual(resultado['casos'], 2)
+        self.assertEqual(resultado['semanas'], [[2022, 5], [2022, 7]])
+        self.assertEqual(Caso.objects.count(), 7)
+        self.assertEqual(CargaSemanal.objects.get().casos, 2)
+        self.assertEqual(Caso.objects.filter(zoonosis__nombre='RABIA').count(), 2)
+
+    def test_suma_al_cubo(self):
+        celdas = CuboCasos.objects.count()
+        celda = CuboCasos.objects.get(zoonosis__nombre='LEPTOSPIROSIS', anio=2022, semana_epidemiologica=5)
+        self.assertEqual(celda.total, 2)
+
+        cargar_lote(self.lote([self.filas[0], {**self.filas[0], 'semana': '7'}]), 'semana_7.csv')
+        celda.refresh_from_db()
+        self.assertEqual(celda.total, 3)
+        self.assertEqual(CuboCasos.objects.count(), celdas + 1)
+        self.assertEqual(
+            CuboCasos.objects.get(zoonosis__nombre='LEPTOSPIROSIS', anio=2022, semana_epidemiologica=7).total, 1
+        )
+
+    def test_errores_por_fila(self):
+        filas = [self.filas[0], {**self.filas[0], 'semana': 'x'}, {**self.filas[0], 'sexo': 'X'}]
+        with self.assertRaises(LoteInvalido) as contexto:
+            cargar_lote(self.lote(filas), 'errores.csv')
+        self.assertEqual(contexto.exception.errores, [
+            'Fila 3: semana epidemiológica no válida',
+            'Fila 4: sexo no válido',
+        ])
+
+        with self.assertRaises(LoteInvalido) as contexto:
+            cargar_lote(self.lote([{**self.filas[0], 'enfermedad': 'PESTE'}]), 'peste.csv')
+        self.assertEqual(contexto.exception.errores, ['Fila 2: zoonosis desconocida (PESTE)'])
+
+        # Un lote con errores no carga ninguna fila
+        self.assertEqual(Caso.objects.count(), 5)
+        self.assertFalse(CargaSemanal.objects.exists())
+
+    def test_lote_repetido(self):
+        resultado = cargar_lote(self.lote([self.filas[2]]), 'semana_6.csv')
+        with self.assertRaises(LoteRepetido) as contexto:
+            cargar_lote(self.lote([self.filas[2]]), 'otro_nombre.csv')
+        self.assertEqual(contexto.exception.carga.pk, resultado['carga_id'])
+        self.assertEqual(Caso.objects.count(), 6)
+
+    def test_derivados_como_recalculo_completo(self):
+        # Años de base suficientes para el canal endémico y series con alertas
+        filas = [
+            {**self.filas[0], 'ano': str(anio), 'semana': str(semana), 'edad': str(edad)}
+            for anio in range(2016, 2024)
+            for semana in range(1, 53, 4)
+            for edad in range(1 + (semana % 3) + (anio == 2023) * 6 * (semana > 30))
+        ]
+        self.cargar(self.filas + filas)
+        nuevas = [{**self.filas[0], 'ano': '2023', 'semana': semana, 'edad': '70'} for semana in ('33', '33', '41')]
+        cargar_lote(self.lote(nuevas + [{**self.filas[4], 'ano': '2021'}]), 'semanas_33_41.csv')
+
+        def derivados():
+            return {
+                'snapshot': sorted(obtener_snapshot().contar(list(COLUMNAS))),
+                'canal': sorted(CanalEndemico.objects.values_list(
+                    'zoonosis_id', 'nivel', 'codigo_ubigeo', 'semana_epidemiologica', 'casos', 'mediana',
+                    'limite_superior',
+                )),
+                'alertas': sorted(Alerta.objects.values_list(
+                    'zoonosis_id', 'anio', 'semana_epidemiologica', 'metodo', 'estadistico',
+                )),
+                'estado': sorted(EstadoSerie.objects.values_list('zoonosis_id', 'ventana', 'cusum')),
+            }
+
+        parciales = derivados()
+        self.assertTrue(parciales['canal'])
+        self.assertTrue(parciales['alertas'])
+        actualizar_derivados()
+        self.assertEqual(parciales, derivados())
+
+
+class CargaSemanalApiTest(CargaBaseTest):
+    """Subida de lotes semanales por /api/cargas/semanal/"""
+
+    def setUp(self):
+        super().setUp()
+        self.cargar(self.filas)
+        self.usuario = User.objects.create_user('diresa', password='clave')
+        self.client.force_login(self.usuario)
+
+    def subir(self, filas, nombre='semana.csv'):
+        texto = StringIO()
+        escribir_csv(texto, filas)
+        archivo = SimpleUploadedFile(nombre, texto.getvalue().encode('utf-8'), content_type='text/csv')
+        return self.client.post('/api/cargas/semanal/', {'archivo': archivo})
+
+    def test_sin_permiso(self):
+        self.assertEqual(self.subir([self.filas[2]]).status_code, 403)
+        self.assertEqual(Caso.objects.count(), 5)
+
+    def test_subir_lote(self):
+        self.usuario.user_permissions.add(Permission.objects.get(codename='add_caso', content_type__app_label='core'))
+
+        respuesta = self.subir([self.filas[2]])
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.json()['casos'], 1)
+        self.assertEqual(CargaSemanal.objects.get().usuario, self.usuario)
+
+        respuesta = self.subir([self.filas[2]])
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['carga_id'], CargaSemanal.objects.get().pk)
+
+        respuesta = self.subir([{**self.filas[2], 'edad': '-1'}])
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['errores'], ['Fila 2: edad no válida'])
+
+        self.assertEqual(self.client.post('/api/cargas/semanal/', {}).status_code, 400)
+        self.assertEqual(Caso.objects.count(), 6)
+
+
+class TrabajosTest(TestCase):
+    """Cola de trabajos en segundo plano: reutilización, reanudación y descarga"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.media = Path(directorio.name)
+        ajustes = override_settings(MEDIA_ROOT=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        # ejecutar_trabajo cierra las conexiones de su hilo; aquí corre en el del test
+        for nombre in ('connections', 'close_old_connections'):
+            parche = mock.patch.object(trabajos, nombre)
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def ejecutar(self, generar):
+        """Encola y ejecuta un trabajo de un tipo cuya función es generar"""
+        with mock.patch.dict(trabajos.TIPOS_TRABAJO, {'prueba': generar}):
+            trabajo, _ = trabajos.encolar_trabajo('prueba', {'anio': 2022})
+            trabajos.ejecutar_trabajo(trabajo.pk)
+        trabajo.refresh_from_db()
+        return trabajo
+
+    def test_trabajo_activo_unico(self):
+        TrabajoReporte.objects.create(tipo='csv', parametros={}, huella='a' * 40)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TrabajoReporte.objects.create(tipo='csv', parametros={}, huella='a' * 40)
+        TrabajoReporte.objects.create(tipo='csv', parametros={}, huella='a' * 40, estado='error')
+
+    def test_pedido_identico(self):
+        primero, creado = trabajos.encolar_trabajo('csv', {'anio': 2022})
+        self.assertTrue(creado)
+        segundo, creado = trabajos.encolar_trabajo('csv', {'anio': 2022})
+        self.assertFalse(creado)
+        self.assertEqual(segundo.pk, primero.pk)
+        self.assertTrue(trabajos.encolar_trabajo('csv', {'anio': 2023})[1])
+
+    def test_reanudar_huerfanos(self):
+        antiguo = timezone.now() - timedelta(seconds=trabajos.SEGUNDOS_LATIDO * (trabajos.LATIDOS_PERDIDOS + 1))
+        huerfano = TrabajoReporte.objects.create(
+            tipo='csv', parametros={}, huella='a' * 40, estado='en_proceso', latido=antiguo, progreso=50,
+        )
+        vivo = TrabajoReporte.objects.create(
+            tipo='csv', parametros={}, huella='b' * 40, estado='en_proceso', latido=timezone.now(),
+        )
+        pendiente = TrabajoReporte.objects.create(tipo='csv', parametros={}, huella='c' * 40)
+
+        with mock.patch.object(trabajos, '_pool') as pool:
+            self.assertEqual(trabajos.reanudar_trabajos(), 2)
+        encolados = {llamada.args[1] for llamada in pool.return_value.submit.call_args_list}
+        self.assertEqual(encolados, {huerfano.pk, pendiente.pk})
+        huerfano.refresh_from_db()
+        self.assertEqual((huerfano.estado, huerfano.progreso, huerfano.latido), ('pendiente', 0, None))
+        vivo.refresh_from_db()
+        self.assertEqual(vivo.estado, 'en_proceso')
+
+    def test_ejecutar(self):
+        def generar(parametros, progreso):
+            progreso(50)
+            self.assertEqual(TrabajoReporte.objects.get().progreso, 50)
+            return 'reporte.csv', b'contenido'
+
+        trabajo = self.ejecutar(generar)
+        self.assertEqual((trabajo.estado, trabajo.progreso), ('completado', 100))
+        respuesta = self.client.get(f'/api/trabajos/{trabajo.pk}/descargar/')
+        self.assertEqual(b''.join(respuesta.streaming_content), b'contenido')
+        respuesta.close()
+
+    def test_terminado_fuera_de_tiempo(self):
+        # Mientras genera, el trabajo se da por agotado: el hilo no lo marca como completado
+        def generar(parametros, progreso):
+            TrabajoReporte.objects.update(estado='error', mensaje='Tiempo de espera agotado')
+            progreso(50)
+            return 'reporte.csv', b'contenido'
+
+        trabajo = self.ejecutar(generar)
+        self.assertEqual((trabajo.estado, trabajo.mensaje, trabajo.progreso), ('error', 'Tiempo de espera agotado', 0))
+        self.assertEqual(list(self.media.rglob('*.csv')), [])
+
+    def test_archivo_borrado(self):
+        trabajo = self.ejecutar(lambda parametros, progreso: ('reporte.csv', b'contenido'))
+        trabajo.archivo.delete(save=False)
+        respuesta = self.client.get(f'/api/trabajos/{trabajo.pk}/descargar/')
+        self.assertEqual(respuesta.status_code, 410)
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.signals import request_started
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+from .models import TrabajoReporte
+from .cache_api import obtener_version
+from .reportes import datos_reporte, reporte_csv, obtener_reporte_pdf
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_ACTIVOS = ('pendiente', 'en_proceso')
+
+# Cada cuántos segundos se marcan los trabajos que corren en el proceso; un trabajo
+# en proceso sin latido en LATIDOS_PERDIDOS intervalos quedó huérfano (proceso reiniciado)
+SEGUNDOS_LATIDO = 30
+LATIDOS_PERDIDOS = 3
+
+_executor = None
+_lock = threading.Lock()
+# Trabajos que corren en los hilos de este proceso
+_en_curso = set()
+
+
+def _generar_csv(parametros, progreso):
+    """Reporte comparativo en CSV"""
+    datos = datos_reporte(**parametros)
+    progreso(80)
+    return f"reporte_{datos['periodo']}.csv", reporte_csv(datos)
+
+
+def _generar_pdf(parametros, progreso):
+    """Reporte comparativo en PDF, reutilizando el archivo en caché si existe"""
+    return obtener_reporte_pdf(parametros, progreso)
+
+
+# Tipo de trabajo -> función(parametros, progreso) que devuelve (nombre_archivo, contenido),
+# o el nombre de un archivo ya guardado en MEDIA_ROOT
+TIPOS_TRABAJO = {
+    'csv': _generar_csv,
+    'pdf': _generar_pdf,
+}
+
+
+def _pool():
+    """Pool de hilos del proceso; se crea con el primer trabajo junto con el hilo de latidos"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.TRABAJOS_MAX_WORKERS,
+                thread_name_prefix='trabajos',
+            )
+            threading.Thread(target=_latir, name='trabajos-latido', daemon=True).start()
+    return _executor
+
+
+def _latir():
+    """Actualiza periódicamente el latido de los trabajos que corren en este proceso"""
+    while True:
+        time.sleep(SEGUNDOS_LATIDO)
+        with _lock:
+            ids = list(_en_curso)
+        if not ids:
+            continue
+        try:
+            TrabajoReporte.objects.filter(pk__in=ids, estado='en_proceso').update(latido=timezone.now())
+        except Exception:
+            logger.exception('No se pudo actualizar el latido de los trabajos')
+        finally:
+            connections.close_all()
+
+
+def reanudar_trabajos():
+    """Vuelve a encolar los trabajos que quedaron sin terminar (p. ej. por un reinicio del servidor)
+
+    Los trabajos en proceso sin latido reciente vuelven a pendiente, y todos los
+    pendientes se envían al pool; si otro proceso ya tiene uno en su cola, solo
+    lo ejecuta el primero que lo toma (ver ejecutar_trabajo). Devuelve cuántos
+    trabajos se encolaron.
+    """
+    limite = timezone.now() - timedelta(seconds=SEGUNDOS_LATIDO * LATIDOS_PERDIDOS)
+    huerfanos = TrabajoReporte.objects.filter(
+        Q(latido__lt=limite) | Q(latido__isnull=True), estado='en_proceso',
+    ).update(
+        estado='pendiente', progreso=0, fecha_inicio=None, latido=None,
+    )
+    if huerfanos:
+        logger.warning('Se vuelven a encolar %d trabajos interrumpidos', huerfanos)
+    
+    pendientes = list(TrabajoReporte.objects.filter(estado='pendiente').values_list('pk', flat=True))
+    for trabajo_id in pendientes:
+        _pool().submit(ejecutar_trabajo, trabajo_id)
+    return len(pendientes)
+
+
+def reanudar_al_iniciar(sender, **kwargs):
+    """Receptor de request_started: reanuda los trabajos con la primera petición del proceso"""
+    request_started.disconnect(reanudar_al_iniciar, dispatch_uid='reanudar_trabajos')
+    try:
+        reanudar_trabajos()
+    except Exception:
+        logger.exception('No se pudieron reanudar los trabajos pendientes')
+
+
+def huella_trabajo(tipo, parametros):
+    """Hash de tipo, parámetros y versión de datos: dos pedidos iguales comparten trabajo"""
+    contenido = json.dumps([tipo, parametros, obtener_version()], sort_keys=True)
+    return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+
+
+def encolar_trabajo(tipo, parametros):
+    """Encola un trabajo o devuelve uno idéntico pendiente, en proceso o ya completado
+
+    Devuelve (trabajo, creado).
+    """
+    huella = huella_trabajo(tipo, parametros)
+    ahora = timezone.now()
+    
+    # Trabajos que superaron el tiempo máximo de ejecución
+    TrabajoReporte.objects.filter(
+        estado='en_proceso',
+        fecha_inicio__lt=ahora - timedelta(seconds=settings.TRABAJOS_TIMEOUT),
+    ).update(estado='error', mensaje='Tiempo de espera agotado', fecha_fin=ahora)
+    
+    existente = TrabajoReporte.objects.filter(huella=huella).exclude(estado='error').first()
+    if existente and (existente.estado in ESTADOS_ACTIVOS or existente.archivo.storage.exists(existente.archivo.name)):
+        return existente, False
+    
+    # La restricción trabajo_activo_unico impide dos trabajos activos con la misma huella
+    try:
+        with transaction.atomic():
+            trabajo = TrabajoReporte.objects.create(tipo=tipo, parametros=parametros, huella=huella)
+    except IntegrityError:
+        existente = TrabajoReporte.objects.filter(huella=huella).exclude(estado='error').first()
+        if existente is None:
+            raise
+        return existente, False
+    
+    transaction.on_commit(lambda: _pool().submit(ejecutar_trabajo, trabajo.pk))
+    return trabajo, True
+
+
+def ejecutar_trabajo(trabajo_id):
+    """Ejecuta un trabajo en un hilo del pool y guarda el archivo resultante en MEDIA_ROOT"""
+    close_old_connections()
+    trabajos = TrabajoReporte.objects.filter(pk=trabajo_id)
+    try:
+        # Solo lo ejecuta el primer hilo (de cualquier proceso) que lo toma
+        ahora = timezone.now()
+        if not trabajos.filter(estado='pendiente').update(
+            estado='en_proceso', fecha_inicio=ahora, latido=ahora, progreso=0,
+        ):
+            return
+        with _lock:
+            _en_curso.add(trabajo_id)
+        trabajo = trabajos.get()
+        # Si entretanto se dio por agotado o se volvió a encolar, este hilo ya no lo actualiza
+        en_proceso = trabajos.filter(estado='en_proceso')
+
+        def progreso(valor):
+            en_proceso.update(progreso=valor)
+        
+        resultado = TIPOS_TRABAJO[trabajo.tipo](trabajo.parametros, progreso)
+        if isinstance(resultado, str):
+            trabajo.archivo.name = resultado
+        else:
+            nombre, contenido = resultado
+            trabajo.archivo.save(nombre, ContentFile(contenido), save=False)
+        if not en_proceso.update(
+            estado='completado',
+            progreso=100,
+            archivo=trabajo.archivo.name,
+            fecha_fin=timezone.now(),
+        ):
+            logger.warning('El trabajo %s terminó después de dejar de estar en proceso', trabajo_id)
+            if not isinstance(resultado, str):
+                # Los PDF en caché los comparten otros trabajos; el archivo propio se descarta
+                trabajo.archivo.delete(save=False)
+    except Exception as error:
+        logger.exception('Error en el trabajo %s', trabajo_id)
+        trabajos.filter(estado='en_proceso').update(estado='error', mensaje=str(error), fecha_fin=timezone.now())
+    finally:
+        with _lock:
+            _en_curso.discard(trabajo_id)
+        connections.close_all()
+
+
+def estado_trabajo(trabajo):
+    """Representación JSON del estado de un trabajo"""
+    data = {
+        'id': trabajo.pk,
+        'tipo': trabajo.tipo,
+        'estado': trabajo.estado,
+        'progreso': trabajo.progreso,
+        'mensaje': trabajo.mensaje,
+        'fecha_creacion': trabajo.fecha_creacion.isoformat(),
+        'url_estado': reverse('api_estado_trabajo', args=[trabajo.pk]),
+    }
+    if trabajo.estado == 'completado':
+        data['url_descarga'] = reverse('api_descargar_trabajo', args=[trabajo.pk])
+    return data
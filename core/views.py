@@ -1,35 +1,50 @@
 from django.shortcuts import render
 from django.db.models import Count, Q, Avg
-from django.http import JsonResponse
+from django.http import FileResponse, HttpRequest, HttpResponse, JsonResponse, QueryDict, StreamingHttpResponse
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.cache import patch_cache_control
+from django.views.decorators.gzip import gzip_page
 from django.db.models import Sum
 from datetime import datetime
 import calendar
-from .models import Caso, TipoZoonosis, Departamento, Provincia, Distrito
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication
+from rest_framework.decorators import api_view, authentication_classes, parser_classes, permission_classes
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import BasePermission, IsAuthenticated
+from rest_framework.response import Response
+from .models import Caso, CuboCasos, IncidenciaAnual, GeometriaLimite, CanalEndemico, Alerta, TrabajoReporte, TipoZoonosis, Departamento, Provincia, Distrito, Paciente
+from .epidemiologia import MESES_NOMBRES, GRUPOS_ETARIOS, mes_de_semana
+from .cache_api import cache_api, cache_control_versionadas, respuesta_condicional, obtener_version
+from .agregados import obtener_metadatos
+from .columnar import COLUMNAS, obtener_snapshot
+from .canal_endemico import CAMPOS_NIVEL, CODIGO_NACIONAL
+from .reportes import datos_reporte
+from .trabajos import TIPOS_TRABAJO, encolar_trabajo, estado_trabajo
+from .cargas import LoteInvalido, LoteRepetido, cargar_lote
+from .exportacion import CONJUNTOS_EXPORTACION, iterar_filas, generar_csv, generar_xlsx, comprimir_gzip
 import json
+import logging
+import os
 
-def home(view):
+logger = logging.getLogger(__name__)
+
+def home(request):
     """Vista principal - Dashboard"""
     return render(request, 'core/home.html')
 
 def dashboard_tendencias(request):
     """Vista del dashboard de tendencias históricas"""
-    # Obtener lista de zoonosis para el filtro
-    zoonosis_list = TipoZoonosis.objects.all().order_by('nombre')
-    
-    # Obtener años disponibles
-    anos_queryset = Caso.objects.values_list('anio', flat=True).distinct().order_by('anio')
-    anos = list(anos_queryset)  # Convertir a lista
-    
-    # Debug - imprimir en consola
-    print(f"Zoonosis encontradas: {zoonosis_list.count()}")
-    print(f"Años disponibles: {anos}")
+    metadatos = obtener_metadatos()
     
     context = {
-        'zoonosis_list': zoonosis_list,
-        'anos': anos,
+        'zoonosis_list': metadatos['zoonosis'],
+        'anos': metadatos['anos'],
     }
     return render(request, 'core/dashboard_tendencias.html', context)
 
+@respuesta_condicional
+@cache_api
 def api_tendencias(request):
     """API para obtener datos de tendencias"""
     zoonosis_id = request.GET.get('zoonosis_id')
@@ -40,16 +55,21 @@ def api_tendencias(request):
     if not all([zoonosis_id, anio_inicio, anio_fin]):
         return JsonResponse({'error': 'Parámetros incompletos'}, status=400)
     
-    # Consultar casos
-    casos = Caso.objects.filter(
+    try:
+        zoonosis_id, anio_inicio, anio_fin = int(zoonosis_id), int(anio_inicio), int(anio_fin)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros no válidos'}, status=400)
+    
+    # Consultar el cubo de casos
+    celdas = CuboCasos.objects.filter(
         zoonosis_id=zoonosis_id,
         anio__gte=anio_inicio,
         anio__lte=anio_fin
     )
     
     # Agrupar por año
-    datos_por_anio = casos.values('anio').annotate(
-        total_casos=Count('id')
+    datos_por_anio = celdas.values('anio').annotate(
+        total_casos=Sum('total')
     ).order_by('anio')
     
     # Preparar datos para el gráfico
@@ -91,17 +111,21 @@ def api_tendencias(request):
 
 def dashboard_mapas(request):
     """Vista del dashboard de mapas de calor"""
-    zoonosis_list = TipoZoonosis.objects.all().order_by('nombre')
-    anos = Caso.objects.values_list('anio', flat=True).distinct().order_by('anio')
+    metadatos = obtener_metadatos()
     
     context = {
-        'zoonosis_list': zoonosis_list,
-        'anos': list(anos),
+        'zoonosis_list': metadatos['zoonosis'],
+        'anos': metadatos['anos'],
+        'version_datos': obtener_version(),
+        'tiles_url': settings.MAPA_TILES_URL,
+        'tiles_atribucion': settings.MAPA_TILES_ATRIBUCION,
     }
     return render(request, 'core/dashboard_mapas.html', context)
 
+@respuesta_condicional
+@cache_api
 def api_mapa_calor(request):
-    """API para obtener datos del mapa de calor"""
+    """API para obtener datos del mapa de calor (casos totales o tasa por 100 000 habitantes)"""
     zoonosis_id = request.GET.get('zoonosis_id')
     anio = request.GET.get('anio')
     escala = request.GET.get('escala', 'total')  # total o percapita
@@ -109,26 +133,42 @@ def api_mapa_calor(request):
     if not all([zoonosis_id, anio]):
         return JsonResponse({'error': 'Parámetros incompletos'}, status=400)
     
-    # Consultar casos agrupados por departamento
-    casos_por_depto = Caso.objects.filter(
+    if escala not in ('total', 'percapita'):
+        return JsonResponse({'error': 'Escala no válida'}, status=400)
+    
+    # Casos y tasas precalculados por departamento (y total nacional)
+    filas = IncidenciaAnual.objects.filter(
         zoonosis_id=zoonosis_id,
-        anio=anio
-    ).values(
-        'distrito__provincia__departamento__nombre',
-        'distrito__provincia__departamento__id'
-    ).annotate(
-        total_casos=Count('id')
-    ).order_by('-total_casos')
+        anio=anio,
+        nivel__in=['nacional', 'departamento']
+    ).values('nivel', 'nombre', 'casos', 'poblacion', 'tasa_100k')
     
     # Preparar datos para el mapa
     departamentos_data = []
-    for item in casos_por_depto:
-        dept_nombre = item['distrito__provincia__departamento__nombre']
-        if dept_nombre:
-            departamentos_data.append({
-                'nombre': dept_nombre,
-                'casos': item['total_casos']
-            })
+    tasa_nacional = None
+    for item in filas:
+        if item['nivel'] == 'nacional':
+            tasa_nacional = item['tasa_100k']
+            continue
+        departamentos_data.append({
+            'nombre': item['nombre'],
+            'casos': item['casos'],
+            'poblacion': item['poblacion'],
+            'tasa': item['tasa_100k'],
+            'valor': item['casos'] if escala == 'total' else item['tasa_100k']
+        })
+    
+    if escala == 'total':
+        departamentos_data.sort(key=lambda d: -d['casos'])
+        umbrales = {'alto': 40, 'medio': 20}
+    else:
+        departamentos_data.sort(key=lambda d: (d['tasa'] is None, -(d['tasa'] or 0)))
+        # Terciles de las tasas conocidas
+        tasas = sorted(d['tasa'] for d in departamentos_data if d['tasa'])
+        umbrales = {
+            'alto': tasas[len(tasas) * 2 // 3] if tasas else 0,
+            'medio': tasas[len(tasas) // 3] if tasas else 0,
+        }
     
     # Calcular estadísticas
     total_nacional = sum(d['casos'] for d in departamentos_data)
@@ -139,49 +179,339 @@ def api_mapa_calor(request):
     top5 = departamentos_data[:5] if len(departamentos_data) >= 5 else departamentos_data
     
     data = {
+        'escala': escala,
         'departamentos': departamentos_data,
         'estadisticas': {
             'total_nacional': total_nacional,
             'departamentos_afectados': num_deptos,
             'promedio': round(promedio, 1),
+            'tasa_nacional': tasa_nacional,
+            'umbrales': umbrales,
             'top5': top5
         }
     }
     
     return JsonResponse(data)
 
+NIVELES_DETALLE = ('departamento', 'provincia', 'distrito')
+
+
+@gzip_page
+@respuesta_condicional
+@cache_api
+def api_mapa_detalle(request):
+    """API compacta para el mapa por departamento, provincia o distrito (claves por ubigeo)"""
+    zoonosis_id = request.GET.get('zoonosis_id')
+    anio = request.GET.get('anio')
+    nivel = request.GET.get('nivel', 'departamento')
+    padre = request.GET.get('padre', '')  # ubigeo de la unidad superior
+    escala = request.GET.get('escala', 'total')  # total o percapita
+    top = request.GET.get('top')
+    
+    if not all([zoonosis_id, anio]):
+        return JsonResponse({'error': 'Parámetros incompletos'}, status=400)
+    
+    try:
+        zoonosis_id, anio = int(zoonosis_id), int(anio)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros no válidos'}, status=400)
+    
+    if nivel not in NIVELES_DETALLE:
+        return JsonResponse({'error': 'Nivel no válido'}, status=400)
+    
+    if escala not in ('total', 'percapita'):
+        return JsonResponse({'error': 'Escala no válida'}, status=400)
+    
+    if top is not None:
+        if not top.isdigit() or int(top) == 0:
+            return JsonResponse({'error': 'El parámetro top debe ser un entero positivo'}, status=400)
+        top = int(top)
+    
+    filtros = {'zoonosis_id': zoonosis_id, 'anio': anio, 'nivel': nivel}
+    if padre:
+        filtros['codigo_padre'] = padre
+    
+    orden = '-casos' if escala == 'total' else '-tasa_100k'
+    filas = IncidenciaAnual.objects.filter(**filtros).order_by(orden, 'codigo_ubigeo').values_list(
+        'codigo_ubigeo', 'casos', 'tasa_100k', 'nombre'
+    )
+    
+    total_unidades = filas.count() if top else None
+    if top:
+        filas = filas[:top]
+    
+    datos = {codigo: [casos, tasa, nombre] for codigo, casos, tasa, nombre in filas}
+    
+    data = {
+        'nivel': nivel,
+        'padre': padre,
+        'escala': escala,
+        'campos': ['casos', 'tasa_100k', 'nombre'],
+        'datos': datos,
+        'unidades': total_unidades if top else len(datos),
+        'truncado': bool(top) and total_unidades > len(datos),
+    }
+    
+    return JsonResponse(data)
+
+@gzip_page
+@cache_control_versionadas(public=True, max_age=60 * 60 * 24 * 365)
+@cache_api
+def api_geometrias(request):
+    """API con los límites simplificados (GeoJSON) de un nivel y una resolución
+
+    Con la versión de datos en la URL (parámetro v) la respuesta puede
+    guardarse en el navegador por tiempo indefinido; sin ella se revalida.
+    """
+    nivel = request.GET.get('nivel', 'departamento')
+    resolucion = request.GET.get('resolucion', 'media')
+    padre = request.GET.get('padre', '')
+    
+    if nivel not in NIVELES_DETALLE:
+        return JsonResponse({'error': 'Nivel no válido'}, status=400)
+    
+    if resolucion not in dict(GeometriaLimite.RESOLUCION_CHOICES):
+        return JsonResponse({'error': 'Resolución no válida'}, status=400)
+    
+    geometrias = GeometriaLimite.objects.filter(nivel=nivel, resolucion=resolucion)
+    if padre:
+        geometrias = geometrias.filter(codigo_padre=padre)
+    
+    # Los features ya están serializados: se concatenan sin volver a parsearlos
+    features = geometrias.order_by('codigo_ubigeo').values_list('feature', flat=True)
+    contenido = '{"type":"FeatureCollection","features":[' + ','.join(features) + ']}'
+    
+    return HttpResponse(contenido, content_type='application/json')
+
+@respuesta_condicional
+@cache_api
+def api_canal_endemico(request):
+    """API con el canal endémico semanal de una zoonosis en una unidad geográfica"""
+    zoonosis_id = request.GET.get('zoonosis_id')
+    nivel = request.GET.get('nivel', 'nacional')
+    ubigeo = request.GET.get('ubigeo', CODIGO_NACIONAL if nivel == 'nacional' else '')
+    anio = request.GET.get('anio')
+    
+    if not zoonosis_id or not ubigeo:
+        return JsonResponse({'error': 'Parámetros incompletos'}, status=400)
+    
+    if nivel not in CAMPOS_NIVEL:
+        return JsonResponse({'error': 'Nivel no válido'}, status=400)
+    
+    try:
+        zoonosis_id = int(zoonosis_id)
+        anio = int(anio) if anio else None
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros no válidos'}, status=400)
+    
+    canales = CanalEndemico.objects.filter(zoonosis_id=zoonosis_id, nivel=nivel, codigo_ubigeo=ubigeo)
+    if anio is None:
+        anio = canales.order_by('-anio').values_list('anio', flat=True).first()
+        if anio is None:
+            return JsonResponse({'error': 'No hay canal endémico calculado para esta serie'}, status=404)
+    
+    campos = ['casos', 'percentil_25', 'mediana', 'percentil_75', 'media', 'limite_superior']
+    filas = list(canales.filter(anio=anio).order_by('semana_epidemiologica').values_list(
+        'semana_epidemiologica', 'anios_base', *campos
+    ))
+    if not filas:
+        return JsonResponse({'error': 'No hay canal endémico calculado para esta serie'}, status=404)
+    
+    columnas = list(zip(*filas))
+    data = {
+        'zoonosis_id': zoonosis_id,
+        'nivel': nivel,
+        'ubigeo': ubigeo,
+        'anio': anio,
+        'anios_base': columnas[1][0],
+        'semanas': list(columnas[0]),
+    }
+    data.update({campo: list(valores) for campo, valores in zip(campos, columnas[2:])})
+    
+    return JsonResponse(data)
+
+@respuesta_condicional
+@cache_api
+def api_alertas(request):
+    """API con las alertas de brotes más recientes (EARS y CUSUM por distrito)"""
+    zoonosis_id = request.GET.get('zoonosis_id')
+    departamento_id = request.GET.get('departamento_id')
+    metodo = request.GET.get('metodo')
+    anio = request.GET.get('anio')
+    limite = request.GET.get('limite', '50')
+    
+    if not limite.isdigit() or not 0 < int(limite) <= 500:
+        return JsonResponse({'error': 'El parámetro limite debe estar entre 1 y 500'}, status=400)
+    
+    if metodo and metodo not in dict(Alerta.METODO_CHOICES):
+        return JsonResponse({'error': 'Método no válido'}, status=400)
+    
+    try:
+        zoonosis_id = int(zoonosis_id) if zoonosis_id else None
+        departamento_id = int(departamento_id) if departamento_id else None
+        anio = int(anio) if anio else None
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros no válidos'}, status=400)
+    
+    alertas = Alerta.objects.all()
+    if zoonosis_id is not None:
+        alertas = alertas.filter(zoonosis_id=zoonosis_id)
+    if departamento_id is not None:
+        alertas = alertas.filter(distrito__provincia__departamento_id=departamento_id)
+    if metodo:
+        alertas = alertas.filter(metodo=metodo)
+    if anio is not None:
+        alertas = alertas.filter(anio=anio)
+    
+    filas = alertas.order_by('-anio', '-semana_epidemiologica', '-estadistico').values(
+        'anio', 'semana_epidemiologica', 'metodo', 'casos', 'esperado', 'estadistico', 'umbral',
+        'zoonosis__nombre', 'distrito__codigo_ubigeo', 'distrito__nombre',
+        'distrito__provincia__nombre', 'distrito__provincia__departamento__nombre',
+    )[:int(limite)]
+    
+    data = {
+        'alertas': [
+            {
+                'zoonosis': fila['zoonosis__nombre'],
+                'ubigeo': fila['distrito__codigo_ubigeo'],
+                'distrito': fila['distrito__nombre'],
+                'provincia': fila['distrito__provincia__nombre'],
+                'departamento': fila['distrito__provincia__departamento__nombre'],
+                'anio': fila['anio'],
+                'semana': fila['semana_epidemiologica'],
+                'metodo': fila['metodo'],
+                'casos': fila['casos'],
+                'esperado': fila['esperado'],
+                'estadistico': fila['estadistico'],
+                'umbral': fila['umbral'],
+            }
+            for fila in filas
+        ],
+    }
+    
+    return JsonResponse(data)
+
+@respuesta_condicional
+@cache_api
+def api_demografia(request):
+    """API con los casos por grupo etario y sexo (pirámide de edades)"""
+    zoonosis_id = request.GET.get('zoonosis_id')
+    anio_inicio = request.GET.get('anio_inicio')
+    anio_fin = request.GET.get('anio_fin')
+    departamento_id = request.GET.get('departamento_id')
+    
+    if not all([zoonosis_id, anio_inicio, anio_fin]):
+        return JsonResponse({'error': 'Parámetros incompletos'}, status=400)
+    
+    try:
+        zoonosis_id, anio_inicio, anio_fin = int(zoonosis_id), int(anio_inicio), int(anio_fin)
+        if departamento_id and departamento_id != 'nacional':
+            departamento_id = int(departamento_id)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros no válidos'}, status=400)
+    
+    casos = Caso.objects.filter(zoonosis_id=zoonosis_id, anio__gte=anio_inicio, anio__lte=anio_fin)
+    if departamento_id and departamento_id != 'nacional':
+        casos = casos.filter(departamento_id=departamento_id)
+    
+    # Columnas demográficas del propio caso: se resuelve con el índice, sin join con paciente
+    conteos = casos.values('grupo_etario', 'sexo').annotate(total=Count('id')).order_by()
+    
+    series = {sexo: [0] * len(GRUPOS_ETARIOS) for sexo, _ in Paciente.SEXO_CHOICES}
+    sin_dato = 0
+    for fila in conteos:
+        if fila['grupo_etario'] is None or fila['sexo'] not in series:
+            sin_dato += fila['total']
+        else:
+            series[fila['sexo']][fila['grupo_etario']] += fila['total']
+    
+    data = {
+        'grupos': GRUPOS_ETARIOS,
+        'series': [
+            {'sexo': sexo, 'nombre': nombre, 'casos': series[sexo]}
+            for sexo, nombre in Paciente.SEXO_CHOICES
+        ],
+        'sin_dato': sin_dato,
+        'total': sum(sum(casos_sexo) for casos_sexo in series.values()) + sin_dato,
+    }
+    
+    return JsonResponse(data)
+
 def dashboard_patrones(request):
     """Vista del dashboard de patrones estacionales"""
-    zoonosis_list = TipoZoonosis.objects.all().order_by('nombre')
-    anos = Caso.objects.values_list('anio', flat=True).distinct().order_by('anio')
-    departamentos = Departamento.objects.all().order_by('nombre')
+    metadatos = obtener_metadatos()
     
     context = {
-        'zoonosis_list': zoonosis_list,
-        'anos': list(anos),
-        'departamentos': departamentos,
+        'zoonosis_list': metadatos['zoonosis'],
+        'anos': metadatos['anos'],
+        'departamentos': metadatos['departamentos'],
     }
     return render(request, 'core/dashboard_patrones.html', context)
 
+# Colores de los datasets de patrones estacionales, por posición de la zoonosis
+COLORES_PATRONES = [
+    {'border': 'rgb(255, 99, 132)', 'bg': 'rgba(255, 99, 132, 0.2)'},
+    {'border': 'rgb(54, 162, 235)', 'bg': 'rgba(54, 162, 235, 0.2)'},
+    {'border': 'rgb(255, 206, 86)', 'bg': 'rgba(255, 206, 86, 0.2)'},
+    {'border': 'rgb(75, 192, 192)', 'bg': 'rgba(75, 192, 192, 0.2)'},
+    {'border': 'rgb(153, 102, 255)', 'bg': 'rgba(153, 102, 255, 0.2)'},
+]
+
+@respuesta_condicional
+@cache_api
 def api_patrones_estacionales(request):
-    """API para obtener patrones estacionales por mes con comparación entre zoonosis"""
+    """API para obtener patrones estacionales por mes (o semana) con comparación entre zoonosis"""
     zoonosis_ids = request.GET.getlist('zoonosis_ids[]')
     anio_inicio = request.GET.get('anio_inicio')
     anio_fin = request.GET.get('anio_fin')
     departamento_id = request.GET.get('departamento_id')
+    resolucion = request.GET.get('resolucion', 'mensual')  # mensual o semanal
     
     if not all([zoonosis_ids, anio_inicio, anio_fin]):
         return JsonResponse({'error': 'Parámetros incompletos'}, status=400)
     
+    if resolucion not in ('mensual', 'semanal'):
+        return JsonResponse({'error': 'Resolución no válida'}, status=400)
+    
+    try:
+        zoonosis_ids = list(dict.fromkeys(int(z) for z in zoonosis_ids))
+        anio_inicio, anio_fin = int(anio_inicio), int(anio_fin)
+        if departamento_id and departamento_id != 'nacional':
+            departamento_id = int(departamento_id)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros no válidos'}, status=400)
+    
+    # Nombres de las zoonosis solicitadas (una sola consulta)
+    zoonosis_por_id = TipoZoonosis.objects.in_bulk(zoonosis_ids)
+    if len(zoonosis_por_id) != len(zoonosis_ids):
+        return JsonResponse({'error': 'Zoonosis no encontrada'}, status=404)
+    
+    # Una sola consulta agrupada para todas las zoonosis
+    query = Q(zoonosis_id__in=zoonosis_ids, anio__gte=anio_inicio, anio__lte=anio_fin)
+    if departamento_id and departamento_id != 'nacional':
+        query &= Q(departamento_id=departamento_id)
+    
+    celdas = CuboCasos.objects.filter(query).values(
+        'zoonosis_id', 'anio', 'semana_epidemiologica'
+    ).annotate(total=Sum('total')).order_by()
+    
+    # Etiquetas del eje según la resolución
+    if resolucion == 'semanal':
+        etiquetas = [f'S{semana}' for semana in range(1, 54)]
+    else:
+        etiquetas = MESES_NOMBRES
+    
+    conteos = {zoonosis_id: [0] * len(etiquetas) for zoonosis_id in zoonosis_ids}
+    for celda in celdas:
+        if resolucion == 'semanal':
+            indice = min(max(celda['semana_epidemiologica'], 1), 53) - 1
+        else:
+            indice = mes_de_semana(celda['anio'], celda['semana_epidemiologica']) - 1
+        conteos[celda['zoonosis_id']][indice] += celda['total']
+    
     # Preparar datasets para cada zoonosis seleccionada
     datasets = []
-    colores = [
-        {'border': 'rgb(255, 99, 132)', 'bg': 'rgba(255, 99, 132, 0.2)'},
-        {'border': 'rgb(54, 162, 235)', 'bg': 'rgba(54, 162, 235, 0.2)'},
-        {'border': 'rgb(255, 206, 86)', 'bg': 'rgba(255, 206, 86, 0.2)'},
-        {'border': 'rgb(75, 192, 192)', 'bg': 'rgba(75, 192, 192, 0.2)'},
-        {'border': 'rgb(153, 102, 255)', 'bg': 'rgba(153, 102, 255, 0.2)'},
-    ]
+    colores = COLORES_PATRONES
     
     estadisticas_globales = {
         'total_general': 0,
@@ -189,70 +519,40 @@ def api_patrones_estacionales(request):
     }
     
     for idx, zoonosis_id in enumerate(zoonosis_ids):
-        # Construir consulta para esta zoonosis
-        query = Q(zoonosis_id=zoonosis_id, anio__gte=anio_inicio, anio__lte=anio_fin)
-        
-        if departamento_id and departamento_id != 'nacional':
-            query &= Q(distrito__provincia__departamento_id=departamento_id)
-        
-        casos = Caso.objects.filter(query)
-        
-        # Calcular casos por mes
-        meses_data = {}
-        for mes in range(1, 13):
-            semana_inicio = (mes - 1) * 4 + 1
-            semana_fin = mes * 4
-            
-            casos_mes = casos.filter(
-                semana_epidemiologica__gte=semana_inicio,
-                semana_epidemiologica__lte=semana_fin
-            ).count()
-            
-            meses_data[mes] = casos_mes
-        
-        casos_por_mes = [meses_data[i] for i in range(1, 13)]
-        total_casos = sum(casos_por_mes)
-        
-        # Obtener nombre de la zoonosis
-        zoonosis = TipoZoonosis.objects.get(id=zoonosis_id)
+        zoonosis = zoonosis_por_id[zoonosis_id]
+        casos_por_periodo = conteos[zoonosis_id]
+        total_casos = sum(casos_por_periodo)
         
         # Añadir dataset
         color = colores[idx % len(colores)]
         datasets.append({
             'label': zoonosis.nombre,
-            'data': casos_por_mes,
+            'data': casos_por_periodo,
             'borderColor': color['border'],
             'backgroundColor': color['bg'],
             'total': total_casos
         })
         
         # Estadísticas por zoonosis
-        if casos_por_mes:
-            mes_max_index = casos_por_mes.index(max(casos_por_mes))
-            mes_min_index = casos_por_mes.index(min(casos_por_mes))
-        else:
-            mes_max_index = 0
-            mes_min_index = 0
-        
-        meses_nombres = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+        max_index = casos_por_periodo.index(max(casos_por_periodo))
+        min_index = casos_por_periodo.index(min(casos_por_periodo))
         
         estadisticas_globales['zoonosis_data'].append({
             'nombre': zoonosis.nombre,
             'total': total_casos,
-            'promedio': round(total_casos / 12, 1),
-            'mes_max': meses_nombres[mes_max_index],
-            'casos_max': casos_por_mes[mes_max_index],
-            'mes_min': meses_nombres[mes_min_index],
-            'casos_min': casos_por_mes[mes_min_index]
+            'promedio': round(total_casos / len(etiquetas), 1),
+            'mes_max': etiquetas[max_index],
+            'casos_max': casos_por_periodo[max_index],
+            'mes_min': etiquetas[min_index],
+            'casos_min': casos_por_periodo[min_index]
         })
         
         estadisticas_globales['total_general'] += total_casos
     
-    # Meses del año
-    meses = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
-    
     data = {
-        'meses': meses,
+        'meses': MESES_NOMBRES,
+        'resolucion': resolucion,
+        'etiquetas': etiquetas,
         'datasets': datasets,
         'estadisticas': estadisticas_globales
     }
@@ -261,69 +561,343 @@ def api_patrones_estacionales(request):
 
 def dashboard_reportes(request):
     """Vista del generador de reportes"""
-    zoonosis_list = TipoZoonosis.objects.all().order_by('nombre')
-    anos = Caso.objects.values_list('anio', flat=True).distinct().order_by('anio')
-    departamentos = Departamento.objects.all().order_by('nombre')
+    metadatos = obtener_metadatos()
     
     context = {
-        'zoonosis_list': zoonosis_list,
-        'anos': list(anos),
-        'departamentos': departamentos,
+        'zoonosis_list': metadatos['zoonosis'],
+        'anos': metadatos['anos'],
+        'departamentos': metadatos['departamentos'],
     }
     return render(request, 'core/dashboard_reportes.html', context)
 
+@respuesta_condicional
+@cache_api
 def api_generar_reporte(request):
-    """API para generar vista previa de reporte"""
+    """API para generar vista previa de reporte (una o varias zoonosis)"""
     departamentos_ids = request.GET.getlist('departamentos[]')
-    zoonosis_id = request.GET.get('zoonosis_id')
+    zoonosis_ids = request.GET.getlist('zoonosis_ids[]') or request.GET.getlist('zoonosis_id')
     anio_inicio = request.GET.get('anio_inicio')
     anio_fin = request.GET.get('anio_fin')
     
-    if not all([departamentos_ids, zoonosis_id, anio_inicio, anio_fin]):
+    if not all([departamentos_ids, zoonosis_ids, anio_inicio, anio_fin]):
         return JsonResponse({'error': 'Parámetros incompletos'}, status=400)
     
-    # Obtener datos para cada departamento
-    datos_departamentos = []
+    try:
+        departamentos_ids = [int(d) for d in departamentos_ids]
+        zoonosis_ids = [int(z) for z in zoonosis_ids]
+        anio_inicio, anio_fin = int(anio_inicio), int(anio_fin)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros no válidos'}, status=400)
     
-    for dept_id in departamentos_ids:
-        casos = Caso.objects.filter(
-            zoonosis_id=zoonosis_id,
-            anio__gte=anio_inicio,
-            anio__lte=anio_fin,
-            distrito__provincia__departamento_id=dept_id
-        )
-        
-        total_casos = casos.count()
-        casos_por_anio = casos.values('anio').annotate(total=Count('id')).order_by('anio')
-        
-        num_anios = int(anio_fin) - int(anio_inicio) + 1
-        promedio_anual = total_casos / num_anios if num_anios > 0 else 0
-        
-        # Calcular tendencia
-        if len(casos_por_anio) >= 2:
-            primer_anio_casos = list(casos_por_anio)[0]['total']
-            ultimo_anio_casos = list(casos_por_anio)[-1]['total']
-            tendencia = ((ultimo_anio_casos - primer_anio_casos) / primer_anio_casos * 100) if primer_anio_casos > 0 else 0
-        else:
-            tendencia = 0
-        
-        departamento = Departamento.objects.get(id=dept_id)
-        
-        datos_departamentos.append({
-            'nombre': departamento.nombre,
-            'total_casos': total_casos,
-            'promedio_anual': round(promedio_anual, 1),
-            'tendencia': round(tendencia, 1),
-            'casos_por_anio': list(casos_por_anio)
-        })
+    try:
+        data = datos_reporte(departamentos_ids, zoonosis_ids, anio_inicio, anio_fin)
+    except (Departamento.DoesNotExist, TipoZoonosis.DoesNotExist) as error:
+        return JsonResponse({'error': str(error)}, status=404)
+    
+    return JsonResponse(data)
+
+
+@csrf_exempt
+def api_trabajos(request):
+    """API para encolar un reporte en segundo plano con los mismos parámetros de generar-reporte
+    
+    Si ya hay un trabajo idéntico (mismos parámetros y versión de datos) se devuelve ese.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
     
-    # Obtener nombre de zoonosis
-    zoonosis = TipoZoonosis.objects.get(id=zoonosis_id)
+    tipo = request.POST.get('tipo', 'csv')
+    departamentos_ids = request.POST.getlist('departamentos[]')
+    zoonosis_ids = request.POST.getlist('zoonosis_ids[]')
+    anio_inicio = request.POST.get('anio_inicio')
+    anio_fin = request.POST.get('anio_fin')
+    
+    if tipo not in TIPOS_TRABAJO:
+        return JsonResponse({'error': 'Tipo de trabajo no válido'}, status=400)
+    
+    if not all([departamentos_ids, zoonosis_ids, anio_inicio, anio_fin]):
+        return JsonResponse({'error': 'Parámetros incompletos'}, status=400)
+    
+    valores = departamentos_ids + zoonosis_ids + [anio_inicio, anio_fin]
+    if not all(valor.isdigit() for valor in valores):
+        return JsonResponse({'error': 'Parámetros no válidos'}, status=400)
+    
+    parametros = {
+        'departamentos_ids': sorted(set(int(d) for d in departamentos_ids)),
+        'zoonosis_ids': sorted(set(int(z) for z in zoonosis_ids)),
+        'anio_inicio': int(anio_inicio),
+        'anio_fin': int(anio_fin),
+    }
+    if tipo == 'pdf':
+        parametros['incluir_graficos'] = request.POST.get('incluir_graficos', '1') == '1'
+        parametros['incluir_tablas'] = request.POST.get('incluir_tablas', '1') == '1'
+    trabajo, creado = encolar_trabajo(tipo, parametros)
+    
+    return JsonResponse(estado_trabajo(trabajo), status=202 if creado else 200)
+
+def api_estado_trabajo(request, trabajo_id):
+    """API para consultar el progreso de un trabajo"""
+    try:
+        trabajo = TrabajoReporte.objects.get(pk=trabajo_id)
+    except TrabajoReporte.DoesNotExist:
+        return JsonResponse({'error': 'Trabajo no encontrado'}, status=404)
+    
+    return JsonResponse(estado_trabajo(trabajo))
+
+def api_descargar_trabajo(request, trabajo_id):
+    """Descarga el archivo generado por un trabajo completado"""
+    try:
+        trabajo = TrabajoReporte.objects.get(pk=trabajo_id)
+    except TrabajoReporte.DoesNotExist:
+        return JsonResponse({'error': 'Trabajo no encontrado'}, status=404)
+    
+    if trabajo.estado != 'completado':
+        return JsonResponse({'error': 'El trabajo aún no está completado', **estado_trabajo(trabajo)}, status=409)
+    
+    try:
+        archivo = trabajo.archivo.open('rb')
+    except (OSError, ValueError):
+        return JsonResponse({'error': 'El archivo del trabajo ya no está disponible, vuelva a solicitarlo'}, status=410)
+    
+    return FileResponse(archivo, as_attachment=True, filename=os.path.basename(trabajo.archivo.name))
+
+
+class PuedeCargarCasos(BasePermission):
+    """Usuarios con permiso para agregar casos (core.add_caso)"""
+
+    def has_permission(self, request, view):
+        return request.user.has_perm('core.add_caso')
+
+
+@api_view(['POST'])
+@authentication_classes([BasicAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated, PuedeCargarCasos])
+@parser_classes([MultiPartParser])
+def api_cargar_semana(request):
+    """API para subir el lote semanal de notificaciones de una DIRESA (campo 'archivo', CSV de MINSA)
+
+    El lote se valida completo y se agrega en una transacción; solo se
+    actualizan las celdas del cubo afectadas y se invalida la caché de la API.
+    """
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return Response({'error': 'Falta el archivo'}, status=400)
+    
+    try:
+        resultado = cargar_lote(archivo, archivo.name, request.user)
+    except LoteRepetido as error:
+        return Response({'error': str(error), 'carga_id': error.carga.pk}, status=409)
+    except LoteInvalido as error:
+        return Response({'error': str(error), 'errores': error.errores}, status=400)
+    
+    return Response(resultado, status=201)
+
+
+def api_exportar(request, conjunto):
+    """API que exporta en flujo (CSV o XLSX) tendencias, datos del mapa de calor o casos individuales
+
+    La memoria usada no depende del número de filas. Con gzip=1 se comprime la
+    descarga y con desde=N se omiten las N primeras filas para reanudar una
+    descarga cortada en CSV, sin repetir la cabecera (un XLSX no se puede
+    concatenar, así que en ese formato desde no se admite).
+    """
+    formato = request.GET.get('formato', 'csv')
+    comprimir = request.GET.get('gzip') == '1'
+    desde = request.GET.get('desde', '0')
+    
+    if conjunto not in CONJUNTOS_EXPORTACION:
+        return JsonResponse({'error': 'Conjunto de datos no válido'}, status=404)
+    
+    if formato not in ('csv', 'xlsx'):
+        return JsonResponse({'error': 'Formato no válido'}, status=400)
+    
+    if not desde.isdigit():
+        return JsonResponse({'error': 'El parámetro desde debe ser un entero'}, status=400)
+    desde = int(desde)
+    
+    if desde and formato == 'xlsx':
+        return JsonResponse({'error': 'El parámetro desde solo se admite en formato csv'}, status=400)
+    
+    try:
+        columnas, filas = CONJUNTOS_EXPORTACION[conjunto](request.GET)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    
+    filas = iterar_filas(filas, desde)
+    if formato == 'csv':
+        fragmentos = generar_csv(columnas, filas, cabecera=not desde)
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        fragmentos = generar_xlsx(columnas, filas)
+        content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    
+    nombre = f'{conjunto}.{formato}'
+    if comprimir:
+        fragmentos = comprimir_gzip(fragmentos)
+        content_type = 'application/gzip'
+        nombre += '.gz'
+    
+    response = StreamingHttpResponse(fragmentos, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    response['X-Exportacion-Desde'] = str(desde)
+    return response
+
+
+# Parámetro GET -> columna del snapshot columnar
+FILTROS_CONSULTA = {
+    'zoonosis_ids[]': 'zoonosis',
+    'departamentos[]': 'departamento',
+    'ubigeos[]': 'ubigeo',
+    'sexo[]': 'sexo',
+    'grupos_etarios[]': 'grupo_etario',
+    'tipo_diagnostico[]': 'tipo_diagnostico',
+}
+
+RANGOS_CONSULTA = {
+    'anio': ('anio_inicio', 'anio_fin'),
+    'semana': ('semana_inicio', 'semana_fin'),
+}
+
+
+@respuesta_condicional
+@cache_api
+def api_consulta(request):
+    """API de conteos agrupados sobre cualquier combinación de filtros (snapshot columnar)"""
+    agrupar_por = request.GET.getlist('agrupar[]')
+    
+    invalidas = [columna for columna in agrupar_por if columna not in COLUMNAS]
+    if invalidas:
+        return JsonResponse({'error': f'Columnas no válidas: {", ".join(invalidas)}'}, status=400)
+    
+    snapshot = obtener_snapshot()
+    if snapshot is None:
+        return JsonResponse({'error': 'Snapshot columnar no disponible'}, status=503)
+    
+    filtros = {}
+    try:
+        for parametro, columna in FILTROS_CONSULTA.items():
+            valores = request.GET.getlist(parametro)
+            if valores:
+                filtros[columna] = valores
+        for columna, (param_inicio, param_fin) in RANGOS_CONSULTA.items():
+            inicio = request.GET.get(param_inicio)
+            fin = request.GET.get(param_fin)
+            if inicio or fin:
+                filtros[columna] = (int(inicio) if inicio else None, int(fin) if fin else None)
+        filas = snapshot.contar(agrupar_por, filtros)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros no válidos'}, status=400)
     
     data = {
-        'departamentos': datos_departamentos,
-        'zoonosis_nombre': zoonosis.nombre,
-        'periodo': f"{anio_inicio}-{anio_fin}"
+        'columnas': agrupar_por + ['casos'],
+        'filas': filas,
+        'total': sum(fila[-1] for fila in filas),
+        'generado': snapshot.meta['generado'],
+    }
+    
+    return JsonResponse(data)
+
+
+# Vistas disponibles como subconsultas del endpoint por lotes
+APIS_LOTE = {
+    'tendencias': api_tendencias,
+    'mapa_calor': api_mapa_calor,
+    'mapa_detalle': api_mapa_detalle,
+    'canal_endemico': api_canal_endemico,
+    'alertas': api_alertas,
+    'demografia': api_demografia,
+    'patrones_estacionales': api_patrones_estacionales,
+    'generar_reporte': api_generar_reporte,
+    'consulta': api_consulta,
+}
+
+
+def subpeticion(request, parametros):
+    """Petición GET interna con los parámetros de una subconsulta"""
+    peticion = HttpRequest()
+    peticion.method = 'GET'
+    peticion.path = request.path
+    peticion.META = {
+        clave: valor for clave, valor in request.META.items()
+        if not clave.startswith('HTTP_IF_') and clave != 'HTTP_ACCEPT_ENCODING'
     }
+    peticion.GET = QueryDict(mutable=True)
+    for clave, valor in parametros.items():
+        valores = valor if isinstance(valor, list) else [valor]
+        peticion.GET.setlist(clave, [str(v) for v in valores])
+    return peticion
+
+
+def resultado_subconsulta(vista, peticion):
+    """Estado y datos de una subconsulta del lote; si la vista falla solo se marca esa entrada"""
+    try:
+        respuesta = vista(peticion)
+        return {'estado': respuesta.status_code, 'datos': json.loads(respuesta.content)}
+    except Exception:
+        logger.exception('Error en la subconsulta %s de /api/lote/', vista.__name__)
+        return {'estado': 500, 'datos': {'error': 'Error interno'}}
+
+
+def respuesta_lote(resultados):
+    """Respuesta de /api/lote/; si alguna subconsulta falló no se guarda en ninguna caché"""
+    respuesta = JsonResponse({'resultados': resultados})
+    if any(resultado['estado'] >= 500 for resultado in resultados.values()):
+        patch_cache_control(respuesta, no_store=True)
+    return respuesta
+
+
+def leer_lote(request):
+    """Lee y valida el lote de /api/lote/; devuelve (comunes, consultas) o un JsonResponse de error"""
+    try:
+        if request.method == 'POST':
+            lote = json.loads(request.body or b'{}')
+        elif request.method == 'GET':
+            lote = json.loads(request.GET.get('lote', '{}'))
+        else:
+            return JsonResponse({'error': 'Método no permitido'}, status=405)
+    except ValueError:
+        return JsonResponse({'error': 'JSON no válido'}, status=400)
+    
+    consultas = lote.get('consultas') if isinstance(lote, dict) else None
+    comunes = lote.get('comunes', {}) if isinstance(lote, dict) else {}
+    if not consultas or not isinstance(consultas, dict) or not isinstance(comunes, dict):
+        return JsonResponse({'error': 'Parámetros incompletos'}, status=400)
+    
+    if len(consultas) > settings.API_LOTE_MAX_CONSULTAS:
+        return JsonResponse({'error': f'Máximo {settings.API_LOTE_MAX_CONSULTAS} consultas por lote'}, status=400)
+    
+    return comunes, consultas
+
+
+@csrf_exempt
+@respuesta_condicional
+@cache_api
+def api_lote(request):
+    """API que ejecuta varias subconsultas de las APIs y devuelve todos los resultados juntos
+
+    Recibe (en el cuerpo POST o en el parámetro GET 'lote') un JSON como:
+    {"comunes": {"zoonosis_id": 3},
+     "consultas": {"actual": {"api": "mapa_calor", "params": {"anio": 2022}},
+                   "anterior": {"api": "mapa_calor", "params": {"anio": 2021}}}}
+    Los parámetros comunes se aplican a todas las subconsultas.
+    """
+    lote = leer_lote(request)
+    if isinstance(lote, JsonResponse):
+        return lote
+    comunes, consultas = lote
+    
+    resultados = {}
+    for nombre, consulta in consultas.items():
+        vista = APIS_LOTE.get(consulta.get('api')) if isinstance(consulta, dict) else None
+        if vista is None:
+            resultados[nombre] = {'estado': 400, 'datos': {'error': 'API no válida'}}
+            continue
+        
+        params = consulta.get('params') or {}
+        if not isinstance(params, dict):
+            resultados[nombre] = {'estado': 400, 'datos': {'error': 'Parámetros no válidos'}}
+            continue
+        
+        resultados[nombre] = resultado_subconsulta(vista, subpeticion(request, {**comunes, **params}))
     
-    return JsonResponse(data)
\ No newline at end of file
+    return respuesta_lote(resultados)
@@ -0,0 +1,165 @@
+"""Versiones async de las APIs para desplegar con ASGI (se activan con API_ASYNC)
+
+Las consultas sync se ejecutan en un pool de hilos acotado propio y no con
+sync_to_async, que las serializa en un único hilo: así las consultas
+independientes de una misma petición (subconsultas de un lote) corren a la vez
+sin bloquear el event loop. Las APIs que resuelven todo con una consulta
+agrupada no se dividen: se ejecuta la vista sync completa en el pool.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from . import views
+from .cache_api import (
+    cache, clave_respuesta, huella_parametros, obtener_estado_version, sin_cache, version_peticion,
+)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _pool():
+    """Pool de hilos de la API; se crea con la primera petición"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.API_ASYNC_MAX_HILOS,
+                thread_name_prefix='api',
+            )
+    return _executor
+
+
+def _en_hilo(funcion, args, kwargs):
+    try:
+        return funcion(*args, **kwargs)
+    finally:
+        # Cada hilo del pool tiene su propia conexión; se cierra si ya no sirve (CONN_MAX_AGE)
+        close_old_connections()
+
+
+async def ejecutar(funcion, *args, **kwargs):
+    """Ejecuta una función sync en el pool de la API sin bloquear el event loop"""
+    loop = asyncio.get_running_loop()
+    # Se copia el contexto para que el hilo vea las marcas de la petición (p. ej. lectura_middleware)
+    contexto = contextvars.copy_context()
+    return await loop.run_in_executor(_pool(), contexto.run, _en_hilo, funcion, args, kwargs)
+
+
+async def en_paralelo(tareas):
+    """Ejecuta a la vez varias tareas (funcion, *args) y devuelve sus resultados en orden"""
+    return await asyncio.gather(*(ejecutar(*tarea) for tarea in tareas))
+
+
+def version_async(vista):
+    """Vista async que ejecuta una vista sync completa (con su caché y ETag) en el pool"""
+    @wraps(vista)
+    async def envoltura(request, *args, **kwargs):
+        return await ejecutar(vista, request, *args, **kwargs)
+    
+    return envoltura
+
+
+def cache_async(vista):
+    """Equivalente async de respuesta_condicional y cache_api juntos
+
+    Usa el mismo ETag y la misma clave de caché que la vista sync del mismo
+    nombre, así que ambas versiones comparten las respuestas guardadas.
+    """
+    nombre_vista = vista.__name__
+
+    def buscar(request):
+        estado = obtener_estado_version()
+        version = version_peticion(request.GET, estado)
+        clave = clave_respuesta(nombre_vista, request.GET, version)
+        return estado, version, clave, cache().get(clave)
+
+    @wraps(vista)
+    async def envoltura(request, *args, **kwargs):
+        if request.method != 'GET':
+            respuesta = await vista(request, *args, **kwargs)
+            patch_cache_control(respuesta, no_cache=True)
+            return respuesta
+        
+        estado, version, clave, guardada = await ejecutar(buscar, request)
+        etag = quote_etag(f"{nombre_vista}-v{version}-{huella_parametros(request.GET)[:20]}")
+        ultima_modificacion = int(estado['fecha'].timestamp()) if estado['fecha'] else None
+        
+        respuesta = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+        if respuesta is None:
+            if guardada is not None:
+                contenido, content_type = guardada
+                respuesta = HttpResponse(contenido, content_type=content_type)
+                respuesta['X-Cache'] = 'HIT'
+            else:
+                respuesta = await vista(request, *args, **kwargs)
+                if respuesta.status_code == 200 and not sin_cache(respuesta):
+                    await ejecutar(cache().set, clave, (respuesta.content, respuesta['Content-Type']))
+                    respuesta['X-Cache'] = 'MISS'
+        
+        if respuesta.status_code in (200, 304):
+            respuesta.headers.setdefault('ETag', etag)
+            if ultima_modificacion:
+                respuesta.headers.setdefault('Last-Modified', http_date(ultima_modificacion))
+        
+        # El navegador puede guardar la respuesta, pero debe revalidarla
+        patch_cache_control(respuesta, no_cache=True)
+        return respuesta
+    
+    return envoltura
+
+
+# APIs de una sola consulta (agrupada): basta con sacarlas del event loop
+api_tendencias = version_async(views.api_tendencias)
+api_mapa_calor = version_async(views.api_mapa_calor)
+api_mapa_detalle = version_async(views.api_mapa_detalle)
+api_geometrias = version_async(views.api_geometrias)
+api_canal_endemico = version_async(views.api_canal_endemico)
+api_alertas = version_async(views.api_alertas)
+api_demografia = version_async(views.api_demografia)
+api_consulta = version_async(views.api_consulta)
+api_patrones_estacionales = version_async(views.api_patrones_estacionales)
+api_generar_reporte = version_async(views.api_generar_reporte)
+
+
+@cache_async
+async def api_lote(request):
+    """API de lote con las subconsultas ejecutadas a la vez en el pool"""
+    lote = views.leer_lote(request)
+    if isinstance(lote, JsonResponse):
+        return lote
+    comunes, consultas = lote
+    
+    resultados = {}
+    pendientes = []
+    for nombre, consulta in consultas.items():
+        vista = views.APIS_LOTE.get(consulta.get('api')) if isinstance(consulta, dict) else None
+        if vista is None:
+            resultados[nombre] = {'estado': 400, 'datos': {'error': 'API no válida'}}
+            continue
+        
+        params = consulta.get('params') or {}
+        if not isinstance(params, dict):
+            resultados[nombre] = {'estado': 400, 'datos': {'error': 'Parámetros no válidos'}}
+            continue
+        
+        # Se reserva la posición para mantener el orden del lote en la respuesta
+        resultados[nombre] = None
+        peticion = views.subpeticion(request, {**comunes, **params})
+        pendientes.append((nombre, (views.resultado_subconsulta, vista, peticion)))
+    
+    for (nombre, _), resultado in zip(pendientes, await en_paralelo(tarea for _, tarea in pendientes)):
+        resultados[nombre] = resultado
+    
+    return views.respuesta_lote(resultados)
+
+
+# csrf_exempt de Django 4.2 no admite vistas async; se marca la vista directamente
+api_lote.csrf_exempt = True